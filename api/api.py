@@ -1,11 +1,40 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from worker.worker import IBWorker
+from worker.risk import RiskRejected
+from worker.order_groups import OrderGroup
+from worker.metrics import trace_id
+from worker.greeks import DEFAULT_RATE
 import threading
-from fastapi.concurrency import run_in_threadpool
-app = FastAPI()
+import json
+import time
+
+# IBWorker маршрутов: ставит create_app или старт приложения.
+# Импорт модуля ничего не создаёт и к TWS не подключается.
+worker = None
+
+
+def create_worker():
+    """
+    IBWorker API по умолчанию: журнал и хранилище контрактов в data/.
+    """
+    return IBWorker(journal_dir="data/journal", contract_db_path="data/contracts.sqlite")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global worker
+    if worker is None:
+        worker = create_worker()
+        threading.Thread(target=worker.start, daemon=True).start()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -14,8 +43,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-worker = IBWorker()
-threading.Thread(target=lambda: worker.start(), daemon=True).start()
+
+def create_app(ib_worker=None):
+    """
+    app с маршрутами поверх ib_worker (уже запущенного, например на
+    заглушке IB). Без ib_worker воркер по умолчанию создаётся и
+    подключается при старте приложения (uvicorn api.api:app).
+    """
+    global worker
+    if ib_worker is not None:
+        worker = ib_worker
+    return app
+
+
+@app.middleware("http")
+async def timing(request: Request, call_next):
+    """
+    Время запроса по маршруту. Заголовок X-Trace-Id включает
+    структурированный лог (logger ibworker.trace) по всем вызовам
+    IBWorker и запросам в TWS этого запроса.
+    """
+    token = trace_id.set(request.headers.get("x-trace-id"))
+    t0 = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        trace_id.reset(token)
+    route = request.scope.get("route")
+    worker.metrics.observe("api_request_seconds", (getattr(route, "path", "unmatched"), request.method),
+                           time.perf_counter() - t0)
+    if request.headers.get("x-trace-id"):
+        response.headers["X-Trace-Id"] = request.headers["x-trace-id"]
+    return response
 
 
 class OrderRequest(BaseModel):
@@ -29,87 +88,517 @@ class OrderRequest(BaseModel):
     strike: Optional[float] = None
     right: Optional[str] = None
 
+class BulkOrderItem(OrderRequest):
+    action: str = "BUY"
+
+class BulkOrderRequest(BaseModel):
+    orders: List[BulkOrderItem]
+
+class BracketRequest(BaseModel):
+    symbol: str
+    qty: int
+    limit_price: float
+    stop_offset: float = 3.0
+    take_profit_offset: float = 5.0
+    offset_type: str = "abs"  # abs / pct / atr
+    atr_period: int = 14
+    is_option: bool = False
+    expiry: Optional[str] = None
+    strike: Optional[float] = None
+    right: Optional[str] = None
+
+class ComboLegRequest(BaseModel):
+    right: str = "C"
+    offset: int = 0  # страйков от ATM
+    ratio: int = 1
+    action: str = "BUY"
+
+class ComboRequest(BaseModel):
+    symbol: str
+    strategy: Optional[str] = None  # call_vertical / put_vertical / straddle / strangle
+    legs: Optional[List[ComboLegRequest]] = None  # вместо strategy
+    qty: int = 1
+    expiry: Optional[str] = None
+    width: int = 1
+    limit_price: Optional[float] = None  # None — net из котировок ног
+    price_mode: str = "mid"  # mid / natural
+    action: str = "BUY"
+
+class AlgoOrderRequest(BaseModel):
+    symbol: str
+    qty: int
+    algo: str = "twap"  # twap / vwap / iceberg
+    action: str = "BUY"
+    duration: float = 300.0  # секунд; для iceberg — предельное время, 0 — до исполнения
+    slices: int = 10
+    display_qty: Optional[int] = None  # видимая часть iceberg
+    price_mode: str = "passive"  # passive / mid / aggressive
+    limit_price: Optional[float] = None  # цена не хуже
+    is_option: bool = False
+    expiry: Optional[str] = None
+    strike: Optional[float] = None
+    right: Optional[str] = None
+
+class ChainGreeksRequest(BaseModel):
+    symbol: str
+    expiry: Optional[str] = None
+    right: Optional[str] = None  # C / P, по умолчанию обе стороны
+    strike_count: Optional[int] = None  # None — все страйки экспирации
+    rate: float = DEFAULT_RATE
+    dividend: float = 0.0
+    model: str = "bs"  # bs / black76
+
+class RiskLimitsRequest(BaseModel):
+    symbol: str
+    max_notional: Optional[float] = None
+    max_position: Optional[float] = None
+    max_qty: Optional[float] = None
+    price_band: Optional[float] = None
+
+class ReplayRequest(BaseModel):
+    day: Optional[str] = None  # YYYYMMDD, по умолчанию последний журнал
+    speed: Optional[float] = 1.0  # 0 / null — без пауз
+    start: Optional[float] = None  # секунды UTC
+    end: Optional[float] = None
+    kinds: Optional[List[str]] = None  # quote / new / open / status / fill / commission
+
 class AtmRequest(BaseModel):
     symbol: str
     right: str = "C"
     expiry: Optional[str] = None
 
+class AtmBatchRequest(BaseModel):
+    items: List[AtmRequest]
+
 @app.post("/get_atm_option")
-def get_atm_option(data: AtmRequest):
-    result = worker.get_atm_option(data.symbol, data.right, data.expiry)
+async def get_atm_option(data: AtmRequest):
+    result = await worker.get_atm_option_async(data.symbol, data.right, data.expiry)
     return result
 
-@app.post("/buy_order")
-def buy_order(data: OrderRequest):
-    trade = worker.place_order(
-        symbol=data.symbol,
-        qty=data.qty,
-        limit_price=data.limit_price,
-        trail_amount=data.trail_amount,
-        order_type=data.order_type,
-        is_option=data.is_option,
-        expiry=data.expiry,
-        strike=data.strike,
-        right=data.right,
-        action="BUY"
+@app.post("/get_atm_options")
+async def get_atm_options(data: AtmBatchRequest):
+    results = await worker.get_atm_options_async(
+        [(item.symbol, item.right, item.expiry) for item in data.items]
     )
+    return {"results": results}
+
+@app.post("/option_chain_greeks")
+async def option_chain_greeks(data: ChainGreeksRequest):
+    try:
+        return await worker.option_chain_greeks_async(
+            data.symbol, data.expiry, data.right, data.strike_count, data.rate, data.dividend, data.model
+        )
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+
+
+def _rejected(e: RiskRejected):
+    return {"status": "rejected", "rule": e.rule, "message": e.reason}
+
+
+def _placed(result):
+    """
+    Ответ на place_order: Trade, для трейла — OrderGroup (parent, trail).
+    orderId — тот же, что в /orders и DELETE /orders/{order_id}.
+    """
+    trade = result.parent if isinstance(result, OrderGroup) else result
+    return {
+        "status": "success",
+        "orderId": trade.order.orderId,
+        "permId": trade.order.permId,
+        "orderStatus": trade.orderStatus.status,
+    }
+
+
+@app.post("/buy_order")
+async def buy_order(data: OrderRequest):
+    try:
+        trade = await worker.place_order_async(
+            symbol=data.symbol,
+            qty=data.qty,
+            limit_price=data.limit_price,
+            trail_amount=data.trail_amount,
+            order_type=data.order_type,
+            is_option=data.is_option,
+            expiry=data.expiry,
+            strike=data.strike,
+            right=data.right,
+            action="BUY"
+        )
+    except RiskRejected as e:
+        return _rejected(e)
     if trade is None:
         return {"status": "error", "message": "IBKR not connected yet"}
+    if isinstance(trade, dict):
+        return {"status": "error", "message": trade["error"]}
 
-    # если это обычный ордер
-    order_id = getattr(trade, "orderId", None)  # для Order
-    return {"status": "success", "orderId": order_id}
+    return _placed(trade)
 
 
 @app.post("/sell_order")
-def sell_order(data: OrderRequest):
-    trade = worker.place_order(
-        symbol=data.symbol,
-        qty=data.qty,
-        limit_price=data.limit_price,
-        trail_amount=data.trail_amount,
-        order_type=data.order_type,
-        is_option=data.is_option,
-        expiry=data.expiry,
-        strike=data.strike,
-        right=data.right,
-        action="SELL"
-    )
+async def sell_order(data: OrderRequest):
+    try:
+        trade = await worker.place_order_async(
+            symbol=data.symbol,
+            qty=data.qty,
+            limit_price=data.limit_price,
+            trail_amount=data.trail_amount,
+            order_type=data.order_type,
+            is_option=data.is_option,
+            expiry=data.expiry,
+            strike=data.strike,
+            right=data.right,
+            action="SELL"
+        )
+    except RiskRejected as e:
+        return _rejected(e)
     if trade is None:
         return {"status": "error", "message": "IBKR not connected yet"}
+    if isinstance(trade, dict):
+        return {"status": "error", "message": trade["error"]}
+
+    return _placed(trade)
+
+
+@app.post("/orders/bulk")
+async def bulk_orders(data: BulkOrderRequest):
+    result = await worker.place_orders_bulk_async([item.dict() for item in data.orders])
+    if result is None:
+        return {"status": "error", "message": "IBKR not connected yet"}
+
+    return {"status": "success", **result}
 
-    order_id = getattr(trade, "orderId", None)
-    return {"status": "success", "orderId": order_id}
+
+@app.delete("/orders/{order_id}")
+async def cancel_order(order_id: int):
+    trade = await worker.cancel_order_async(order_id)
+    if trade is None:
+        return {"status": "error", "message": f"Open order {order_id} not found"}
+
+    return {"status": "success", "orderId": order_id, "orderStatus": trade.orderStatus.status}
 
 
 @app.post("/buy_trailing")
-def buy_trailing(data: OrderRequest):
-    result = worker.place_order(
-        symbol=data.symbol,
-        qty=data.qty,
-        limit_price=data.limit_price,
-        trail_amount=data.trail_amount,
-        order_type="Trail",
-        is_option=data.is_option,
-        expiry=data.expiry,
-        strike=data.strike,
-        right=data.right,
-        action="BUY"
-    )
+async def buy_trailing(data: OrderRequest):
+    try:
+        result = await worker.place_order_async(
+            symbol=data.symbol,
+            qty=data.qty,
+            limit_price=data.limit_price,
+            trail_amount=data.trail_amount,
+            order_type="Trail",
+            is_option=data.is_option,
+            expiry=data.expiry,
+            strike=data.strike,
+            right=data.right,
+            action="BUY"
+        )
+    except RiskRejected as e:
+        return _rejected(e)
     if result is None:
         return {"status": "error", "message": "IBKR not connected yet"}
+    if isinstance(result, dict):
+        return {"status": "error", "message": result["error"]}
 
     parent_trade, trail_trade = result
     return {
         "status": "success",
         "parentOrderId": parent_trade.order.orderId,
-        "trailOrderId": trail_trade.order.orderId
+        "trailOrderId": trail_trade.order.orderId,
+        "acked": result.acked,
+        "ackMs": result.ack_ms
     }
 
+async def _place_bracket(data: BracketRequest, action: str):
+    result = await worker.place_bracket_async(
+        symbol=data.symbol,
+        qty=data.qty,
+        limit_price=data.limit_price,
+        stop_offset=data.stop_offset,
+        take_profit_offset=data.take_profit_offset,
+        offset_type=data.offset_type,
+        atr_period=data.atr_period,
+        is_option=data.is_option,
+        expiry=data.expiry,
+        strike=data.strike,
+        right=data.right or "C",
+        action=action
+    )
+    if "rule" in result:
+        return {"status": "rejected", "rule": result["rule"], "message": result["error"]}
+    if "error" in result:
+        return {"status": "error", "message": result["error"]}
+    return {"status": "success", **result}
+
+@app.post("/buy_bracket")
+async def buy_bracket(data: BracketRequest):
+    return await _place_bracket(data, "BUY")
+
+@app.post("/sell_bracket")
+async def sell_bracket(data: BracketRequest):
+    return await _place_bracket(data, "SELL")
+
+@app.post("/combo_order")
+async def combo_order(data: ComboRequest):
+    try:
+        result = await worker.place_combo_async(
+            symbol=data.symbol,
+            strategy=data.strategy,
+            legs=[leg.dict() for leg in data.legs] if data.legs else None,
+            qty=data.qty,
+            expiry=data.expiry,
+            width=data.width,
+            limit_price=data.limit_price,
+            price_mode=data.price_mode,
+            action=data.action.upper()
+        )
+    except RiskRejected as e:
+        return _rejected(e)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    if "error" in result:
+        return {"status": "error", "message": result["error"]}
+    return {"status": "success", **result}
+
+@app.post("/algo_orders")
+async def start_algo_order(data: AlgoOrderRequest):
+    try:
+        result = await worker.start_algo_async(
+            symbol=data.symbol,
+            algo=data.algo,
+            qty=data.qty,
+            action=data.action,
+            duration=data.duration,
+            slices=data.slices,
+            display_qty=data.display_qty,
+            price_mode=data.price_mode,
+            limit_price=data.limit_price,
+            is_option=data.is_option,
+            expiry=data.expiry,
+            strike=data.strike,
+            right=data.right or "C"
+        )
+    except RiskRejected as e:
+        return _rejected(e)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    if "error" in result:
+        return {"status": "error", "message": result["error"]}
+    return {"status": "success", "job": result}
+
+
+@app.get("/algo_orders")
+async def get_algo_orders(active: Optional[bool] = None):
+    return {"jobs": await worker.get_algo_orders_async(active)}
+
+
+@app.get("/algo_orders/stream")
+async def algo_orders_stream(job_id: Optional[int] = None):
+    """
+    Server-Sent Events: snapshot задач, затем прогресс и проскальзывание
+    на каждое изменение.
+    """
+    async def events():
+        stream = worker.stream_algo_orders(job_id)
+        try:
+            async for event in stream:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            await stream.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/algo_orders/{job_id}")
+async def get_algo_order(job_id: int):
+    jobs = await worker.get_algo_orders_async()
+    job = next((j for j in jobs if j["id"] == job_id), None)
+    if job is None:
+        return JSONResponse({"status": "error", "message": f"Algo order {job_id} not found"}, status_code=404)
+    return job
+
+
+@app.delete("/algo_orders/{job_id}")
+async def cancel_algo_order(job_id: int):
+    job = await worker.cancel_algo_async(job_id)
+    if job is None:
+        return {"status": "error", "message": f"Algo order {job_id} not found"}
+
+    return {"status": "success", "job": job}
+
 @app.post("/get_net_liquidation")
-def get_net_liquidation():
-    value = worker.get_net_liquidation()
+async def get_net_liquidation(account: Optional[str] = None):
+    value = await worker.get_net_liquidation_async(account)
     print("Net Liquidation:", value)
     return {
         "netLiquidation": value
-    }
\ No newline at end of file
+    }
+
+@app.get("/contract_cache")
+async def contract_cache():
+    return worker.contract_cache_stats()
+
+
+@app.get("/market_data")
+async def market_data():
+    return worker.market_data_stats()
+
+
+@app.websocket("/ws/quotes/{symbol}")
+async def quotes_ws(websocket: WebSocket, symbol: str, max_rate: Optional[float] = None,
+                    expiry: Optional[str] = None, strike: Optional[float] = None, right: Optional[str] = None):
+    """
+    Поток котировок. Для опциона передать expiry, strike и right в query.
+    """
+    await websocket.accept()
+    contract = worker.build_contract(symbol.upper(), strike is not None, expiry, strike, right or "C")
+    stream = worker.stream_quotes(contract, max_rate)
+    try:
+        async for quote in stream:
+            await websocket.send_json(quote)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await stream.aclose()
+
+
+@app.get("/orders")
+async def get_orders(symbol: Optional[str] = None, status: Optional[str] = None, active: Optional[bool] = None):
+    orders = await worker.get_orders_async(symbol, status, active)
+    return {"orders": orders}
+
+
+@app.get("/orders/stream")
+async def orders_stream(symbol: Optional[str] = None):
+    """
+    Server-Sent Events: snapshot, затем дельты по ордерам.
+    """
+    async def events():
+        stream = worker.stream_orders(symbol)
+        try:
+            async for event in stream:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            await stream.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/accounts")
+async def accounts():
+    return {"accounts": await worker.get_account_async("accounts")}
+
+
+@app.get("/account")
+async def account_summary(account: Optional[str] = None):
+    return await worker.get_account_async("summary", account)
+
+
+@app.get("/positions")
+async def positions(account: Optional[str] = None):
+    return {"positions": await worker.get_account_async("positions", account)}
+
+
+@app.get("/pnl")
+async def pnl(account: Optional[str] = None):
+    return {"pnl": await worker.get_account_async("pnl", account)}
+
+
+@app.get("/history")
+async def history(symbol: str, bar_size: str = "1 min", start: Optional[int] = None, end: Optional[int] = None,
+                  what_to_show: str = "TRADES", use_rth: bool = True, format: str = "json"):
+    """
+    OHLCV бары [start, end) (секунды UTC) из кэша на диске, недостающее
+    догружается из TWS. format=npy — сырой массив (dtype в X-Bar-Dtype),
+    отдаётся прямо из memmap без копирования.
+    """
+    try:
+        bars, info = await worker.get_history_async(symbol, bar_size, start, end, what_to_show, use_rth)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    if bars is None:
+        return JSONResponse({"status": "error", "message": info["error"]}, status_code=503)
+
+    if format == "npy":
+        view = memoryview(bars).cast("B")
+
+        async def body():
+            for i in range(0, len(view), 1 << 20):
+                yield view[i:i + (1 << 20)]
+
+        headers = {"X-Bar-Dtype": json.dumps(bars.dtype.descr), "X-Bar-Count": str(len(bars))}
+        return StreamingResponse(body(), media_type="application/octet-stream", headers=headers)
+
+    return {**info, "bars": {name: bars[name].tolist() for name in bars.dtype.names}}
+
+
+@app.get("/history/cache")
+async def history_cache():
+    return worker.history_stats()
+
+
+@app.get("/risk")
+async def risk_stats():
+    return await worker.risk_stats_async()
+
+
+@app.post("/risk/limits")
+async def set_risk_limits(data: RiskLimitsRequest):
+    limits = data.dict(exclude={"symbol"}, exclude_none=True)
+    return {"symbol": data.symbol.upper(), "limits": await worker.set_risk_limits_async(data.symbol, **limits)}
+
+
+@app.get("/journal")
+async def journal():
+    return worker.journal_stats()
+
+
+@app.post("/journal/replay")
+async def journal_replay(data: ReplayRequest):
+    result = await worker.start_replay_async(data.day, data.speed, data.start, data.end, data.kinds)
+    if "error" in result:
+        return JSONResponse({"status": "error", "message": result["error"]}, status_code=400)
+    return result
+
+
+@app.post("/journal/replay/stop")
+async def journal_replay_stop():
+    return await worker.stop_replay_async()
+
+
+@app.get("/journal/replay/stream")
+async def journal_replay_stream():
+    """
+    Server-Sent Events текущего replay: snapshot песочницы, затем события
+    котировок и ордеров с "replay": true. Живые стримы replay не видят.
+    """
+    async def events():
+        stream = worker.stream_replay()
+        try:
+            async for event in stream:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            await stream.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(worker.metrics_text(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/scheduler")
+async def scheduler_stats():
+    return await worker.scheduler_stats_async()
+
+
+@app.get("/pool")
+async def pool():
+    return worker.pool_stats()
+
+
+@app.get("/health")
+async def health():
+    state = worker.health()
+    return JSONResponse(state, status_code=200 if state["connected"] else 503)
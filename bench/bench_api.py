@@ -0,0 +1,75 @@
+"""
+Бенчмарк HTTP-слоя: синхронные роуты (поток threadpool ждёт future.result())
+против async-роутов (await asyncio.wrap_future) на заглушке IB.
+
+    python -m bench.bench_api --requests 2000 --concurrency 500 --latency 0.05
+
+Нужен httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from api.api import AtmRequest, create_app
+from bench.stub_ib import start_stub_worker
+
+
+def build_blocking_app(worker):
+    """
+    Прежний вариант API: обычный def, поток пула висит на .result().
+    """
+    app = FastAPI()
+
+    @app.post("/get_atm_option")
+    def get_atm_option(data: AtmRequest):
+        return worker.get_atm_option(data.symbol, data.right, data.expiry)
+
+    return app
+
+
+async def run_load(app, total, concurrency):
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one():
+            async with sem:
+                t0 = time.perf_counter()
+                r = await client.post("/get_atm_option", json={"symbol": "NVDA", "right": "C"})
+                latencies.append(time.perf_counter() - t0)
+                r.raise_for_status()
+
+        t_start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - t_start
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    worker = start_stub_worker(args.latency)
+
+    for name, app in (("blocking (def + .result())", build_blocking_app(worker)),
+                      ("async (await wrap_future)", create_app(worker))):
+        res = asyncio.run(run_load(app, args.requests, args.concurrency))
+        print(f"{name:30s} {res['rps']:8.1f} req/s   p50 {res['p50_ms']:7.1f} ms   p99 {res['p99_ms']:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Нагрузочный прогон API на заглушке IB по сценариям: одиночные ордера,
+bulk-ордера, ATM-сканы, запросы по счёту. Для каждого сценария —
+req/s, p50/p99 и пик памяти. Память меряется отдельным проходом:
+tracemalloc замедляет всё в разы и испортил бы задержки.
+Результаты дописываются в bench/results/bench_suite.jsonl с хэшем
+коммита; при запуске печатается сравнение с прошлым прогоном с теми
+же параметрами.
+
+    python -m bench.bench_suite --requests 1000 --concurrency 200 --latency 0.01
+
+Нужен httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import httpx
+
+from api.api import create_app
+from bench.stub_ib import start_stub_worker
+from worker.worker import DEFAULT_WATCHLIST
+
+RESULTS_PATH = os.path.join(os.path.dirname(__file__), "results", "bench_suite.jsonl")
+
+# порог, после которого падение считается регрессией; шум между
+# прогонами на одной машине — около ±20%
+REGRESSION_THRESHOLD = 0.25
+
+
+def single_order(i):
+    action = "buy_order" if i % 2 == 0 else "sell_order"
+    return "POST", f"/{action}", {"symbol": DEFAULT_WATCHLIST[i % 4], "qty": 1, "limit_price": 100.0}
+
+
+def bulk_orders(i):
+    orders = [
+        {"symbol": DEFAULT_WATCHLIST[j % 4], "qty": 1, "limit_price": 100.0, "action": "BUY" if j % 2 else "SELL"}
+        for j in range(10)
+    ]
+    return "POST", "/orders/bulk", {"orders": orders}
+
+
+def atm_scan(i):
+    items = [{"symbol": s, "right": "C" if i % 2 == 0 else "P"} for s in DEFAULT_WATCHLIST]
+    return "POST", "/get_atm_options", {"items": items}
+
+
+def account_query(i):
+    return "GET", ("/account", "/positions", "/pnl", "/accounts")[i % 4], None
+
+
+SCENARIOS = {
+    "single_orders": single_order,
+    "bulk_orders": bulk_orders,
+    "atm_scans": atm_scan,
+    "account_queries": account_query,
+}
+
+
+async def run_scenario(app, make_request, total, concurrency, trace_memory):
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    errors = 0
+    sem = asyncio.Semaphore(concurrency)
+
+    if trace_memory:
+        tracemalloc.start()
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one(i):
+            nonlocal errors
+            method, path, payload = make_request(i)
+            async with sem:
+                t0 = time.perf_counter()
+                r = await client.request(method, path, json=payload)
+                latencies.append(time.perf_counter() - t0)
+                if r.status_code != 200 or r.json().get("status") in ("error", "rejected"):
+                    errors += 1
+
+        t_start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - t_start
+
+    peak = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000,
+        "peak_mem_mb": peak / 2 ** 20 if peak is not None else None,
+        "errors": errors,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_previous(params):
+    if not os.path.exists(RESULTS_PATH):
+        return None
+    previous = None
+    with open(RESULTS_PATH) as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry["params"] == params:
+                previous = entry
+    return previous
+
+
+def save(entry):
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    with open(RESULTS_PATH, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def _delta(new, old):
+    return (new - old) / old if old else 0.0
+
+
+def report(results, previous):
+    for name, res in results.items():
+        mem = f"{res['peak_mem_mb']:6.1f} MB" if res["peak_mem_mb"] is not None else "      -"
+        line = (f"{name:16s} {res['rps']:8.1f} req/s   p50 {res['p50_ms']:7.1f} ms   "
+                f"p99 {res['p99_ms']:7.1f} ms   mem {mem}   errors {res['errors']}")
+        old = (previous or {}).get("scenarios", {}).get(name)
+        if old:
+            rps, p99 = _delta(res["rps"], old["rps"]), _delta(res["p99_ms"], old["p99_ms"])
+            flag = "  REGRESSION" if rps < -REGRESSION_THRESHOLD or p99 > REGRESSION_THRESHOLD else ""
+            line += f"   vs {previous['commit']}: rps {rps:+.1%} p99 {p99:+.1%}{flag}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fill-delay", type=float, default=0.05)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="только выбранные сценарии (можно несколько раз)")
+    parser.add_argument("--no-memory", action="store_true", help="без прохода с tracemalloc")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    app = create_app(start_stub_worker(args.latency, args.jitter, args.seed, args.fill_delay))
+
+    params = {"requests": args.requests, "concurrency": args.concurrency, "latency": args.latency,
+              "jitter": args.jitter, "seed": args.seed, "fill_delay": args.fill_delay}
+    previous = load_previous(params)
+
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        res = asyncio.run(run_scenario(app, SCENARIOS[name], args.requests, args.concurrency, False))
+        if not args.no_memory:
+            memory = asyncio.run(run_scenario(app, SCENARIOS[name], args.requests, args.concurrency, True))
+            res["peak_mem_mb"] = memory["peak_mem_mb"]
+        results[name] = res
+
+    report(results, previous)
+    if not args.no_save:
+        save({"commit": git_commit(), "time": time.time(), "params": params, "scenarios": results})
+
+
+if __name__ == "__main__":
+    main()
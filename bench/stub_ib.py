@@ -0,0 +1,422 @@
+import asyncio
+import datetime
+import itertools
+import random
+import time
+from collections import deque
+from types import SimpleNamespace
+
+from eventkit import Event
+from ib_insync import (AccountValue, CommissionReport, ContractDetails, Execution, Fill, OrderStatus, PnL,
+                       PnLSingle, PortfolioItem, Position, Trade, TradeLogEntry)
+
+# коды ошибок TWS, которые умеет имитировать заглушка
+PACING_ERROR = 100          # Max rate of messages per second has been exceeded
+HISTORICAL_PACING_ERROR = 162
+NOT_SUBSCRIBED_ERROR = 354  # Requested market data is not subscribed
+
+BAR_SECONDS = {
+    '1 secs': 1, '5 secs': 5, '15 secs': 15, '30 secs': 30, '1 min': 60, '5 mins': 300,
+    '15 mins': 900, '30 mins': 1800, '1 hour': 3600, '1 day': 86400,
+}
+
+
+NAN = float('nan')
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class BarList(list):
+    # как BarDataList: список баров с reqId запроса
+    reqId = 0
+
+
+class StubTicker:
+    # price=None — пустой тикер, как потоковая линия до первого тика
+    def __init__(self, contract, price, close=None, market_data_type=1):
+        self.contract = contract
+        self.updateEvent = Event('updateEvent')
+        self.streaming = False
+        self.marketDataType = market_data_type
+        self.close = close if close is not None else (price if price is not None else NAN)
+        self.bidSize = self.askSize = 100.0
+        self.lastSize = 1.0
+        self.volume = 0.0
+        self.bid = self.ask = self.last = NAN
+        self.time = None
+        if price is not None:
+            self.set_price(price)
+
+    def set_price(self, price):
+        self.bid = round(price - 0.05, 2)
+        self.ask = round(price + 0.05, 2)
+        self.last = round(price, 2)
+        self.volume += self.lastSize
+        self.time = _now()
+
+    def marketPrice(self):
+        mid = (self.bid + self.ask) / 2
+        return self.last if mid != mid else mid
+
+
+class StubIB:
+    """
+    Детерминированная замена ib_insync.IB для бенчмарков и ручной
+    проверки без TWS. Каждый запрос занимает latency секунд (плюс
+    jitter из генератора с фиксированным seed) и не блокирует loop.
+
+    Умеет: квалификацию (стабильные conId), snapshot и потоковые тикеры
+    (случайное блуждание цены), цепочки опционов вокруг цены, ack и
+    исполнение ордеров с обновлением позиций, отмену, значения счёта и
+    PnL, ошибки пейсинга (100 — больше max_msg_rate сообщений в секунду,
+    162 — больше hist_limit исторических запросов за hist_window секунд),
+    ошибку 354 по символам unquoted. Потоковый тикер, как у TWS, пуст
+    до первого тика.
+    """
+
+    def __init__(self, latency=0.05, price=100.0, prices=None, jitter=0.0, seed=0, fill_delay=None,
+                 tick_interval=None, strike_step=1.0, strike_count=101, expirations=('20991217',),
+                 max_msg_rate=None, disconnect_on_pacing=False, hist_limit=None, hist_window=600.0,
+                 account='DU000000', net_liquidation=100000.0, unquoted=()):
+        self.latency = latency
+        self.price = price
+        self.prices = dict(prices or {})
+        self.jitter = jitter
+        self.fill_delay = fill_delay  # None — ордера только подтверждаются, не исполняются
+        self.tick_interval = tick_interval  # None — потоковые тикеры стоят на месте
+        self.strike_step = strike_step
+        self.strike_count = strike_count
+        self.expirations = list(expirations)
+        self.max_msg_rate = max_msg_rate
+        self.disconnect_on_pacing = disconnect_on_pacing
+        self.hist_limit = hist_limit
+        self.hist_window = hist_window
+        self.account = account
+        self.net_liquidation = net_liquidation
+        self.unquoted = set(unquoted)  # символы без подписки на market data (ошибка 354)
+        self.market_data_type = 1
+
+        self._random = random.Random(seed)
+        self._con_ids = {}
+        self._req_ids = itertools.count(1)
+        self._exec_ids = itertools.count(1)
+        self.client = SimpleNamespace(getReqId=lambda: next(self._req_ids))
+        self.connectedEvent = Event('connectedEvent')
+        self.disconnectedEvent = Event('disconnectedEvent')
+        self.errorEvent = Event('errorEvent')
+        self.newOrderEvent = Event('newOrderEvent')
+        self.openOrderEvent = Event('openOrderEvent')
+        self.orderStatusEvent = Event('orderStatusEvent')
+        self.execDetailsEvent = Event('execDetailsEvent')
+        self.commissionReportEvent = Event('commissionReportEvent')
+        self.accountValueEvent = Event('accountValueEvent')
+        self.positionEvent = Event('positionEvent')
+        self.updatePortfolioEvent = Event('updatePortfolioEvent')
+        self.pnlEvent = Event('pnlEvent')
+        self.pnlSingleEvent = Event('pnlSingleEvent')
+
+        self._connected = False
+        self._trades = []
+        self._orders = {}     # orderId -> Trade
+        self._tickers = {}    # conId -> StubTicker (линии reqMktData)
+        self._positions = {}  # conId -> (contract, qty, avg_cost)
+        self._sent = deque()  # время сообщений за последнюю секунду
+        self._hist_sent = deque()
+        self.requests = {}    # имя запроса -> количество
+        self.pacing_violations = 0
+
+    # --- имитация TWS ---
+
+    def _delay(self):
+        if not self.jitter:
+            return self.latency
+        return self.latency * (1 + self._random.uniform(-self.jitter, self.jitter))
+
+    def _message(self, name, count=1):
+        """
+        Учёт исходящих сообщений; при превышении max_msg_rate — ошибка 100,
+        как у TWS, и (опционально) разрыв соединения.
+        """
+        self.requests[name] = self.requests.get(name, 0) + count
+        if self.max_msg_rate is None:
+            return
+        now = time.monotonic()
+        for _ in range(count):
+            self._sent.append(now)
+        while self._sent and now - self._sent[0] >= 1.0:
+            self._sent.popleft()
+        if len(self._sent) > self.max_msg_rate:
+            self.pacing_violations += 1
+            self.errorEvent.emit(-1, PACING_ERROR, 'Max rate of messages per second has been exceeded', None)
+            if self.disconnect_on_pacing:
+                self.disconnect()
+
+    def price_of(self, contract):
+        base = self.prices.get(contract.symbol, self.price)
+        if contract.secType == 'OPT':
+            # грубая цена опциона: внутренняя стоимость + 1
+            intrinsic = base - contract.strike if contract.right == 'C' else contract.strike - base
+            return max(intrinsic, 0.0) + 1.0
+        ticker = self._tickers.get(contract.conId)
+        return ticker.last if ticker is not None and ticker.last == ticker.last else base
+
+    # --- подключение ---
+
+    async def connectAsync(self, host='127.0.0.1', port=7497, clientId=1, timeout=4):
+        await asyncio.sleep(self._delay())
+        self._connected = True
+        self._sent.clear()
+        # как и TWS, сразу после подключения присылаем значения счёта и позиции
+        for account in self.managedAccounts():
+            self.accountValueEvent.emit(AccountValue(account, 'NetLiquidation', str(self.net_liquidation), 'USD', ''))
+            self.accountValueEvent.emit(AccountValue(account, 'BuyingPower', str(self.net_liquidation * 4), 'USD', ''))
+        for contract, qty, avg_cost in self._positions.values():
+            self.positionEvent.emit(Position(self.account, contract, qty, avg_cost))
+        self.connectedEvent.emit()
+        return self
+
+    def disconnect(self):
+        if self._connected:
+            self._connected = False
+            for ticker in self._tickers.values():
+                ticker.streaming = False
+            self._tickers.clear()
+            self.disconnectedEvent.emit()
+
+    def isConnected(self):
+        return self._connected
+
+    def managedAccounts(self):
+        return [self.account]
+
+    # --- справочные данные ---
+
+    async def qualifyContractsAsync(self, *contracts):
+        self._message('qualifyContracts', len(contracts))
+        await asyncio.sleep(self._delay())
+        for c in contracts:
+            key = (c.secType, c.symbol, c.lastTradeDateOrContractMonth, c.strike, c.right)
+            c.conId = self._con_ids.setdefault(key, 1000 + len(self._con_ids))
+            if c.secType == 'OPT':
+                c.multiplier = c.multiplier or '100'
+                c.tradingClass = c.tradingClass or c.symbol
+                c.localSymbol = c.localSymbol or f"{c.symbol} {c.lastTradeDateOrContractMonth} {c.right}{c.strike:g}"
+        return list(contracts)
+
+    async def reqContractDetailsAsync(self, contract):
+        self._message('reqContractDetails')
+        await asyncio.sleep(self._delay())
+        # опционы США выше $3 торгуются шагом 0.05
+        return [ContractDetails(contract=contract, minTick=0.05 if contract.secType == 'OPT' else 0.01)]
+
+    async def reqSecDefOptParamsAsync(self, symbol, exchange, secType, conId):
+        self._message('reqSecDefOptParams')
+        await asyncio.sleep(self._delay())
+        center = round(self.prices.get(symbol, self.price) / self.strike_step) * self.strike_step
+        half = self.strike_count // 2
+        strikes = [center + (i - half) * self.strike_step for i in range(self.strike_count)]
+        return [SimpleNamespace(
+            exchange='SMART', underlyingConId=conId, tradingClass=symbol,
+            multiplier='100', expirations=list(self.expirations), strikes=[s for s in strikes if s > 0]
+        )]
+
+    async def reqHistoricalDataAsync(self, contract, endDateTime, durationStr, barSizeSetting,
+                                     whatToShow, useRTH, formatDate=1, keepUpToDate=False, chartOptions=None):
+        self._message('reqHistoricalData')
+        bars = BarList()
+        bars.reqId = self.client.getReqId()
+        if self.hist_limit is not None:
+            now = time.monotonic()
+            while self._hist_sent and now - self._hist_sent[0] >= self.hist_window:
+                self._hist_sent.popleft()
+            if len(self._hist_sent) >= self.hist_limit:
+                self.pacing_violations += 1
+                self.errorEvent.emit(bars.reqId, HISTORICAL_PACING_ERROR, 'Historical Market Data Service error '
+                                     'message:Historical data request pacing violation', contract)
+                return bars
+            self._hist_sent.append(now)
+
+        await asyncio.sleep(self._delay())
+        # бары без пропусков (торгуем круглосуточно) на [end - duration, end)
+        count, unit = durationStr.split()
+        duration = int(count) * {'S': 1, 'D': 86400, 'W': 7 * 86400, 'M': 30 * 86400, 'Y': 365 * 86400}[unit]
+        step = BAR_SECONDS.get(barSizeSetting, 86400)
+        end = endDateTime if isinstance(endDateTime, datetime.datetime) else _now()
+        end_ts = int(end.timestamp()) // step * step
+        price = self.price_of(contract)
+        for ts in range(end_ts - duration // step * step, end_ts, step):
+            date = datetime.datetime.fromtimestamp(ts, datetime.timezone.utc)
+            bars.append(SimpleNamespace(date=date.date() if step >= 86400 else date, open=price, high=price + 1,
+                                        low=price - 1, close=price, volume=1000))
+        return bars
+
+    # --- котировки ---
+
+    def reqMarketDataType(self, marketDataType):
+        self._message('reqMarketDataType')
+        self.market_data_type = marketDataType
+
+    async def reqTickersAsync(self, *contracts):
+        self._message('reqTickers', len(contracts))
+        await asyncio.sleep(self._delay())
+        return [StubTicker(c, None if c.symbol in self.unquoted else self.price_of(c),
+                           market_data_type=self.market_data_type) for c in contracts]
+
+    def reqMktData(self, contract, genericTickList='', snapshot=False, regulatorySnapshot=False):
+        self._message('reqMktData')
+        ticker = StubTicker(contract, None, self.price_of(contract), self.market_data_type)
+        self._tickers[contract.conId] = ticker
+        loop = asyncio.get_event_loop()
+        if contract.symbol in self.unquoted:
+            loop.call_later(self._delay(), self.errorEvent.emit, next(self._req_ids), NOT_SUBSCRIBED_ERROR,
+                            'Requested market data is not subscribed.', contract)
+            return ticker
+        ticker.streaming = True
+        loop.call_later(self._delay(), self._tick, ticker)
+        return ticker
+
+    def cancelMktData(self, contract):
+        self._message('cancelMktData')
+        ticker = self._tickers.pop(contract.conId, None)
+        if ticker is not None:
+            ticker.streaming = False
+
+    def _tick(self, ticker):
+        if not ticker.streaming:
+            return
+        if ticker.last != ticker.last:
+            ticker.set_price(self.price_of(ticker.contract))
+        elif self.tick_interval is not None:
+            ticker.set_price(max(ticker.last + self._random.choice((-0.01, 0.0, 0.01)), 0.01))
+        if self.tick_interval is not None:
+            asyncio.get_event_loop().call_later(self.tick_interval, self._tick, ticker)
+        ticker.updateEvent.emit(ticker)
+
+    # --- ордера ---
+
+    def trades(self):
+        return list(self._trades)
+
+    def openTrades(self):
+        return [t for t in self._trades if not t.isDone()]
+
+    def placeOrder(self, contract, order):
+        self._message('placeOrder')
+        # тот же orderId у открытого ордера — изменение, как в ib_insync
+        trade = self._orders.get(order.orderId)
+        if trade is not None and not trade.isDone():
+            trade.order = order
+            self.openOrderEvent.emit(trade)
+            return trade
+        if not order.orderId:
+            order.orderId = self.client.getReqId()
+        order.clientId = order.clientId or 1
+        order.account = order.account or self.account
+        trade = Trade(contract=contract, order=order, orderStatus=OrderStatus(
+            orderId=order.orderId, status='PendingSubmit', remaining=order.totalQuantity),
+            log=[TradeLogEntry(_now(), 'PendingSubmit')])
+        self._trades.append(trade)
+        self._orders[order.orderId] = trade
+        self.newOrderEvent.emit(trade)
+        asyncio.get_event_loop().call_later(self._delay(), self._ack, trade)
+        return trade
+
+    def _set_status(self, trade, status):
+        trade.orderStatus.status = status
+        trade.log.append(TradeLogEntry(_now(), status))
+        trade.statusEvent.emit(trade)
+        self.orderStatusEvent.emit(trade)
+
+    def _ack(self, trade):
+        if trade.isDone():
+            return
+        self._set_status(trade, 'Submitted' if not trade.order.parentId else 'PreSubmitted')
+        # исполняются только входные ордера: дочерние (стоп, тейк) ждут триггера
+        if self.fill_delay is not None and not trade.order.parentId:
+            asyncio.get_event_loop().call_later(self.fill_delay, self._fill, trade)
+
+    def _fill(self, trade):
+        if trade.isDone():
+            return
+        order, contract = trade.order, trade.contract
+        qty = order.totalQuantity
+        price = order.lmtPrice if order.orderType == 'LMT' else self.price_of(contract)
+        exec_id = f"stub.{next(self._exec_ids)}"
+        execution = Execution(
+            execId=exec_id, time=_now(), acctNumber=order.account, exchange='SMART',
+            side='BOT' if order.action == 'BUY' else 'SLD', shares=qty, price=price,
+            permId=order.permId, clientId=order.clientId, orderId=order.orderId, cumQty=qty, avgPrice=price
+        )
+        # как в TWS: комиссия приходит отдельным сообщением после execDetails
+        fill = Fill(contract, execution, CommissionReport(), _now())
+        trade.fills.append(fill)
+        trade.orderStatus.filled = qty
+        trade.orderStatus.remaining = 0
+        trade.orderStatus.avgFillPrice = price
+        self.execDetailsEvent.emit(trade, fill)
+        report = fill.commissionReport  # Fill — NamedTuple, ib_insync дописывает отчёт на месте
+        report.execId, report.commission, report.currency = exec_id, 1.0, 'USD'
+        self.commissionReportEvent.emit(trade, fill, report)
+        self._set_status(trade, 'Filled')
+        self._update_position(contract, qty if order.action == 'BUY' else -qty, price)
+
+    def _update_position(self, contract, delta, price):
+        _, qty, avg_cost = self._positions.get(contract.conId, (contract, 0.0, 0.0))
+        new_qty = qty + delta
+        if new_qty and (qty == 0 or (qty > 0) == (delta > 0)):
+            avg_cost = (qty * avg_cost + delta * price) / new_qty
+        self._positions[contract.conId] = (contract, new_qty, avg_cost)
+        if not new_qty:
+            del self._positions[contract.conId]
+        self.positionEvent.emit(Position(self.account, contract, new_qty, avg_cost))
+        self.updatePortfolioEvent.emit(PortfolioItem(
+            contract, new_qty, price, new_qty * price, avg_cost, (price - avg_cost) * new_qty, 0.0, self.account
+        ))
+
+    def cancelOrder(self, order, manualCancelOrderTime=''):
+        self._message('cancelOrder')
+        for trade in self._trades:
+            if trade.order.orderId == order.orderId and not trade.isDone():
+                self._set_status(trade, 'PendingCancel')
+                asyncio.get_event_loop().call_later(self._delay(), self._set_status, trade, 'Cancelled')
+                return trade
+        return None
+
+    # --- счёт ---
+
+    async def accountSummaryAsync(self, account=''):
+        self._message('accountSummary')
+        await asyncio.sleep(self._delay())
+        return [SimpleNamespace(account=account, tag='NetLiquidation', value=str(self.net_liquidation),
+                                currency='USD')]
+
+    def reqPnL(self, account, modelCode=''):
+        self._message('reqPnL')
+        pnl = PnL(account, modelCode, dailyPnL=0.0, unrealizedPnL=0.0, realizedPnL=0.0)
+        asyncio.get_event_loop().call_later(self._delay(), self.pnlEvent.emit, pnl)
+        return pnl
+
+    def reqPnLSingle(self, account, modelCode, conId):
+        self._message('reqPnLSingle')
+        pnl = PnLSingle(account, modelCode, conId, dailyPnL=0.0, unrealizedPnL=0.0, realizedPnL=0.0)
+        asyncio.get_event_loop().call_later(self._delay(), self.pnlSingleEvent.emit, pnl)
+        return pnl
+
+    def cancelPnLSingle(self, account, modelCode, conId):
+        self._message('cancelPnLSingle')
+
+
+def start_stub_worker(latency=0.05, jitter=0.0, seed=0, fill_delay=None, **worker_kwargs):
+    """
+    IBWorker на StubIB, запущенный и готовый к запросам.
+    """
+    from worker.worker import IBWorker
+
+    # у заглушки нет лимитов TWS — семафор и токен-бакет не нужны
+    ib = StubIB(latency=latency, jitter=jitter, seed=seed, fill_delay=fill_delay)
+    worker = IBWorker(ib=ib, max_concurrency=10000, msg_rate=1e9, **worker_kwargs)
+    worker.start()
+    asyncio.run(worker.wait_ready_async(timeout=5))
+    return worker
@@ -1,382 +1,372 @@
-from ib_insync import *
-# from ib_async import *
+import queue
+import time
 import tkinter as tk
 from tkinter import ttk
-from decimal import Decimal
-import sv_ttk
 
-# ================== IB CONNECTION ==================
-ib = IB()
-ib.connect('127.0.0.1', 7496, clientId=1)
+import sv_ttk
 
-# ================== HELPERS ==================
-def build_contract():
-    """
-    Создает контракт на основе введённого тикера и параметров.
-    Поддерживает акции и индексы.
-    """
-    symbol = entry_symbol.get().upper().strip()
-
-    if option_var.get():
-        right = "C" if right_var.get() == "Call" else "P"
-        return Option(
-            symbol=symbol,
-            lastTradeDateOrContractMonth=expiry_entry.get().strip(),
-            strike=float(strike_entry.get()),
-            right=right,
-            exchange='SMART',
-            currency='USD',
-            multiplier='100'
-        )
+from worker.risk import RiskRejected
+from worker.worker import DEFAULT_WATCHLIST, IBWorker
 
-    # Индексы
-    if symbol in ['SPX', 'NDX', 'RUT']:
-        return Index(symbol, 'CBOE', 'USD')
-
-    # Акции
-    return Stock(symbol, 'SMART', 'USD')
-
-
-def get_qty():
-    try:
-        return Decimal(qty_entry.get())
-    except:
-        price_label.config(text="Invalid Qty")
-        return None
-
-
-def get_price(contract):
-    ticker = ib.reqTickers(contract)[0]
-    price = round(ticker.marketPrice(), 2)
-    price_label.config(text=f"{contract.symbol}: {price} USD")
-    return price
+# ================== UI LOOP ==================
+FRAME_MS = 16  # ~60 fps
+FRAME_BUDGET = 0.008  # секунд на разбор очереди за кадр, остальное — отрисовке
 
+ORDER_COLUMNS = ("symbol", "action", "type", "qty", "status", "filled", "remaining", "avg_price")
 
-# ================== ACTIONS ==================
-def buy_stock():
-    contract = build_contract()
-    qty = get_qty()
-    price = float(limit_price_entry.get())
-
-    ib.qualifyContracts(contract)
-
-    order = LimitOrder('BUY', qty, price, tif='DAY')
-    order.orderId = ib.client.getReqId()
-
-    ib.placeOrder(contract, order)
-    orders_text.insert(tk.END, f"BUY {contract.symbol} @ {price}, Qty={qty}\n")
-
-
-def buy_bracket():
-    contract = build_contract()
-    qty = get_qty()
-    price = float(limit_price_entry.get())
-
-    ib.qualifyContracts(contract)
-
-    parent = Order(
-        orderId=ib.client.getReqId(),
-        action="BUY",
-        orderType="LMT",
-        totalQuantity=qty,
-        lmtPrice=price,
-        tif="DAY",
-        transmit=False
-    )
-
-    stop = Order(
-        orderId=ib.client.getReqId(),
-        action="SELL",
-        orderType="STP",
-        auxPrice=price - 3,
-        totalQuantity=qty,
-        parentId=parent.orderId,
-        transmit=False
-    )
-
-    take_profit = Order(
-        orderId=ib.client.getReqId(),
-        action="SELL",
-        orderType="LMT",
-        lmtPrice=price + 5,
-        totalQuantity=qty,
-        parentId=parent.orderId,
-        transmit=True
-    )
-
-    ib.placeOrder(contract, parent)
-    ib.sleep(0.2)
-    ib.placeOrder(contract, stop)
-    ib.sleep(0.2)
-    ib.placeOrder(contract, take_profit)
-
-
-    orders_text.insert(tk.END, f"Bracket BUY {contract.symbol}\n")
-
-
-def buy_trailing():
-    contract = build_contract()
-    qty = get_qty()
-    price = float(limit_price_entry.get())
-    trailing = float(trailing_entry.get())
-
-    ib.qualifyContracts(contract)
-
-    parent = Order(
-        orderId=ib.client.getReqId(),
-        action="BUY",
-        orderType="LMT",
-        totalQuantity=qty,
-        lmtPrice=price,
-        tif="DAY",
-        transmit=False
-    )
-
-    trail = Order(
-        orderId=ib.client.getReqId(),
-        action="SELL",
-        orderType="TRAIL",
-        auxPrice=trailing,
-        totalQuantity=qty,
-        parentId=parent.orderId,
-        transmit=True
-    )
-
-    ib.placeOrder(contract, parent)
-    ib.sleep(0.2)
-    ib.placeOrder(contract, trail)
-
-
-
-    orders_text.insert(tk.END, f"Trailing BUY {contract.symbol}\n")
-
-# ================== ORDER UPDATER ==================
-def update_orders():
-    orders_text.delete(1.0, tk.END)  # очищаем окно
-    trades = ib.trades()
-    if not trades:
-        orders_text.insert(tk.END, "Ордеров нет\n")
-    else:
-        for trade in trades:
-            symbol = trade.contract.symbol
-            status = trade.orderStatus.status
-            filled = trade.orderStatus.filled
-            remaining = trade.orderStatus.remaining
-            avg_price = trade.orderStatus.avgFillPrice
-            orders_text.insert(
-                tk.END,
-                f"{symbol}: {status}, Filled: {filled}, Remaining: {remaining}, AvgPrice: {avg_price}\n"
-            )
-
-    root.after(2000, update_orders)  # повторяем каждые 2 секунды
 
-def get_atm_option():
+class TradingApp:
     """
-    Находит ATM опцион для заданного underlying и даты из поля ввода.
-    Поддерживает Regular и Weekly опционы.
+    Tk-клиент поверх IBWorker. Ни одного вызова IB в потоке Tk:
+    кнопка читает поля формы и отправляет корутину в loop IBWorker
+    (worker.submit), результат и события ордеров возвращаются через
+    потокобезопасную ui_queue, которую mainloop разбирает каждый кадр.
+    Несколько запросов идут параллельно, окно не замирает.
     """
-    symbol = entry_symbol.get().upper().strip()
-    right = "C" if right_var.get() == "Call" else "P"
-
-    info_text.delete(1.0, tk.END)
-
-    if not symbol:
-        info_text.insert(tk.END, "❌ Ticker не задан\n")
-        return
-
-    # === UNDERLYING ===
-    if symbol in ['SPX', 'NDX', 'RUT']:
-        stk = Index(symbol, 'CBOE', 'USD')
-    else:
-        stk = Stock(symbol, 'SMART', 'USD')
-
-    ib.qualifyContracts(stk)
-
-    ul_ticker = ib.reqTickers(stk)[0]
-    for _ in range(10):
-        ul_price = ul_ticker.marketPrice()
-        if ul_price is not None:
-            break
-        ib.sleep(0.2)
-    else:
-        info_text.insert(tk.END, "❌ Не удалось получить цену underlying\n")
-        return
-
-    # === OPTION CHAINS ===
-    chains = ib.reqSecDefOptParams(stk.symbol, '', stk.secType, stk.conId)
-    if not chains:
-        info_text.insert(tk.END, "❌ Option chain не найден\n")
-        return
-
-    expiry_input = expiry_entry.get().strip()
-    chain = None
-
-    # ищем цепочку, где есть введённая дата
-    for c in chains:
-        valid_expiries = []
-        for d in c.expirations:
-            if isinstance(d, str):
-                valid_expiries.append(d.strip())
-            else:
-                valid_expiries.append(d.strftime('%Y%m%d'))
-        if expiry_input in valid_expiries:
-            chain = c
-            break
-
-    if not chain:
-        info_text.insert(
-            tk.END,
-            f"❌ Expiration {expiry_input} отсутствует в любой цепочке\n"
-            f"Доступные цепочки и даты:\n"
+
+    def __init__(self, root, worker):
+        self.root = root
+        self.worker = worker
+        self.ui_queue = queue.Queue()
+        self.order_rows = {}  # orderId -> значения строки, перерисовываем только изменившиеся
+        self.pending = 0
+        self._build_ui()
+        # события приходят в loop IBWorker — в Tk только через очередь
+        worker.subscribe_order_events(lambda event: self.ui_queue.put((self.on_order_event, event)))
+
+    # ================== МОСТ К IBWorker ==================
+    def run_async(self, coro, on_done, label=None):
+        """
+        Отправляет корутину IBWorker; on_done(result) вызовется в потоке Tk.
+        Исключение корутины показывается в строке статуса.
+        """
+        if not self.worker._is_ready():
+            coro.close()
+            self.set_status("IBKR not connected yet")
+            return
+        self.pending += 1
+        if label:
+            self.set_status(label)
+        future = self.worker.submit(coro)
+        future.add_done_callback(lambda f: self.ui_queue.put((self._finish, (f, on_done))))
+
+    def _finish(self, args):
+        future, on_done = args
+        self.pending -= 1
+        try:
+            result = future.result()
+        except RiskRejected as e:
+            self.set_status(f"Rejected ({e.rule}): {e.reason}")
+            return
+        except Exception as e:
+            self.set_status(f"Error: {e!r}")
+            return
+        if result is None:
+            # публичные методы IBWorker возвращают None, если связь пропала
+            self.set_status("IBKR not connected yet")
+            return
+        on_done(result)
+
+    def pump_ui(self):
+        """
+        Разбирает ui_queue не дольше FRAME_BUDGET за кадр: пачка событий
+        ордеров не съедает отрисовку.
+        """
+        deadline = time.perf_counter() + FRAME_BUDGET
+        while time.perf_counter() < deadline:
+            try:
+                callback, arg = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            callback(arg)
+        self.conn_label.config(
+            text=("● connected" if self.worker.connected else "○ connecting…")
+            + (f"   {self.pending} pending" if self.pending else "")
+        )
+        self.root.after(FRAME_MS, self.pump_ui)
+
+    # ================== HELPERS ==================
+    def set_status(self, text):
+        self.price_label.config(text=text)
+
+    def form(self):
+        """
+        Параметры формы, читаются в потоке Tk до отправки запроса.
+        None — страйк опциона не число (сообщение уже в статусе).
+        """
+        symbol = self.entry_symbol.get().upper().strip()
+        params = {"symbol": symbol, "is_option": self.option_var.get()}
+        if params["is_option"]:
+            strike = self.get_float(self.strike_entry, "Strike")
+            if strike is None:
+                return None
+            params.update(
+                expiry=self.expiry_entry.get().strip(),
+                strike=strike,
+                right="C" if self.right_var.get() == "Call" else "P",
+            )
+        return params
+
+    def get_qty(self):
+        try:
+            return float(self.qty_entry.get())
+        except ValueError:
+            self.set_status("Invalid Qty")
+            return None
+
+    def get_float(self, entry, name):
+        try:
+            return float(entry.get())
+        except ValueError:
+            self.set_status(f"Invalid {name}")
+            return None
+
+    # ================== ACTIONS ==================
+    def get_price(self):
+        params = self.form()
+        if params is None:
+            return
+        if not params["symbol"]:
+            self.set_status("Ticker не задан")
+            return
+
+        def done(quote):
+            if "error" in quote:
+                self.set_status(quote["error"])
+                return
+            price = quote["price"]
+            self.set_status(f"{quote['symbol']}: {round(price, 2) if price is not None else '—'} USD"
+                            + (" (delayed)" if quote["delayed"] else ""))
+
+        self.run_async(self.worker.get_quote_async(**params), done, f"Price {params['symbol']}…")
+
+    def buy_stock(self):
+        params, qty = self.form(), self.get_qty()
+        price = self.get_float(self.limit_price_entry, "Limit Price")
+        if params is None or qty is None or price is None:
+            return
+
+        def done(trade):
+            if isinstance(trade, dict):
+                self.set_status(trade["error"])
+                return
+            self.set_status(f"BUY {trade.contract.symbol} @ {price}, Qty={qty:g}")
+
+        self.run_async(self.worker.place_order_async(qty=qty, limit_price=price, **params), done,
+                       f"BUY {params['symbol']}…")
+
+    def buy_bracket(self):
+        params, qty = self.form(), self.get_qty()
+        price = self.get_float(self.limit_price_entry, "Limit Price")
+        if params is None or qty is None or price is None:
+            return
+
+        def done(result):
+            if "error" in result:
+                self.set_status(result["error"])
+                return
+            self.set_status(f"Bracket BUY {params['symbol']}: stop {result['stopPrice']}, "
+                            f"take profit {result['takeProfitPrice']}")
+
+        self.run_async(self.worker.place_bracket_async(qty=qty, limit_price=price, stop_offset=3,
+                                                       take_profit_offset=5, **params),
+                       done, f"Bracket {params['symbol']}…")
+
+    def buy_trailing(self):
+        params, qty = self.form(), self.get_qty()
+        price = self.get_float(self.limit_price_entry, "Limit Price")
+        trailing = self.get_float(self.trailing_entry, "Trailing")
+        if params is None or qty is None or price is None or trailing is None:
+            return
+
+        def done(group):
+            if isinstance(group, dict):
+                self.set_status(group["error"])
+                return
+            self.set_status(f"Trailing BUY {params['symbol']}" + ("" if group.acked else " (not acknowledged)"))
+
+        self.run_async(self.worker.place_order_async(qty=qty, limit_price=price, trail_amount=trailing,
+                                                     order_type="trail", **params),
+                       done, f"Trailing {params['symbol']}…")
+
+    def get_atm_option(self):
+        """
+        ATM опцион для underlying и даты из поля ввода (Regular и Weekly).
+        """
+        symbol = self.entry_symbol.get().upper().strip()
+        right = "C" if self.right_var.get() == "Call" else "P"
+        expiry = self.expiry_entry.get().strip() or None
+
+        if not symbol:
+            self.info_text.delete(1.0, tk.END)
+            self.info_text.insert(tk.END, "❌ Ticker не задан\n")
+            return
+
+        def done(result):
+            self.info_text.delete(1.0, tk.END)
+            if "error" in result:
+                self.info_text.insert(tk.END, f"❌ {symbol}: {result['error']}\n")
+                return
+
+            self.strike_entry.delete(0, tk.END)
+            self.strike_entry.insert(0, str(result["atm_strike"]))
+            self.expiry_entry.delete(0, tk.END)
+            self.expiry_entry.insert(0, result["expiry"])
+
+            mid = round(result["mid"], 2) if result["mid"] is not None else None
+            self.info_text.insert(
+                tk.END,
+                f"ATM {symbol} {result['expiry']} {right} {result['atm_strike']}\n"
+                f"Underlying: {round(result['underlying'], 2)}\n"
+                f"Bid: {result['bid']}  Ask: {result['ask']}  Mid: {mid}"
+                + (" (delayed)" if result["delayed"] else "") + "\n"
+                f"TradingClass: {result['tradingClass']}\n"
+            )
+            if "quoteError" in result:
+                self.info_text.insert(tk.END, f"❌ {result['quoteError']}\n")
+            self.set_status(f"ATM {symbol} ready")
+
+        self.run_async(self.worker.get_atm_option_async(symbol, right, expiry), done, f"ATM {symbol}…")
+
+    # ================== ORDER UPDATER ==================
+    def on_order_event(self, event):
+        """
+        Обновляет строку ордера в таблице (без полной перерисовки).
+        """
+        values = (
+            event["localSymbol"] or event["symbol"],
+            event["action"],
+            event["orderType"],
+            event["qty"],
+            event["status"],
+            event["filled"],
+            event["remaining"],
+            event["avgFillPrice"],
         )
-        for c in chains:
-            dates = []
-            for d in c.expirations:
-                if isinstance(d, str):
-                    dates.append(d.strip())
-                else:
-                    dates.append(d.strftime('%Y%m%d'))
-            info_text.insert(tk.END, f"{c.tradingClass}: {', '.join(dates)}\n")
-        return
-
-    # === ATM STRIKE ===
-    atm_strike = min(chain.strikes, key=lambda s: abs(s - ul_price))
-    strike_entry.delete(0, tk.END)
-    strike_entry.insert(0, str(atm_strike))
-
-    expiry_entry.delete(0, tk.END)
-    expiry_entry.insert(0, expiry_input)
-
-    # === OPTION CONTRACT ===
-    opt = Option(
-        symbol=symbol,
-        lastTradeDateOrContractMonth=expiry_input,
-        strike=atm_strike,
-        right=right,
-        exchange='SMART',
-        currency='USD',
-        multiplier='100'
-    )
-    ib.qualifyContracts(opt)
-
-    opt_ticker = ib.reqTickers(opt)[0]
-    for _ in range(10):
-        bid = opt_ticker.bid
-        ask = opt_ticker.ask
-        if bid is not None and ask is not None:
-            break
-        ib.sleep(0.2)
-    else:
-        info_text.insert(tk.END, "❌ Не удалось получить цены опциона\n")
-        return
-
-    mid = round((bid + ask) / 2, 2)
-
-    # === OUTPUT ===
-    info_text.insert(
-        tk.END,
-        f"ATM {symbol} {expiry_input} {right} {atm_strike}\n"
-        f"Underlying: {round(ul_price, 2)}\n"
-        f"Bid: {bid}  Ask: {ask}  Mid: {mid}\n"
-        f"TradingClass: {chain.tradingClass}\n"
-    )
-
-# ================== GUI ==================
-root = tk.Tk()
-root.title("TWS API (Dark)")
-root.geometry("950x780")
-sv_ttk.set_theme("dark")
-
-root.columnconfigure(0, weight=1)
-root.rowconfigure(3, weight=1)
-
-# ===== HEADER =====
-header = ttk.Frame(root, padding=10)
-header.grid(row=0, column=0, sticky="ew")
-
-entry_symbol = tk.StringVar()
-
-for sym in ("NVDA", "NVDL", "TSLA", "TSLL", "SPX"):
-    ttk.Button(header, text=sym, command=lambda s=sym: entry_symbol.set(s)).pack(side="left", padx=5)
-
-ttk.Label(header, text="Ticker:").pack(side="left", padx=10)
-ttk.Entry(header, textvariable=entry_symbol, width=10).pack(side="left")
-
-# ===== ORDER PARAMS =====
-order_frame = ttk.LabelFrame(root, text="Order Parameters", padding=10)
-order_frame.grid(row=1, column=0, sticky="ew", padx=10)
-
-ttk.Label(order_frame, text="Qty").grid(row=0, column=0, sticky="e")
-qty_entry = ttk.Entry(order_frame, width=8)
-qty_entry.insert(0, "1")
-qty_entry.grid(row=0, column=1)
-
-ttk.Label(order_frame, text="Limit Price").grid(row=0, column=2, sticky="e")
-limit_price_entry = ttk.Entry(order_frame, width=6)
-limit_price_entry.insert(0, "100")
-limit_price_entry.grid(row=0, column=3)
-
-ttk.Label(order_frame, text="Trailing").grid(row=0, column=4, sticky="e")
-trailing_entry = ttk.Entry(order_frame, width=6)
-trailing_entry.insert(0, "3")
-trailing_entry.grid(row=0, column=5)
-
-option_var = tk.BooleanVar()
-ttk.Checkbutton(order_frame, text="Option", variable=option_var).grid(row=1, column=0)
-
-right_var = tk.StringVar(value="Call")
-ttk.Combobox(
-    order_frame,
-    textvariable=right_var,
-    values=("Call", "Put"),
-    width=6,
-    state="readonly"
-).grid(row=1, column=1)
-
-ttk.Label(order_frame, text="Strike").grid(row=1, column=2, sticky="e")
-strike_entry = ttk.Entry(order_frame, width=6)
-strike_entry.insert(0, "100")
-strike_entry.grid(row=1, column=3)
-
-ttk.Label(order_frame, text="Exp").grid(row=1, column=4, sticky="e")
-expiry_entry = ttk.Entry(order_frame, width=8)
-expiry_entry.insert(0, "20251219")
-expiry_entry.grid(row=1, column=5)
-
-# ===== ACTIONS =====
-actions = ttk.Frame(root, padding=10)
-actions.grid(row=2, column=0, sticky="ew")
-
-ttk.Button(actions, text="Get Price", command=lambda: get_price(build_contract())).pack(side="left", padx=5)
-ttk.Button(actions, text="Buy", command=buy_stock).pack(side="left", padx=5)
-ttk.Button(actions, text="Buy + Bracket", command=buy_bracket).pack(side="left", padx=5)
-ttk.Button(actions, text="Buy + Trailing", command=buy_trailing).pack(side="left", padx=5)
-ttk.Button(
-    actions,
-    text="ATM",
-    command=get_atm_option
-).pack(side="left", padx=5)
-
-
-# ===== ORDERS =====
-orders_frame = ttk.LabelFrame(root, text="Active Orders", padding=10)
-orders_frame.grid(row=3, column=0, sticky="nsew", padx=10, pady=10)
-
-orders_frame.rowconfigure(0, weight=1)
-orders_frame.columnconfigure(0, weight=1)
-
-orders_text = tk.Text(orders_frame, bg="#1e1e1e", fg="white")
-orders_text.grid(row=0, column=0, sticky="nsew")
-
-price_label = ttk.Label(root, font=("Segoe UI", 12))
-price_label.grid(row=4, column=0, sticky="w", padx=10)
-
-# ===== INFO =====
-info_frame = ttk.LabelFrame(root, text="ATM / Market Info", padding=10)
-info_frame.grid(row=5, column=0, sticky="ew", padx=10, pady=5)
-
-info_text = tk.Text(info_frame, height=4, bg="#1e1e1e", fg="lightgreen")
-info_text.pack(fill="both", expand=True)
-
-update_orders()
-root.mainloop()
+        iid = str(event["orderId"])
+        if self.order_rows.get(iid) == values:
+            return
+        if iid in self.order_rows:
+            self.orders_tree.item(iid, values=values)
+        else:
+            self.orders_tree.insert("", tk.END, iid=iid, text=iid, values=values)
+        self.order_rows[iid] = values
+
+    # ================== GUI ==================
+    def _build_ui(self):
+        root = self.root
+        root.title("TWS API (Dark)")
+        root.geometry("950x780")
+        sv_ttk.set_theme("dark")
+
+        root.columnconfigure(0, weight=1)
+        root.rowconfigure(3, weight=1)
+
+        # ===== HEADER =====
+        header = ttk.Frame(root, padding=10)
+        header.grid(row=0, column=0, sticky="ew")
+
+        self.entry_symbol = tk.StringVar()
+
+        for sym in DEFAULT_WATCHLIST:
+            ttk.Button(header, text=sym, command=lambda s=sym: self.entry_symbol.set(s)).pack(side="left", padx=5)
+
+        ttk.Label(header, text="Ticker:").pack(side="left", padx=10)
+        ttk.Entry(header, textvariable=self.entry_symbol, width=10).pack(side="left")
+
+        self.conn_label = ttk.Label(header)
+        self.conn_label.pack(side="right", padx=10)
+
+        # ===== ORDER PARAMS =====
+        order_frame = ttk.LabelFrame(root, text="Order Parameters", padding=10)
+        order_frame.grid(row=1, column=0, sticky="ew", padx=10)
+
+        ttk.Label(order_frame, text="Qty").grid(row=0, column=0, sticky="e")
+        self.qty_entry = ttk.Entry(order_frame, width=8)
+        self.qty_entry.insert(0, "1")
+        self.qty_entry.grid(row=0, column=1)
+
+        ttk.Label(order_frame, text="Limit Price").grid(row=0, column=2, sticky="e")
+        self.limit_price_entry = ttk.Entry(order_frame, width=6)
+        self.limit_price_entry.insert(0, "100")
+        self.limit_price_entry.grid(row=0, column=3)
+
+        ttk.Label(order_frame, text="Trailing").grid(row=0, column=4, sticky="e")
+        self.trailing_entry = ttk.Entry(order_frame, width=6)
+        self.trailing_entry.insert(0, "3")
+        self.trailing_entry.grid(row=0, column=5)
+
+        self.option_var = tk.BooleanVar()
+        ttk.Checkbutton(order_frame, text="Option", variable=self.option_var).grid(row=1, column=0)
+
+        self.right_var = tk.StringVar(value="Call")
+        ttk.Combobox(
+            order_frame,
+            textvariable=self.right_var,
+            values=("Call", "Put"),
+            width=6,
+            state="readonly"
+        ).grid(row=1, column=1)
+
+        ttk.Label(order_frame, text="Strike").grid(row=1, column=2, sticky="e")
+        self.strike_entry = ttk.Entry(order_frame, width=6)
+        self.strike_entry.insert(0, "100")
+        self.strike_entry.grid(row=1, column=3)
+
+        ttk.Label(order_frame, text="Exp").grid(row=1, column=4, sticky="e")
+        self.expiry_entry = ttk.Entry(order_frame, width=8)
+        self.expiry_entry.insert(0, "20251219")
+        self.expiry_entry.grid(row=1, column=5)
+
+        # ===== ACTIONS =====
+        actions = ttk.Frame(root, padding=10)
+        actions.grid(row=2, column=0, sticky="ew")
+
+        ttk.Button(actions, text="Get Price", command=self.get_price).pack(side="left", padx=5)
+        ttk.Button(actions, text="Buy", command=self.buy_stock).pack(side="left", padx=5)
+        ttk.Button(actions, text="Buy + Bracket", command=self.buy_bracket).pack(side="left", padx=5)
+        ttk.Button(actions, text="Buy + Trailing", command=self.buy_trailing).pack(side="left", padx=5)
+        ttk.Button(actions, text="ATM", command=self.get_atm_option).pack(side="left", padx=5)
+
+        # ===== ORDERS =====
+        orders_frame = ttk.LabelFrame(root, text="Active Orders", padding=10)
+        orders_frame.grid(row=3, column=0, sticky="nsew", padx=10, pady=10)
+
+        orders_frame.rowconfigure(0, weight=1)
+        orders_frame.columnconfigure(0, weight=1)
+
+        self.orders_tree = ttk.Treeview(orders_frame, columns=ORDER_COLUMNS, height=12)
+        self.orders_tree.heading("#0", text="OrderId")
+        self.orders_tree.column("#0", width=80, stretch=False)
+        for col in ORDER_COLUMNS:
+            self.orders_tree.heading(col, text=col.replace("_", " ").title())
+            self.orders_tree.column(col, width=90, anchor="e")
+        self.orders_tree.grid(row=0, column=0, sticky="nsew")
+
+        orders_scroll = ttk.Scrollbar(orders_frame, orient="vertical", command=self.orders_tree.yview)
+        orders_scroll.grid(row=0, column=1, sticky="ns")
+        self.orders_tree.configure(yscrollcommand=orders_scroll.set)
+
+        self.price_label = ttk.Label(root, font=("Segoe UI", 12))
+        self.price_label.grid(row=4, column=0, sticky="w", padx=10)
+
+        # ===== INFO =====
+        info_frame = ttk.LabelFrame(root, text="ATM / Market Info", padding=10)
+        info_frame.grid(row=5, column=0, sticky="ew", padx=10, pady=5)
+
+        self.info_text = tk.Text(info_frame, height=4, bg="#1e1e1e", fg="lightgreen")
+        self.info_text.pack(fill="both", expand=True)
+
+
+def main(host='127.0.0.1', port=7496, client_id=1):
+    # подключение и весь IB — в потоке IBWorker; Tk сразу рисует окно
+    worker = IBWorker(contract_db_path="data/contracts.sqlite")
+    root = tk.Tk()
+    app = TradingApp(root, worker)
+    worker.start(host, port, client_id)
+    app.pump_ui()
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import asyncio
+import time
+
+import pytest
+
+from bench.stub_ib import start_stub_worker
+
+
+def run(coro):
+    """
+    Вызов async-метода IBWorker из потока теста, как это делает API.
+    """
+    return asyncio.run(coro)
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture(scope="module")
+def worker():
+    # ордера исполняются через 10 мс после подтверждения
+    return start_stub_worker(latency=0.001, fill_delay=0.01)
+
+
+@pytest.fixture(scope="module")
+def resting_worker():
+    # ордера только подтверждаются и висят рабочими
+    return start_stub_worker(latency=0.001)
@@ -0,0 +1,61 @@
+import numpy as np
+
+from worker.algos import child_price, slice_targets, vwap_weights
+from worker.history import BAR_DTYPE
+
+
+def test_slice_targets_cumulative_and_exact():
+    targets = slice_targets(100, [1.0] * 3)
+
+    assert targets == [33, 67, 100]
+    assert slice_targets(7, [1.0] * 10)[-1] == 7
+    assert slice_targets(10, [0.0, 1.0, 3.0]) == [0, 3, 10]
+    assert all(a <= b for a, b in zip(targets, targets[1:]))
+
+
+def bars(day_starts, minutes_volume):
+    rows = [(day + minute * 60, 0, 0, 0, 0, volume)
+            for day in day_starts for minute, volume in minutes_volume.items()]
+    return np.array(rows, dtype=BAR_DTYPE)
+
+
+def test_vwap_weights_follow_intraday_volume():
+    start = 10 * 86400 + 14 * 3600  # 14:00 UTC
+    history = bars([start - 86400, start - 2 * 86400], {0: 100.0, 1: 100.0, 2: 300.0, 3: 300.0})
+
+    weights = vwap_weights(history, start, duration=240, slices=2)
+
+    assert weights[1] / weights[0] == 3.0
+
+
+def test_vwap_weights_floor_for_empty_slice():
+    start = 86400 * 5
+    history = bars([start - 86400], {0: 1000.0})
+
+    weights = vwap_weights(history, start, duration=240, slices=4)
+
+    assert (weights > 0).all()
+    assert weights[0] == weights.max()
+
+
+def test_vwap_weights_fall_back_to_twap():
+    start = 86400 * 5
+    assert vwap_weights(None, start, 600, 10) is None
+    # срез 30 с короче минутного бара
+    assert vwap_weights(bars([start - 86400], {0: 10.0}), start, 300, 10) is None
+    # в эти минуты дня объёма нет
+    assert vwap_weights(bars([start - 86400], {600: 10.0}), start, 300, 5) is None
+
+
+def test_child_price_modes_and_limit():
+    q = {"bid": 99.9, "ask": 100.1, "mid": 100.0, "last": 100.05}
+
+    assert child_price("BUY", q, "passive") == 99.9
+    assert child_price("BUY", q, "aggressive") == 100.1
+    assert child_price("SELL", q, "passive") == 100.1
+    assert child_price("SELL", q, "mid") == 100.0
+    assert child_price("BUY", q, "aggressive", limit_price=100.0) == 100.0
+    assert child_price("SELL", q, "aggressive", limit_price=100.0) == 100.0
+    empty = {"bid": None, "ask": None, "mid": None, "last": None}
+    assert child_price("BUY", empty, "passive", limit_price=99.0) == 99.0
+    assert child_price("BUY", empty, "passive") is None
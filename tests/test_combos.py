@@ -0,0 +1,52 @@
+import pytest
+from ib_insync import Contract
+
+from tests.test_option_chain import make_chain
+from worker.combos import build_bag, net_price, resolve_strikes, strategy_legs
+
+
+def quote(bid, ask):
+    return {"bid": bid, "ask": ask, "mid": (bid + ask) / 2 if bid is not None and ask is not None else None}
+
+
+def test_net_price_debit_and_credit():
+    legs = [("C", 100.0, 1, "BUY"), ("C", 105.0, 1, "SELL")]
+    quotes = [quote(2.0, 2.2), quote(0.8, 1.0)]
+
+    assert net_price(legs, quotes, "mid") == 1.2
+    assert net_price(legs, quotes, "natural") == 1.4  # 2.2 - 0.8
+    assert net_price(list(reversed(legs)), list(reversed(quotes))) == 1.2
+    assert net_price([("C", 105.0, 1, "SELL")], [quote(0.8, 1.0)]) == -0.9
+
+
+def test_net_price_ratio_and_missing_side():
+    legs = [("C", 100.0, 1, "BUY"), ("C", 105.0, 2, "SELL")]
+
+    assert net_price(legs, [quote(2.0, 2.2), quote(0.8, 1.0)]) == 0.3
+    assert net_price(legs, [quote(2.0, 2.2), quote(None, 1.0)], "natural") is None
+    with pytest.raises(ValueError):
+        net_price(legs, [quote(2.0, 2.2), quote(0.8, 1.0)], "last")
+
+
+def test_strategy_legs():
+    assert strategy_legs("call_vertical", width=2) == [("C", 0, 1, "BUY"), ("C", 2, 1, "SELL")]
+    assert strategy_legs(legs=[{"right": "p", "offset": -1, "action": "sell"}]) == [("P", -1, 1, "SELL")]
+    with pytest.raises(ValueError):
+        strategy_legs("butterfly")
+
+
+def test_resolve_strikes_from_atm():
+    atm, resolved = resolve_strikes(make_chain(), "NVDA", 101.0, strategy_legs("strangle"))
+
+    assert atm == 100
+    assert resolved == [("C", 102.5, 1, "BUY"), ("P", 97.5, 1, "BUY")]
+    with pytest.raises(ValueError):
+        resolve_strikes(make_chain(), "NVDA", 110.0, strategy_legs("call_vertical"))
+
+
+def test_build_bag():
+    options = [Contract(conId=11), Contract(conId=12)]
+    bag = build_bag("NVDA", options, [("C", 100.0, 1, "BUY"), ("C", 105.0, 1, "SELL")])
+
+    assert bag.secType == "BAG"
+    assert [(leg.conId, leg.action) for leg in bag.comboLegs] == [(11, "BUY"), (12, "SELL")]
@@ -0,0 +1,56 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from worker.greeks import black_price, chain_greeks, implied_vol, year_fraction
+
+
+def test_implied_vol_round_trip():
+    forward, t, discount = 100.0, 0.5, np.exp(-0.04 * 0.5)
+    strikes = np.array([70.0, 90.0, 100.0, 110.0, 140.0, 70.0, 100.0, 140.0])
+    is_call = np.array([True, True, True, True, True, False, False, False])
+    vols = np.array([0.45, 0.3, 0.25, 0.22, 0.3, 0.5, 0.25, 0.35])
+    prices = black_price(forward, strikes, t, discount, vols, is_call)
+
+    iv = implied_vol(prices, forward, strikes, t, discount, is_call)
+
+    np.testing.assert_allclose(iv, vols, rtol=1e-4)
+
+
+def test_implied_vol_nan_outside_arbitrage_bounds():
+    forward, t, discount = 100.0, 0.25, 1.0
+    strikes = np.array([90.0, 110.0, 100.0])
+    is_call = np.array([True, False, True])
+    # ниже внутренней стоимости, выше форварда, нет цены
+    prices = np.array([5.0, 120.0, np.nan])
+
+    assert np.isnan(implied_vol(prices, forward, strikes, t, discount, is_call)).all()
+
+
+def test_chain_greeks_black76_uses_parity_forward():
+    t, rate = 0.5, 0.04
+    discount = np.exp(-rate * t)
+    forward = 103.0  # не равен споту: форвард должен восстановиться из паритета
+    strikes = np.array([95.0, 100.0, 105.0, 95.0, 100.0, 105.0])
+    is_call = np.array([True, True, True, False, False, False])
+    prices = black_price(forward, strikes, t, discount, 0.3, is_call)
+
+    implied, result = chain_greeks(100.0, strikes, is_call, prices, t, rate, model="black76")
+
+    assert implied == pytest.approx(forward)
+    np.testing.assert_allclose(result["iv"], 0.3, rtol=1e-4)
+    assert (result["delta"][:3] > 0).all() and (result["delta"][3:] < 0).all()
+    np.testing.assert_allclose(result["delta"][:3] - result["delta"][3:], discount)
+
+
+def test_chain_greeks_unknown_model():
+    with pytest.raises(ValueError):
+        chain_greeks(100.0, np.array([100.0]), np.array([True]), np.array([5.0]), 0.5, model="sabr")
+
+
+def test_year_fraction_counts_to_new_york_close():
+    now = datetime.datetime(2099, 12, 17, 20, 0, tzinfo=datetime.timezone.utc)  # 15:00 в Нью-Йорке
+    assert year_fraction("20991217", now) == pytest.approx(3600 / (365 * 86400))
+    # после экспирации — не меньше минуты
+    assert year_fraction("20991216", now) == pytest.approx(60 / (365 * 86400))
@@ -0,0 +1,31 @@
+from worker.history import add_range, missing_ranges, split_range
+
+
+def test_add_range_merges_overlapping_and_adjacent():
+    ranges = add_range([], 10, 20)
+    ranges = add_range(ranges, 30, 40)
+    assert ranges == [(10, 20), (30, 40)]
+
+    assert add_range(ranges, 20, 30) == [(10, 40)]
+    assert add_range(ranges, 15, 35) == [(10, 40)]
+    assert add_range(ranges, 0, 5) == [(0, 5), (10, 20), (30, 40)]
+
+
+def test_missing_ranges():
+    ranges = [(10, 20), (30, 40)]
+
+    assert missing_ranges(ranges, 0, 50) == [(0, 10), (20, 30), (40, 50)]
+    assert missing_ranges(ranges, 12, 18) == []
+    assert missing_ranges(ranges, 15, 35) == [(20, 30)]
+    assert missing_ranges([], 5, 8) == [(5, 8)]
+
+
+def test_missing_after_add_is_empty():
+    ranges = []
+    for start, end in missing_ranges(ranges, 0, 100):
+        ranges = add_range(ranges, start, end)
+    assert missing_ranges(ranges, 0, 100) == []
+
+
+def test_split_range():
+    assert split_range(0, 25, 10) == [(0, 10), (10, 20), (20, 25)]
@@ -0,0 +1,72 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+from ib_insync import CommissionReport, Execution, Fill, Order, OrderStatus, Stock, Trade
+
+from worker.journal import Journal, JournalReader, ReplaySession, journal_files, replay
+
+
+def write_day(directory):
+    journal = Journal(str(directory), flush_interval=0.01)
+    contract = Stock("TSLA", "SMART", "USD", conId=1002)
+    journal.record_quote(SimpleNamespace(contract=contract, bid=99.5, ask=100.5, last=100.0, bidSize=3.0,
+                                         askSize=4.0, lastSize=1.0, volume=1000.0))
+    order = Order(orderId=7, clientId=1, action="BUY", totalQuantity=5, orderType="LMT", lmtPrice=100.0,
+                  account="DU1")
+    trade = Trade(contract=contract, order=order, orderStatus=OrderStatus(orderId=7, status="Submitted",
+                                                                          remaining=5))
+    journal.record_trade("new", trade)
+    journal.record_trade("status", trade)
+    execution = Execution(execId="e1", time=datetime.datetime.now(datetime.timezone.utc), shares=5.0,
+                          price=99.9, cumQty=5.0, avgPrice=99.9, orderId=7, clientId=1)
+    fill = Fill(contract, execution, CommissionReport(), execution.time)
+    trade.orderStatus.status, trade.orderStatus.filled, trade.orderStatus.remaining = "Filled", 5.0, 0.0
+    journal.record_trade("fill", trade, fill)
+    journal.record_commission(trade, fill, CommissionReport(execId="e1", commission=1.25, realizedPNL=0.0))
+    journal.record_trade("status", trade)
+    journal.close()
+    return journal_files(str(directory))
+
+
+def test_write_read_round_trip(tmp_path):
+    files = write_day(tmp_path)
+
+    assert len(files) == 1
+    reader = JournalReader(files[0])
+    assert len(reader) == 6
+    assert reader.contract(1002).symbol == "TSLA"
+    assert list(reader.records["order_id"][1:]) == [7] * 5
+
+
+def test_replay_into_isolated_session(tmp_path):
+    reader = JournalReader(write_day(tmp_path)[0])
+    session = ReplaySession()
+    events = []
+    session.events.subscribe(events.append)
+    fills = []
+
+    def on_trade(kind, trade, fill=None):
+        session.on_trade(kind, trade, fill)
+        if fill is not None:
+            fills.append(fill)
+
+    count = asyncio.run(replay(reader, session.on_quote, on_trade, speed=None))
+
+    assert count == 6
+    assert all(e["replay"] for e in events)
+    assert session.quotes[1002]["mid"] == 100.0
+    order = session.orders.get(7)
+    assert (order["status"], order["filled"], order["lmtPrice"]) == ("Filled", 5.0, 100.0)
+    # комиссия дописывается в уже выданный Fill
+    assert fills[0].commissionReport.commission == 1.25
+
+
+def test_replay_kinds_filter(tmp_path):
+    reader = JournalReader(write_day(tmp_path)[0])
+    session = ReplaySession()
+
+    asyncio.run(replay(reader, session.on_quote, session.on_trade, speed=None, kinds=["quote"]))
+
+    assert list(session.quotes) == [1002]
+    assert len(session.orders) == 0
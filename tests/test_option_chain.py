@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+from worker.option_chain import OptionChain
+
+
+def make_chain():
+    return OptionChain("NVDA", [
+        SimpleNamespace(tradingClass="NVDA", multiplier="100", exchange="SMART",
+                        expirations=["20991217", "20991119"], strikes=[90, 95, 100, 105, 110]),
+        SimpleNamespace(tradingClass="NVDA", multiplier="100", exchange="CBOE",
+                        expirations=["20991217"], strikes=[97.5, 102.5]),
+        SimpleNamespace(tradingClass="NVDW", multiplier="100", exchange="SMART",
+                        expirations=["20991105"], strikes=[99, 100, 101]),
+    ])
+
+
+def test_exchanges_merged_per_trading_class():
+    chain = make_chain()
+
+    assert chain.classes["NVDA"].strikes == [90, 95, 97.5, 100, 102.5, 105, 110]
+    assert chain.classes["NVDA"].exchanges == ["SMART", "CBOE"]
+    assert chain.expirations == ["20991105", "20991119", "20991217"]
+
+
+def test_atm_strike_by_right():
+    chain = make_chain()
+
+    assert chain.atm_strike(101.0, "C", "NVDA") == 102.5
+    assert chain.atm_strike(101.0, "P", "NVDA") == 100
+    assert chain.atm_strike(101.0, None, "NVDA") == 100
+    assert chain.atm_strike(100.0, "C", "NVDA") == 100
+    assert chain.atm_strike(100.0, "P", "NVDA") == 100
+
+
+def test_atm_strike_outside_chain_clamps():
+    chain = make_chain()
+
+    assert chain.atm_strike(500.0, "C", "NVDA") == 110
+    assert chain.atm_strike(1.0, "P", "NVDA") == 90
+
+
+def test_nearest_strikes():
+    chain = make_chain()
+
+    assert chain.nearest_strikes(101.0, 3, "NVDA") == [97.5, 100, 102.5]
+    assert chain.nearest_strikes(89.0, 2, "NVDA") == [90, 95]
+    assert chain.nearest_strikes(120.0, 2, "NVDA") == [105, 110]
+    assert chain.nearest_strikes(100.0, 50, "NVDW") == [99, 100, 101]
+
+
+def test_strikes_between():
+    chain = make_chain()
+
+    assert chain.strikes_between(95, 102.5, "NVDA") == [95, 97.5, 100, 102.5]
+    assert chain.strikes_between(96, 101, "NVDA") == [97.5, 100]
+    assert chain.strikes_between(111, 120, "NVDA") == []
+    assert chain.strikes_between(0, 1000, "NVDW") == [99, 100, 101]
+
+
+def test_strike_offset():
+    chain = make_chain()
+
+    assert chain.strike_offset(100, 1, "NVDA") == 102.5
+    assert chain.strike_offset(100, -2, "NVDA") == 95
+    assert chain.strike_offset(110, 1, "NVDA") is None
+
+
+def test_resolve_expiry():
+    chain = make_chain()
+
+    assert chain.resolve_expiry("20991119")[0] == "20991119"
+    expiry, chain_class = chain.resolve_expiry("20991105")
+    assert chain_class.trading_class == "NVDW"
+    # неизвестная дата — ближайшая доступная
+    assert chain.resolve_expiry("20000101")[0] == "20991105"
@@ -0,0 +1,33 @@
+from worker.order_store import OrderStore
+
+
+def event(order_id=1, perm_id=0, status="Submitted", kind="status", symbol="TSLA", client_id=1, time=1.0):
+    return {"type": kind, "orderId": order_id, "permId": perm_id, "parentId": 0, "clientId": client_id,
+            "symbol": symbol, "status": status, "filled": 0.0, "remaining": 1.0, "time": time}
+
+
+def test_apply_returns_delta_and_skips_duplicates():
+    store = OrderStore()
+    assert store.apply(event(kind="new", status="PendingSubmit"))["status"] == "PendingSubmit"
+    delta = store.apply(event(perm_id=555))
+    assert delta["status"] == "Submitted" and delta["permId"] == 555
+    assert store.apply(event(perm_id=555, time=2.0)) is None
+    assert store.get(1)["status"] == "Submitted"
+    assert store.by_perm_id(555)["orderId"] == 1
+    assert [r["orderId"] for r in store.query(symbol="tsla", active=True)] == [1]
+
+
+def test_by_perm_id_after_rekey():
+    store = OrderStore()
+    # ордер из TWS: сначала без orderId, потом привязан к API-клиенту
+    store.apply(event(order_id=0, perm_id=777, client_id=0, kind="open"))
+    assert store.by_perm_id(777)["orderId"] == 0
+
+    delta = store.apply(event(order_id=42, perm_id=777, status="Filled"))
+    assert delta["orderId"] == 42 and delta["status"] == "Filled"
+    assert len(store) == 1
+    assert store.by_perm_id(777)["orderId"] == 42
+    assert store.get(42)["status"] == "Filled"
+    assert store.query(status="Submitted") == []
+    assert [r["orderId"] for r in store.query(active=False)] == [42]
+    assert store.by_perm_id(778) is None
@@ -0,0 +1,82 @@
+import pytest
+
+from tests.conftest import run, wait_until
+from worker.risk import RiskRejected
+
+
+def test_single_order_fills(worker):
+    trade = run(worker.place_order_async("TSLA", 2, 100.0))
+
+    assert trade.order.orderId > 0
+    assert wait_until(lambda: trade.orderStatus.status == "Filled")
+    assert wait_until(lambda: run(worker.get_orders_async(status="Filled")) != [])
+    order = next(o for o in run(worker.get_orders_async("TSLA")) if o["orderId"] == trade.order.orderId)
+    assert order["filled"] == 2.0
+    assert order["avgFillPrice"] == 100.0
+
+
+def test_sell_order_keeps_action(worker):
+    trade = run(worker.place_order_async("NVDA", 1, 101.0, action="SELL"))
+
+    assert trade.order.action == "SELL"
+    assert wait_until(lambda: trade.orderStatus.status == "Filled")
+
+
+def test_unqualified_contract_is_not_placed(worker, monkeypatch):
+    async def not_found(contracts, priority=None):
+        return [None] * len(contracts)
+
+    monkeypatch.setattr(worker, "_qualify_many_async", not_found)
+    placed = len(worker.ib.trades())
+
+    assert run(worker.place_order_async("NOPE", 1, 10.0)) == {"error": "Contract NOPE not found"}
+    assert len(worker.ib.trades()) == placed
+
+
+def test_bracket_links_exits_to_entry(worker):
+    result = run(worker.place_bracket_async("NVDA", 3, 100.0, stop_offset=3.0, take_profit_offset=5.0))
+
+    assert result["acked"]
+    assert (result["stopPrice"], result["takeProfitPrice"]) == (97.0, 105.0)
+    trades = {t.order.orderId: t for t in worker.ib.trades()}
+    parent_id = result["parentOrderId"]
+    assert trades[result["stopOrderId"]].order.parentId == parent_id
+    assert trades[result["takeProfitOrderId"]].order.parentId == parent_id
+    assert trades[result["stopOrderId"]].order.action == "SELL"
+
+
+def test_option_bracket_rounds_to_min_tick(worker):
+    result = run(worker.place_bracket_async("TSLA", 1, 1.03, stop_offset=0.31, take_profit_offset=0.49,
+                                            is_option=True, expiry="20991217", strike=100.0, right="C"))
+
+    assert result["minTick"] == 0.05
+    assert (result["stopPrice"], result["takeProfitPrice"]) == (0.7, 1.5)
+
+
+def test_bulk_places_every_item(worker):
+    items = [{"symbol": s, "qty": 1, "limit_price": 100.0, "action": a}
+             for s in ("NVDA", "TSLA") for a in ("BUY", "SELL")]
+    result = run(worker.place_orders_bulk_async(items))
+
+    assert [r["index"] for r in result["results"]] == [0, 1, 2, 3]
+    assert all(r["acked"] and len(r["orderIds"]) == 1 for r in result["results"])
+    order_ids = [r["orderIds"][0] for r in result["results"]]
+    assert len(set(order_ids)) == len(order_ids)
+
+
+def test_risk_counts_working_orders_across_bulk_items(resting_worker):
+    run(resting_worker.set_risk_limits_async("TSLL", max_position=10))
+    items = [{"symbol": "TSLL", "qty": 4, "limit_price": 10.0}] * 3
+    results = run(resting_worker.place_orders_bulk_async(items))["results"]
+
+    assert "orderIds" in results[0] and "orderIds" in results[1]
+    assert results[2]["rule"] == "max_position"
+    assert resting_worker.risk.reserved("TSLL") == 8.0
+
+    # снятый ордер освобождает резерв, и следующий ордер проходит
+    run(resting_worker.cancel_order_async(results[0]["orderIds"][0]))
+    assert wait_until(lambda: resting_worker.risk.reserved("TSLL") == 4.0)
+    trade = run(resting_worker.place_order_async("TSLL", 6, 10.0))
+    assert trade.order.totalQuantity == 6
+    with pytest.raises(RiskRejected):
+        run(resting_worker.place_order_async("TSLL", 1, 10.0))
@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+
+import pytest
+from ib_insync import Stock
+
+from worker.risk import (OrderCheck, RiskEngine, RiskLimits, RiskRejected, check_max_notional, check_max_position,
+                         check_max_qty, check_price_band)
+
+QUOTE = {"bid": 99.0, "ask": 101.0, "mid": 100.0, "last": 100.0}
+
+
+def order_check(action="BUY", qty=10, price=100.0, position=0.0, reserved=0.0, quote=QUOTE, **limits):
+    contract = Stock("TSLA", "SMART", "USD")
+    return OrderCheck(contract, action, qty, price, RiskLimits(**limits), position, quote, reserved)
+
+
+def test_max_qty():
+    assert check_max_qty(order_check(qty=10, max_qty=10)) is None
+    assert "fat-finger" in check_max_qty(order_check(qty=11, max_qty=10))
+    assert check_max_qty(order_check(qty=10**6)) is None
+
+
+def test_max_notional_uses_quote_without_price():
+    assert check_max_notional(order_check(qty=10, price=100.0, max_notional=1000)) is None
+    assert check_max_notional(order_check(qty=11, price=100.0, max_notional=1000))
+    assert check_max_notional(order_check(qty=11, price=None, max_notional=1000))
+    assert check_max_notional(order_check(qty=11, price=None, quote=None, max_notional=1000)) is None
+
+
+def test_max_position():
+    assert check_max_position(order_check(qty=10, position=0, max_position=10)) is None
+    assert check_max_position(order_check(qty=5, position=6, max_position=10))
+    assert check_max_position(order_check("SELL", qty=25, position=10, max_position=10))
+    # сокращение позиции сверх лимита разрешено
+    assert check_max_position(order_check("SELL", qty=5, position=20, max_position=10)) is None
+
+
+def test_max_position_counts_reserved_working_qty():
+    assert check_max_position(order_check(qty=4, position=2, reserved=4, max_position=10)) is None
+    assert check_max_position(order_check(qty=4, position=2, reserved=5, max_position=10))
+    # рабочая продажа уменьшает проекцию покупки
+    assert check_max_position(order_check(qty=10, position=5, reserved=-5, max_position=10)) is None
+
+
+def test_price_band():
+    assert check_price_band(order_check(price=104.0, price_band=0.05)) is None
+    assert "away from last" in check_price_band(order_check(price=106.0, price_band=0.05))
+    assert check_price_band(order_check(price=106.0, quote=None, price_band=0.05)) is None
+
+
+def engine(position=0.0, **kwargs):
+    account = SimpleNamespace(position_qty=lambda symbol, sec_type="STK": position)
+    market_data = SimpleNamespace(get=lambda con_id: None)
+    return RiskEngine(account, market_data, **kwargs)
+
+
+def event(order_id, status, execution=None):
+    e = {"orderId": order_id, "status": status}
+    if execution is not None:
+        e["execution"] = execution
+    return e
+
+
+def test_engine_rejects_with_rule_and_counts():
+    risk = engine(default_limits=RiskLimits(max_qty=5))
+    risk.set_limits("NVDA", max_qty=50)
+
+    with pytest.raises(RiskRejected) as e:
+        risk.check(Stock("TSLA", "SMART", "USD"), "BUY", 6, 100.0)
+    assert e.value.rule == "max_qty"
+    risk.check(Stock("NVDA", "SMART", "USD"), "BUY", 6, 100.0)
+    assert risk.stats()["rules"]["max_qty"]["rejected"] == 1
+
+
+def test_engine_max_orders_per_sec():
+    risk = engine(max_orders_per_sec=2)
+    contract = Stock("TSLA", "SMART", "USD")
+    risk.check(contract, "BUY", 1, 100.0)
+    risk.check(contract, "BUY", 1, 100.0)
+    with pytest.raises(RiskRejected) as e:
+        risk.check(contract, "BUY", 1, 100.0)
+    assert e.value.rule == "max_orders_per_sec"
+
+
+def test_engine_reservation_lifecycle():
+    risk = engine(default_limits=RiskLimits(max_position=10))
+    contract = Stock("TSLA", "SMART", "USD")
+
+    first = risk.check(contract, "BUY", 6, 100.0)
+    risk.bind(first, 1)
+    with pytest.raises(RiskRejected):
+        risk.check(contract, "BUY", 5, 100.0)
+
+    risk.apply(event(1, "Submitted", {"execId": "e1", "shares": 2.0}))
+    risk.apply(event(1, "Submitted", {"execId": "e1", "shares": 2.0}))  # повтор не считается
+    assert risk.reserved("TSLA") == 4.0
+
+    # ордер, так и не ушедший в TWS
+    second = risk.check(contract, "SELL", 3, 100.0)
+    assert risk.reserved("TSLA") == 1.0
+    risk.release(second)
+    assert risk.reserved("TSLA") == 4.0
+
+    risk.apply(event(1, "Cancelled"))
+    assert risk.reserved("TSLA") == 0.0
+    assert risk.stats()["workingOrders"] == 0
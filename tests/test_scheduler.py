@@ -0,0 +1,63 @@
+import asyncio
+
+from worker.scheduler import PRIORITY_ORDER, PRIORITY_QUOTE, PRIORITY_REFERENCE, RequestScheduler
+
+
+def test_burst_granted_without_waiting():
+    async def main():
+        scheduler = RequestScheduler(rate=100.0, burst=5)
+        for _ in range(5):
+            await scheduler.acquire(PRIORITY_QUOTE)
+        return scheduler.stats()
+
+    stats = asyncio.run(main())
+    assert stats["classes"]["quote"]["granted"] == 5
+    assert stats["classes"]["quote"]["waited"] == 0
+
+
+def test_waiting_requests_served_by_priority():
+    async def main():
+        scheduler = RequestScheduler(rate=200.0, burst=1)
+        await scheduler.acquire(PRIORITY_REFERENCE)  # бакет пуст
+        served = []
+
+        async def request(name, priority):
+            await scheduler.acquire(priority)
+            served.append(name)
+
+        tasks = [asyncio.create_task(request(name, priority)) for name, priority in (
+            ("reference", PRIORITY_REFERENCE), ("quote", PRIORITY_QUOTE), ("order", PRIORITY_ORDER),
+            ("order2", PRIORITY_ORDER),
+        )]
+        await asyncio.sleep(0)  # все встали в очередь
+        depth = scheduler.depth()
+        await asyncio.gather(*tasks)
+        return served, depth
+
+    served, depth = asyncio.run(main())
+    assert depth == {"order": 2, "quote": 1, "reference": 1}
+    assert served == ["order", "order2", "quote", "reference"]
+
+
+def test_cancelled_waiter_does_not_take_tokens():
+    async def main():
+        scheduler = RequestScheduler(rate=200.0, burst=1)
+        await scheduler.acquire()
+        waiter = asyncio.create_task(scheduler.acquire(PRIORITY_ORDER))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await scheduler.acquire(PRIORITY_REFERENCE)
+        return scheduler.stats()
+
+    stats = asyncio.run(main())
+    assert stats["classes"]["order"]["granted"] == 0
+    assert stats["classes"]["reference"]["granted"] == 2
+
+
+def test_cost_above_capacity_taken_in_parts():
+    async def main():
+        scheduler = RequestScheduler(rate=500.0, burst=2)
+        await scheduler.acquire(PRIORITY_ORDER, cost=5)
+        return scheduler.stats()
+
+    assert asyncio.run(main())["classes"]["order"]["granted"] == 3
@@ -0,0 +1,62 @@
+import queue
+
+import pytest
+
+from bench.stub_ib import start_stub_worker
+from tests.conftest import run, wait_until
+
+
+def test_atm_option(worker):
+    result = run(worker.get_atm_option_async("NVDA", "C"))
+
+    assert result["expiry"] == "20991217"
+    assert result["underlying"] == 100.0
+    assert result["atm_strike"] == 100.0
+    assert result["bid"] < result["mid"] < result["ask"]
+
+
+def test_atm_options_batch_keeps_order(worker):
+    results = run(worker.get_atm_options_async([("TSLA", "P", None), ("NVDA", "C", None)]))
+
+    assert [(r["symbol"], r["right"]) for r in results] == [("TSLA", "P"), ("NVDA", "C")]
+    assert all(r["atm_strike"] == 100.0 for r in results)
+
+
+def test_atm_unknown_expiry_falls_back_to_nearest(worker):
+    result = run(worker.get_atm_option_async("NVDA", "P", "20000101"))
+
+    assert result["expiry"] == "20991217"
+
+
+def test_greeks_bad_model_rejected_before_tws(worker):
+    before = dict(worker.ib.requests)
+    with pytest.raises(ValueError):
+        run(worker.option_chain_greeks_async("NVDA", model="sabr"))
+    assert worker.ib.requests == before
+
+
+def test_replay_refused_while_connected(worker):
+    result = run(worker.start_replay_async())
+
+    assert "error" in result
+
+
+def test_reconnect_resync_is_quiet():
+    worker = start_stub_worker(latency=0.001)
+    trade = run(worker.place_order_async("TSLA", 1, 90.0))
+    assert wait_until(lambda: trade.orderStatus.status == "Submitted")
+    events = queue.Queue()
+    worker.subscribe_order_events(events.put_nowait)
+
+    # переподключение идёт дольше таймаута ожидания
+    worker.ib.latency = 0.2
+    worker.loop.call_soon_threadsafe(worker.ib.disconnect)
+    assert wait_until(lambda: not worker._is_ready())
+    assert run(worker.wait_ready_async(0.01)) is False
+    errors = [line for line in worker.metrics_text().splitlines() if line.startswith("ibworker_call_errors_total{")]
+    assert not any("wait_ready_loop" in line for line in errors)
+
+    assert run(worker.wait_ready_async(5))
+    assert worker.reconnects == 1
+    # ордер уже в сторе и не менялся — повторного "open" нет
+    assert events.empty()
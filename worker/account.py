@@ -0,0 +1,117 @@
+import math
+from collections import defaultdict
+
+
+def _num(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+def _pnl_dict(pnl):
+    return {
+        "dailyPnL": _num(pnl.dailyPnL),
+        "unrealizedPnL": _num(pnl.unrealizedPnL),
+        "realizedPnL": _num(pnl.realizedPnL),
+    }
+
+
+class AccountModel:
+    """
+    Состояние счетов по push-событиям TWS: значения счёта по (tag, currency),
+    позиции по conId, PnL по счёту и по позиции. Все чтения — словари, O(1).
+    Обновляется в loop IBWorker.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._values = defaultdict(dict)       # account -> (tag, currency) -> value
+        self._positions = defaultdict(dict)    # account -> conId -> position dict
+        self._symbol_qty = defaultdict(float)  # (symbol, secType) -> позиция по всем счетам
+        self._pnl = {}                         # account -> pnl dict
+        self._pnl_single = {}                  # (account, conId) -> pnl dict
+
+    # --- события ---
+
+    def on_account_value(self, v):
+        value = _num(v.value)
+        self._values[v.account][(v.tag, v.currency)] = v.value if value is None else value
+
+    def on_position(self, p):
+        self._set_position(p.account, p.contract, p.position, avgCost=p.avgCost)
+
+    def on_portfolio(self, item):
+        self._set_position(
+            item.account, item.contract, item.position, avgCost=item.averageCost,
+            marketPrice=_num(item.marketPrice), marketValue=_num(item.marketValue),
+            unrealizedPnL=_num(item.unrealizedPNL), realizedPnL=_num(item.realizedPNL)
+        )
+
+    def _set_position(self, account, contract, qty, **fields):
+        positions = self._positions[account]
+        prev = positions.get(contract.conId)
+        if prev is not None:
+            self._symbol_qty[(prev["symbol"], prev["secType"])] -= prev["position"]
+
+        record = dict(prev or {}, account=account, conId=contract.conId, symbol=contract.symbol,
+                      localSymbol=contract.localSymbol, secType=contract.secType, position=float(qty))
+        record.update(fields)
+        if qty:
+            positions[contract.conId] = record
+            self._symbol_qty[(contract.symbol, contract.secType)] += float(qty)
+        else:
+            positions.pop(contract.conId, None)
+
+    def on_pnl(self, pnl):
+        self._pnl[pnl.account] = _pnl_dict(pnl)
+
+    def on_pnl_single(self, pnl):
+        record = _pnl_dict(pnl)
+        record["value"] = _num(pnl.value)
+        self._pnl_single[(pnl.account, pnl.conId)] = record
+
+    # --- чтение ---
+
+    def accounts(self):
+        return sorted(set(self._values) | set(self._positions))
+
+    def value(self, account, tag, currency=None):
+        values = self._values.get(account)
+        if not values:
+            return None
+        if currency is not None:
+            return values.get((tag, currency))
+        for cur in ("USD", "BASE", ""):
+            if (tag, cur) in values:
+                return values[(tag, cur)]
+        return None
+
+    def summary(self, account):
+        values = self._values.get(account, {})
+        return {f"{tag}:{cur}" if cur else tag: v for (tag, cur), v in values.items()}
+
+    def positions(self, account=None):
+        accounts = [account] if account else list(self._positions)
+        result = []
+        for acc in accounts:
+            for con_id, pos in self._positions.get(acc, {}).items():
+                result.append(dict(pos, pnl=self._pnl_single.get((acc, con_id))))
+        return result
+
+    def position_qty(self, symbol, sec_type="STK"):
+        """
+        Суммарная позиция по символу и типу инструмента по всем счетам.
+        """
+        return self._symbol_qty.get((symbol, sec_type), 0.0)
+
+    def pnl(self, account=None):
+        if account:
+            return self._pnl.get(account)
+        return dict(self._pnl)
+
+    def position_keys(self):
+        return [(acc, con_id) for acc, positions in self._positions.items() for con_id in positions]
@@ -0,0 +1,370 @@
+import asyncio
+import time
+
+import numpy as np
+from ib_insync import Order
+
+from worker.order_groups import PENDING_STATUSES
+from worker.order_store import DONE_STATUSES
+
+ALGO_TYPES = ("twap", "vwap", "iceberg")
+
+# passive — своя сторона стакана (BUY по bid), mid — середина,
+# aggressive — пересечь спред (BUY по ask)
+CHILD_PRICE_MODES = ("passive", "mid", "aggressive")
+
+
+def slice_targets(qty, weights):
+    """
+    Накопленные целые цели по срезам: сколько должно быть исполнено
+    к концу каждого среза. Последняя цель — ровно qty.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    cum = np.cumsum(weights) / weights.sum()
+    targets = np.floor(qty * cum + 0.5).astype(np.int64)
+    targets[-1] = qty
+    return targets.tolist()
+
+
+def vwap_weights(bars, start, duration, slices, bar_seconds=60):
+    """
+    Веса срезов по историческому объёму в те же минуты дня: срез i
+    получает объём всех баров, попавших в [start + i*step, start + (i+1)*step)
+    по времени суток за все дни из bars. None — объёма нет или срез
+    короче бара (торгуем TWAP).
+    """
+    if bars is None or not len(bars) or duration / slices < bar_seconds:
+        return None
+    offset = (bars["time"] - start) % 86400
+    mask = offset < duration
+    if not mask.any():
+        return None
+    index = np.minimum((offset[mask] * slices // duration).astype(np.int64), slices - 1)
+    volume = np.nan_to_num(bars["volume"][mask])
+    weights = np.bincount(index, weights=volume, minlength=slices)
+    if weights.sum() <= 0:
+        return None
+    # срез без истории не пропускаем совсем — иначе он ничего не купит
+    return np.maximum(weights, weights.sum() * 0.01 / slices)
+
+
+def child_price(action, quote, mode="passive", limit_price=None):
+    """
+    Лимитная цена дочернего ордера от текущей котировки, не хуже
+    limit_price родителя. None — нет ни котировки, ни лимита.
+    """
+    buy = action == "BUY"
+    if mode == "passive":
+        price = quote["bid"] if buy else quote["ask"]
+    elif mode == "mid":
+        price = quote["mid"]
+    else:
+        price = quote["ask"] if buy else quote["bid"]
+    if price is None:
+        price = quote["last"]
+    if price is None:
+        return limit_price
+    if limit_price is not None:
+        price = min(price, limit_price) if buy else max(price, limit_price)
+    return round(price, 2)
+
+
+class AlgoJob:
+    """
+    Состояние одного алгоритмического родителя: расписание, дочерние
+    ордера, исполнения и проскальзывание от цены прибытия. Живёт в loop
+    IBWorker: apply() зовётся из событий ордеров, notify() — из линии
+    котировок, обе будят задачу исполнения, ждущую в wait().
+    """
+
+    def __init__(self, job_id, algo, contract, action, qty, duration=300.0, slices=10, display_qty=None,
+                 price_mode="passive", limit_price=None, reprice_interval=1.0):
+        self.id = job_id
+        self.algo = algo
+        self.contract = contract
+        self.action = action
+        self.qty = qty
+        self.duration = duration
+        self.slices = slices
+        self.display_qty = display_qty
+        self.price_mode = price_mode
+        self.limit_price = limit_price
+        self.reprice_interval = reprice_interval
+        self.status = "pending"
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.arrival = None  # mid (или last) в момент старта
+        self.quote = None  # последний снимок линии
+        self.targets = []  # накопленные цели по срезам
+        self.next_slice = 0
+        self.profile = None  # "vwap" / "uniform"
+        self.children = {}  # orderId -> Trade
+        self.working = None  # Trade текущего дочернего ордера
+        self.working_mode = None
+        self.repriced_at = 0.0
+        self.cancel_requested = set()  # orderId, снятые самой задачей
+        self.fills = {}  # execId -> (shares, price)
+        self.reservation = None  # резерв RiskEngine на остаток родителя
+        self._changed = False
+        self._waiter = None
+        self.task = None
+
+    # --- события ---
+
+    def notify(self):
+        self._changed = True
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def apply(self, event):
+        """
+        Событие ордера (worker.events.trade_event) дочернего ордера.
+        """
+        execution = event.get("execution")
+        if execution is not None:
+            self.fills[execution["execId"]] = (execution["shares"], execution["price"])
+        if self.working is not None and self.working.order.orderId == event["orderId"] \
+                and event["status"] in DONE_STATUSES:
+            self.working = None
+            # отказ TWS или чужая отмена — не перевыставляем вслепую
+            if event["status"] != "Filled" and event["orderId"] not in self.cancel_requested:
+                self.error = f"Child order {event['orderId']} {event['status']}"
+        self.notify()
+
+    def check(self):
+        if self.error:
+            raise RuntimeError(self.error)
+
+    async def wait(self, timeout):
+        """
+        Ждёт события ордера или котировки не дольше timeout. Не через
+        wait_for: тот теряет отмену задачи, если событие пришло в том же
+        шаге loop.
+        """
+        if timeout is not None and timeout <= 0:
+            return
+        if not self._changed:
+            loop = asyncio.get_running_loop()
+            self._waiter = waiter = loop.create_future()
+            timer = loop.call_later(timeout, lambda: waiter.done() or waiter.set_result(None)) \
+                if timeout is not None else None
+            try:
+                await waiter
+            finally:
+                self._waiter = None
+                if timer is not None:
+                    timer.cancel()
+        self._changed = False
+
+    # --- учёт ---
+
+    @property
+    def filled(self):
+        return sum(shares for shares, _ in self.fills.values())
+
+    @property
+    def avg_price(self):
+        filled = self.filled
+        if not filled:
+            return None
+        return sum(shares * price for shares, price in self.fills.values()) / filled
+
+    @property
+    def working_qty(self):
+        if self.working is None:
+            return 0
+        return max(float(self.working.order.totalQuantity) - float(self.working.orderStatus.filled), 0)
+
+    @property
+    def remaining(self):
+        return max(self.qty - self.filled, 0)
+
+    @property
+    def active(self):
+        return self.status in ("pending", "running")
+
+    def slippage_bps(self):
+        """
+        Проскальзывание средней цены от цены прибытия, б.п.; положительное — хуже.
+        """
+        avg = self.avg_price
+        if avg is None or not self.arrival:
+            return None
+        sign = 1 if self.action == "BUY" else -1
+        return round(sign * (avg - self.arrival) / self.arrival * 1e4, 2)
+
+    def summary(self):
+        avg = self.avg_price
+        return {
+            "id": self.id,
+            "algo": self.algo,
+            "symbol": self.contract.symbol,
+            "conId": self.contract.conId,
+            "action": self.action,
+            "qty": self.qty,
+            "filled": self.filled,
+            "remaining": self.remaining,
+            "working": self.working_qty,
+            "progress": round(self.filled / self.qty, 4) if self.qty else 1.0,
+            "status": self.status,
+            "reason": self.error,
+            "priceMode": self.price_mode,
+            "limitPrice": self.limit_price,
+            "duration": self.duration,
+            "slices": len(self.targets) or self.slices,
+            "nextSlice": self.next_slice,
+            "displayQty": self.display_qty,
+            "profile": self.profile,
+            "arrivalPrice": self.arrival,
+            "avgPrice": round(avg, 4) if avg is not None else None,
+            "slippageBps": self.slippage_bps(),
+            "childOrders": len(self.children),
+            "orderIds": list(self.children),
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class AlgoRunner:
+    """
+    Исполнение одной AlgoJob поверх операций IBWorker:
+    place(job, order) -> Trade выставляет дочерний ордер (с уже выданным
+    orderId — переставляет цену), cancel(order) снимает его, quote() —
+    текущий снимок линии котировок, publish(job) — сводка изменилась.
+    Работает в loop IBWorker.
+    """
+
+    def __init__(self, job, place, cancel, quote, publish, ack_timeout=5.0):
+        self.job = job
+        self.place = place
+        self.cancel = cancel
+        self.quote = quote
+        self.publish = publish
+        self.ack_timeout = ack_timeout
+
+    async def run(self):
+        job = self.job
+        job.status = "running"
+        job.started = time.time()
+        self.publish(job)
+        try:
+            if job.algo == "iceberg":
+                await self._run_iceberg()
+            else:
+                await self._run_sliced()
+            job.status = "done" if job.remaining <= 0 else "incomplete"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            await self._cancel_child()
+        except Exception as e:
+            job.status = "error"
+            job.error = job.error or repr(e)
+            await self._cancel_child()
+        finally:
+            job.finished = time.time()
+
+    async def _run_sliced(self):
+        """
+        TWAP/VWAP: в начале каждого среза недоисполненный дочерний ордер
+        снимается, а новый добирает до накопленной цели — отставание
+        переносится вперёд. Последний срез пересекает спред.
+        """
+        job = self.job
+        step = job.duration / len(job.targets)
+        for i, target in enumerate(job.targets):
+            job.next_slice = i
+            await self._cancel_child()
+            want = int(target - job.filled - job.working_qty)
+            if want > 0 and job.working is None:
+                last = i == len(job.targets) - 1
+                await self._child(want, "aggressive" if last else job.price_mode)
+            await self._work(job.started + (i + 1) * step)
+        job.next_slice = len(job.targets)
+        await self._work(time.time() + self.ack_timeout, until_done=True)
+        await self._cancel_child()
+
+    async def _run_iceberg(self):
+        """
+        Iceberg: в рынке всегда не больше display_qty; следующая часть —
+        сразу по событию исполнения предыдущей. duration — предельное
+        время жизни (0 — до исполнения или отмены).
+        """
+        job = self.job
+        deadline = job.started + job.duration if job.duration else None
+        while job.remaining > 0 and (deadline is None or time.time() < deadline):
+            if job.working is None and await self._child(min(job.display_qty, int(job.remaining)),
+                                                         job.price_mode) is None:
+                await job.wait(1.0)
+                continue
+            await self._work(deadline, until_done=True)
+        await self._cancel_child()
+
+    async def _work(self, deadline, until_done=False):
+        """
+        Ведёт дочерний ордер до deadline (until_done — до его завершения):
+        просыпается на событиях ордера и котировках, переставляет цену
+        за рынком не чаще reprice_interval.
+        """
+        job = self.job
+        while True:
+            job.check()
+            if job.working is None and (until_done or job.remaining <= 0):
+                return
+            timeout = None if deadline is None else deadline - time.time()
+            if timeout is not None and timeout <= 0:
+                return
+            await job.wait(timeout)
+            job.quote = self.quote()
+            await self._reprice()
+
+    async def _child(self, qty, mode):
+        job = self.job
+        job.check()
+        job.quote = self.quote()
+        price = child_price(job.action, job.quote, mode, job.limit_price)
+        if price is None:
+            return None
+
+        order = Order(action=job.action, orderType="LMT", totalQuantity=qty, lmtPrice=price, tif="DAY",
+                      orderRef=f"algo:{job.id}")
+        trade = await self.place(job, order)
+        job.children[order.orderId] = trade
+        job.working = trade
+        job.working_mode = mode
+        job.repriced_at = time.time()
+        self.publish(job)
+        return trade
+
+    async def _reprice(self):
+        job = self.job
+        trade = job.working
+        if trade is None or trade.orderStatus.status in PENDING_STATUSES or trade.order.orderId in job.cancel_requested:
+            return
+        price = child_price(job.action, job.quote, job.working_mode, job.limit_price)
+        if price is None or price == trade.order.lmtPrice or time.time() - job.repriced_at < job.reprice_interval:
+            return
+        job.repriced_at = time.time()
+        trade.order.lmtPrice = price
+        await self.place(job, trade.order)
+
+    async def _cancel_child(self):
+        """
+        Снимает текущий дочерний ордер и ждёт финального статуса: только
+        после него известен остаток, и новый срез не переисполнит родителя.
+        Если TWS не ответил за ack_timeout — ордер остаётся текущим.
+        """
+        job = self.job
+        trade = job.working
+        if trade is None:
+            return
+        if trade.orderStatus.status not in DONE_STATUSES and trade.order.orderId not in job.cancel_requested:
+            job.cancel_requested.add(trade.order.orderId)
+            await self.cancel(trade.order)
+        deadline = time.time() + self.ack_timeout
+        while job.working is trade and trade.orderStatus.status not in DONE_STATUSES and time.time() < deadline:
+            await job.wait(deadline - time.time())
+        if trade.orderStatus.status in DONE_STATUSES and job.working is trade:
+            job.working = None
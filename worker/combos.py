@@ -0,0 +1,80 @@
+from ib_insync import ComboLeg, Contract
+
+# Нога — (right, смещение в страйках от ATM, ratio, action). Смещение
+# умножается на width: call_vertical с width=2 — ATM и ATM+2 страйка.
+COMBO_STRATEGIES = {
+    "call_vertical": (("C", 0, 1, "BUY"), ("C", 1, 1, "SELL")),
+    "put_vertical": (("P", 0, 1, "BUY"), ("P", -1, 1, "SELL")),
+    "straddle": (("C", 0, 1, "BUY"), ("P", 0, 1, "BUY")),
+    "strangle": (("C", 1, 1, "BUY"), ("P", -1, 1, "BUY")),
+}
+
+PRICE_MODES = ("mid", "natural")
+
+
+def strategy_legs(strategy=None, legs=None, width=1):
+    """
+    Ноги по имени стратегии или явному списку dict
+    {"right", "offset", "ratio", "action"}. ValueError — если ни того, ни другого
+    или стратегия неизвестна.
+    """
+    if legs:
+        return [
+            ((leg.get("right") or "C").upper(), int(leg.get("offset", 0)), int(leg.get("ratio", 1)),
+             (leg.get("action") or "BUY").upper())
+            for leg in legs
+        ]
+    if strategy not in COMBO_STRATEGIES:
+        raise ValueError(f"Unknown strategy {strategy!r}, expected one of {list(COMBO_STRATEGIES)} or legs")
+    return [(right, offset * width, ratio, action) for right, offset, ratio, action in COMBO_STRATEGIES[strategy]]
+
+
+def resolve_strikes(chain, trading_class, price, legs):
+    """
+    Страйки ног от ATM (ближайший к price страйк цепочки).
+    [(right, strike, ratio, action)]; ValueError, если смещение выходит за цепочку.
+    """
+    atm = chain.atm_strike(price, trading_class=trading_class)
+    resolved = []
+    for right, offset, ratio, action in legs:
+        strike = chain.strike_offset(atm, offset, trading_class)
+        if strike is None:
+            raise ValueError(f"No strike {offset:+d} from ATM {atm} in {trading_class}")
+        resolved.append((right, strike, ratio, action))
+    return atm, resolved
+
+
+def net_price(legs, quotes, mode="mid"):
+    """
+    Цена комбо за единицу: сумма ratio * цена ноги, покупки со знаком +,
+    продажи со знаком −. Положительная — дебет, отрицательная — кредит.
+    mid — по середине, natural — покупки по ask, продажи по bid.
+    None, если у какой-то ноги нет нужной стороны котировки.
+    quotes — quote_snapshot ног в порядке legs.
+    """
+    if mode not in PRICE_MODES:
+        raise ValueError(f"Unknown price mode {mode!r}, expected one of {PRICE_MODES}")
+    total = 0.0
+    for (_, _, ratio, action), quote in zip(legs, quotes):
+        buy = action == "BUY"
+        price = quote["mid"] if mode == "mid" else quote["ask" if buy else "bid"]
+        if price is None:
+            return None
+        total += ratio * price if buy else -ratio * price
+    return round(total, 2)
+
+
+def build_bag(symbol, contracts, legs, currency="USD", exchange="SMART"):
+    """
+    BAG-контракт из квалифицированных опционов ног.
+    """
+    return Contract(
+        secType="BAG",
+        symbol=symbol,
+        currency=currency,
+        exchange=exchange,
+        comboLegs=[
+            ComboLeg(conId=c.conId, ratio=ratio, action=action, exchange=exchange)
+            for c, (_, _, ratio, action) in zip(contracts, legs)
+        ],
+    )
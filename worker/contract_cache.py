@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ContractCache:
+    """
+    Ограниченный LRU-кэш квалифицированных контрактов с TTL.
+    Ключ — (secType, symbol, expiry, strike, right, exchange, currency,
+    tradingClass) контракта в том виде, в каком его собрали до qualify.
+    tradingClass нужен, чтобы не путать, например, SPX и SPXW.
+    Потокобезопасен: один кэш делят все подключения пула.
+    """
+
+    def __init__(self, maxsize=1024, ttl=6 * 60 * 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()  # key -> (expires_at, contract)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(contract):
+        return (
+            contract.secType,
+            contract.symbol.upper(),
+            contract.lastTradeDateOrContractMonth or '',
+            float(contract.strike or 0.0),
+            (contract.right or '').upper(),
+            contract.exchange or '',
+            contract.currency or '',
+            contract.tradingClass or '',
+        )
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, contract = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return contract
+
+    def put(self, key, contract):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, contract)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / total if total else None,
+        }
+
+    def __len__(self):
+        return len(self._data)
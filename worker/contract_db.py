@@ -0,0 +1,211 @@
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+
+from ib_insync import Contract, util
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contracts (
+    key TEXT PRIMARY KEY,
+    con_id INTEGER NOT NULL,
+    symbol TEXT NOT NULL,
+    sec_type TEXT NOT NULL,
+    expiry TEXT NOT NULL,
+    strike REAL NOT NULL,
+    opt_right TEXT NOT NULL,
+    trading_class TEXT NOT NULL,
+    contract TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contracts_con_id ON contracts (con_id);
+CREATE INDEX IF NOT EXISTS contracts_option ON contracts (symbol, expiry, strike);
+
+CREATE TABLE IF NOT EXISTS chains (
+    symbol TEXT NOT NULL,
+    trading_class TEXT NOT NULL,
+    exchange TEXT NOT NULL,
+    multiplier TEXT NOT NULL,
+    underlying_con_id INTEGER NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (symbol, trading_class, exchange)
+);
+CREATE TABLE IF NOT EXISTS chain_expirations (
+    symbol TEXT NOT NULL,
+    trading_class TEXT NOT NULL,
+    exchange TEXT NOT NULL,
+    expiry TEXT NOT NULL,
+    PRIMARY KEY (symbol, trading_class, exchange, expiry)
+);
+CREATE INDEX IF NOT EXISTS chain_expirations_expiry ON chain_expirations (expiry);
+CREATE TABLE IF NOT EXISTS chain_strikes (
+    symbol TEXT NOT NULL,
+    trading_class TEXT NOT NULL,
+    exchange TEXT NOT NULL,
+    strike REAL NOT NULL,
+    PRIMARY KEY (symbol, trading_class, exchange, strike)
+);
+"""
+
+# типы с датой экспирации YYYYMMDD, которые удаляются после неё
+EXPIRING_TYPES = ("OPT", "FOP", "FUT", "WAR")
+
+
+def _today():
+    return datetime.date.today().strftime("%Y%m%d")
+
+
+class ContractDB:
+    """
+    Квалифицированные контракты и параметры цепочек опционов в SQLite:
+    переживают перезапуск и общие для всех процессов (API, Tk) — WAL,
+    читатели не ждут писателя. Память не наполняется заранее: IBWorker
+    заглядывает сюда при промахе ContractCache/OptionChainIndex.
+    Записи старше refresh_after отдаются, но помечаются устаревшими —
+    IBWorker обновляет их в фоне. Истёкшие экспирации и опционы
+    удаляются purge_expired. Чтение и запись — разные connection под
+    своими lock: в WAL чтение не ждёт крупный put_chain. Все методы
+    блокирующие — IBWorker зовёт их в executor, не в своём loop.
+    """
+
+    def __init__(self, path, contract_refresh=7 * 86400, chain_refresh=12 * 60 * 60):
+        self.path = path
+        self.contract_refresh = contract_refresh
+        self.chain_refresh = chain_refresh
+        self.hits = 0
+        self.misses = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._read_lock = threading.Lock()
+        self._read = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._read.execute("PRAGMA query_only=ON")
+        self.purge_expired()
+
+    # --- контракты ---
+
+    @staticmethod
+    def _key(key):
+        return json.dumps(key)
+
+    def get_contracts(self, keys):
+        """
+        {key: (contract, stale)} для найденных ключей ContractCache.
+        """
+        if not keys:
+            return {}
+        by_json = {self._key(k): k for k in keys}
+        now = time.time()
+        with self._read_lock:
+            rows = self._read.execute(
+                f"SELECT key, contract, updated FROM contracts WHERE key IN ({','.join('?' * len(by_json))})",
+                list(by_json),
+            ).fetchall()
+        found = {
+            by_json[key]: (Contract.create(**json.loads(data)), now - updated > self.contract_refresh)
+            for key, data, updated in rows
+        }
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_contracts(self, items):
+        """
+        items — [(key, contract)]. Блокирующий — вызывать в executor.
+        """
+        now = time.time()
+        rows = [
+            (self._key(key), c.conId, c.symbol, c.secType, c.lastTradeDateOrContractMonth or "", float(c.strike or 0.0),
+             c.right or "", c.tradingClass or "", json.dumps(util.dataclassNonDefaults(c)), now)
+            for key, c in items if c.conId and not c.comboLegs
+        ]
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO contracts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def delete_contract(self, key):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM contracts WHERE key = ?", (self._key(key),))
+
+    # --- цепочки ---
+
+    def get_chain(self, symbol):
+        """
+        (params, stale) в формате ответа reqSecDefOptParams (только
+        неистёкшие экспирации) или (None, False), если цепочки нет.
+        """
+        today = _today()
+        with self._read_lock:
+            heads = self._read.execute(
+                "SELECT trading_class, exchange, multiplier, underlying_con_id, updated FROM chains WHERE symbol = ?",
+                (symbol,),
+            ).fetchall()
+            params = []
+            for tc, exchange, multiplier, con_id, updated in heads:
+                expirations = [r[0] for r in self._read.execute(
+                    "SELECT expiry FROM chain_expirations WHERE symbol = ? AND trading_class = ? AND exchange = ? "
+                    "AND expiry >= ? ORDER BY expiry", (symbol, tc, exchange, today))]
+                strikes = [r[0] for r in self._read.execute(
+                    "SELECT strike FROM chain_strikes WHERE symbol = ? AND trading_class = ? AND exchange = ? "
+                    "ORDER BY strike", (symbol, tc, exchange))]
+                params.append(SimpleNamespace(exchange=exchange, underlyingConId=con_id, tradingClass=tc,
+                                              multiplier=multiplier, expirations=expirations, strikes=strikes,
+                                              updated=updated))
+        params = [p for p in params if p.expirations]
+        if not params:
+            self.misses += 1
+            return None, False
+        self.hits += 1
+        return params, time.time() - min(p.updated for p in params) > self.chain_refresh
+
+    def put_chain(self, symbol, params):
+        """
+        Заменяет цепочку символа ответом reqSecDefOptParams. Блокирующий.
+        """
+        now = time.time()
+        with self._lock, self._db:
+            for table in ("chains", "chain_expirations", "chain_strikes"):
+                self._db.execute(f"DELETE FROM {table} WHERE symbol = ?", (symbol,))
+            for p in params:
+                head = (symbol, p.tradingClass, p.exchange)
+                self._db.execute("INSERT OR REPLACE INTO chains VALUES (?, ?, ?, ?, ?, ?)",
+                                 (*head, p.multiplier, p.underlyingConId, now))
+                self._db.executemany("INSERT OR IGNORE INTO chain_expirations VALUES (?, ?, ?, ?)",
+                                     [(*head, e if isinstance(e, str) else e.strftime("%Y%m%d"))
+                                      for e in p.expirations])
+                self._db.executemany("INSERT OR IGNORE INTO chain_strikes VALUES (?, ?, ?, ?)",
+                                     [(*head, float(s)) for s in p.strikes])
+
+    # --- обслуживание ---
+
+    def purge_expired(self, today=None):
+        """
+        Удаляет прошедшие экспирации цепочек и истёкшие контракты.
+        Возвращает (экспираций, контрактов).
+        """
+        today = today or _today()
+        with self._lock, self._db:
+            expirations = self._db.execute("DELETE FROM chain_expirations WHERE expiry < ?", (today,)).rowcount
+            contracts = self._db.execute(
+                f"DELETE FROM contracts WHERE sec_type IN ({','.join('?' * len(EXPIRING_TYPES))}) "
+                "AND length(expiry) = 8 AND expiry < ?", (*EXPIRING_TYPES, today),
+            ).rowcount
+        return expirations, contracts
+
+    def stats(self):
+        with self._read_lock:
+            contracts = self._read.execute("SELECT count(*) FROM contracts").fetchone()[0]
+            chains = self._read.execute("SELECT count(DISTINCT symbol) FROM chains").fetchone()[0]
+        return {"path": self.path, "contracts": contracts, "chains": chains, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._read_lock:
+            self._read.close()
+        with self._lock:
+            self._db.close()
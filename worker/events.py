@@ -0,0 +1,77 @@
+from ib_insync.util import UNSET_DOUBLE
+
+
+def _price(value):
+    return None if value == UNSET_DOUBLE else value
+
+
+class EventHub:
+    """
+    Рассылка событий из loop IBWorker подписчикам в других потоках.
+    deliver(event) вызывается в loop IBWorker, поэтому должен быть
+    потокобезопасным и быстрым (положить в очередь и выйти).
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+
+    def subscribe(self, deliver):
+        self._subscribers.add(deliver)
+        return deliver
+
+    def unsubscribe(self, deliver):
+        self._subscribers.discard(deliver)
+
+    def publish(self, event):
+        for deliver in list(self._subscribers):
+            deliver(event)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+
+def loop_queue_deliver(loop, queue):
+    """
+    deliver для подписчика из asyncio: событие попадает в asyncio.Queue
+    его собственного loop.
+    """
+    def deliver(event):
+        loop.call_soon_threadsafe(queue.put_nowait, event)
+    return deliver
+
+
+def trade_event(kind, trade, fill=None):
+    """
+    Снимок состояния ордера для подписчиков: new / open / status / fill.
+    """
+    order = trade.order
+    status = trade.orderStatus
+    event = {
+        "type": kind,
+        "orderId": order.orderId,
+        "permId": order.permId,
+        "parentId": order.parentId,
+        "clientId": order.clientId,
+        "account": order.account,
+        "symbol": trade.contract.symbol,
+        "localSymbol": trade.contract.localSymbol,
+        "secType": trade.contract.secType,
+        "action": order.action,
+        "orderType": order.orderType,
+        "qty": float(order.totalQuantity),
+        "lmtPrice": _price(order.lmtPrice),
+        "auxPrice": _price(order.auxPrice),
+        "status": status.status,
+        "filled": float(status.filled),
+        "remaining": float(status.remaining),
+        "avgFillPrice": status.avgFillPrice,
+        "time": trade.log[-1].time.timestamp() if trade.log else None,
+    }
+    if fill is not None:
+        event["execution"] = {
+            "execId": fill.execution.execId,
+            "shares": float(fill.execution.shares),
+            "price": fill.execution.price,
+            "time": fill.time.timestamp() if fill.time else None,
+        }
+    return event
@@ -0,0 +1,188 @@
+import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+DEFAULT_RATE = 0.04
+MODELS = ("bs", "black76")
+
+# опционы на акции и индексы США экспирируются по закрытию в Нью-Йорке
+EXPIRY_TZ = ZoneInfo("America/New_York")
+EXPIRY_CLOSE = datetime.time(16, 0)
+
+YEAR = 365.0 * 86400
+MIN_VOL, MAX_VOL = 1e-4, 5.0
+
+_SQRT2 = np.sqrt(2.0)
+_INV_SQRT2PI = 1.0 / np.sqrt(2.0 * np.pi)
+
+
+def _erfc(x):
+    # Numerical Recipes erfcc, относительная ошибка < 1.2e-7 — без scipy
+    z = np.abs(x)
+    t = 1.0 / (1.0 + 0.5 * z)
+    r = t * np.exp(-z * z - 1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (0.09678418 + t * (
+        -0.18628806 + t * (0.27886807 + t * (-1.13520398 + t * (1.48851587 + t * (
+            -0.82215223 + t * 0.17087277)))))))))
+    return np.where(x >= 0, r, 2.0 - r)
+
+
+def norm_cdf(x):
+    return 0.5 * _erfc(-x / _SQRT2)
+
+
+def norm_pdf(x):
+    return _INV_SQRT2PI * np.exp(-0.5 * x * x)
+
+
+def year_fraction(expiry, now=None):
+    """
+    Время до экспирации 'YYYYMMDD' (16:00 Нью-Йорк) в годах, не меньше минуты.
+    """
+    day = datetime.datetime.strptime(expiry, "%Y%m%d").date()
+    close = datetime.datetime.combine(day, EXPIRY_CLOSE, EXPIRY_TZ)
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return max((close - now).total_seconds(), 60.0) / YEAR
+
+
+def black_price(forward, strike, t, discount, vol, is_call):
+    """
+    Black-76 по форварду: discount * (F N(d1) - K N(d2)) для call,
+    discount * (K N(-d2) - F N(-d1)) для put. Все аргументы — массивы
+    одной формы или скаляры.
+    """
+    sd = vol * np.sqrt(t)
+    d1 = np.log(forward / strike) / sd + 0.5 * sd
+    d2 = d1 - sd
+    sign = np.where(is_call, 1.0, -1.0)
+    return sign * discount * (forward * norm_cdf(sign * d1) - strike * norm_cdf(sign * d2))
+
+
+def implied_vol(price, forward, strike, t, discount, is_call, tol=1e-6, min_price=1e-4, max_iter=50):
+    """
+    IV для всех страйков сразу: Ньютон по vega, со страховкой бисекцией
+    (шаг за пределы текущей вилки [lo, hi] заменяется серединой вилки).
+    ITM опционы пересчитываются по паритету в OTM: у глубоких ITM почти
+    вся цена — внутренняя стоимость, и vol по ней не восстановить.
+    NaN там, где цена вне безарбитражных границ, её нет, временная
+    стоимость меньше min_price или Ньютон не сошёлся (tol — относительная
+    ошибка цены).
+    """
+    price, forward, strike = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (price, forward, strike)))
+    is_call = np.broadcast_to(is_call, price.shape)
+
+    intrinsic = discount * np.maximum(np.where(is_call, forward - strike, strike - forward), 0.0)
+    upper = discount * np.where(is_call, forward, strike)
+    valid = np.isfinite(price) & (price > intrinsic) & (price < upper)
+
+    itm = np.where(is_call, forward > strike, forward < strike)
+    price = np.where(itm, price - intrinsic, price)
+    is_call = is_call ^ itm
+    valid &= price > min_price
+
+    sqrt_t = np.sqrt(t)
+    # начальное приближение Бреннера-Субраманьяма, в пределах вилки
+    vol = np.clip(np.sqrt(2 * np.pi / t) * price / (discount * forward), 0.05, 2.0)
+    lo = np.full(price.shape, MIN_VOL)
+    hi = np.full(price.shape, MAX_VOL)
+    active = valid.copy()
+
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        f, k, v, p, c = forward[active], strike[active], vol[active], price[active], is_call[active]
+        sd = v * sqrt_t
+        d1 = np.log(f / k) / sd + 0.5 * sd
+        diff = black_price(f, k, t, discount, v, c) - p
+        vega = discount * f * norm_pdf(d1) * sqrt_t
+
+        # цена растёт по vol: сужаем вилку по знаку ошибки
+        lo[active] = np.where(diff < 0, v, lo[active])
+        hi[active] = np.where(diff > 0, v, hi[active])
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = v - diff / vega
+        bad = ~np.isfinite(step) | (step <= lo[active]) | (step >= hi[active])
+        vol[active] = np.where(bad, 0.5 * (lo[active] + hi[active]), step)
+
+        idx = np.flatnonzero(active)
+        done = np.abs(diff) <= tol * p
+        active[idx[done]] = False
+
+    return np.where(valid & ~active, vol, np.nan)
+
+
+def greeks(spot, forward, strike, t, discount, vol, is_call, dividend=0.0, model="bs"):
+    """
+    delta, gamma, theta (за календарный день), vega (на 1 пункт vol).
+    bs — дельта и гамма по спот-цене (акция, индекс с дивидендной
+    доходностью); black76 — по форварду (фьючерс, или форвард из паритета).
+    """
+    sqrt_t = np.sqrt(t)
+    sd = vol * sqrt_t
+    d1 = np.log(forward / strike) / sd + 0.5 * sd
+    d2 = d1 - sd
+    pdf = norm_pdf(d1)
+    nd1 = norm_cdf(d1)
+    rate = -np.log(discount) / t
+
+    if model == "bs":
+        carry = np.exp(-dividend * t)
+        delta = np.where(is_call, carry * nd1, carry * (nd1 - 1.0))
+        gamma = carry * pdf / (spot * sd)
+    else:
+        delta = np.where(is_call, discount * nd1, discount * (nd1 - 1.0))
+        gamma = discount * pdf / (forward * sd)
+
+    vega = discount * forward * pdf * sqrt_t
+    decay = -discount * forward * pdf * vol / (2 * sqrt_t)
+    if model == "bs":
+        # спот фиксирован: S e^{-qT} = D F
+        call_theta = decay - rate * discount * strike * norm_cdf(d2) + dividend * discount * forward * nd1
+        put_theta = decay + rate * discount * strike * norm_cdf(-d2) - dividend * discount * forward * (1.0 - nd1)
+    else:
+        # форвард фиксирован: дисконтирование — единственный перенос
+        call_theta = decay + rate * black_price(forward, strike, t, discount, vol, True)
+        put_theta = decay + rate * black_price(forward, strike, t, discount, vol, False)
+    theta = np.where(is_call, call_theta, put_theta)
+
+    return {"delta": delta, "gamma": gamma, "theta": theta / 365.0, "vega": vega / 100.0}
+
+
+def implied_forward(strikes, call_prices, put_prices, discount):
+    """
+    Форвард из паритета call - put = D (F - K) на страйке, где |C - P|
+    минимальна. None, если нет ни одной пары котировок.
+    """
+    diff = call_prices - put_prices
+    ok = np.isfinite(diff)
+    if not ok.any():
+        return None
+    i = np.flatnonzero(ok)[np.argmin(np.abs(diff[ok]))]
+    return float(strikes[i] + diff[i] / discount)
+
+
+def chain_greeks(spot, strikes, is_call, prices, t, rate=DEFAULT_RATE, dividend=0.0, model="bs"):
+    """
+    IV и греки по снимку цепочки одной экспирации за один векторный проход.
+    strikes, is_call, prices — массивы одной длины (prices: NaN, где котировки нет).
+    black76 берёт форвард из паритета call/put, если есть пары котировок,
+    иначе — из спота, ставки и дивидендной доходности.
+    Возвращает (forward, {"iv", "delta", "gamma", "theta", "vega"}).
+    """
+    if model not in MODELS:
+        raise ValueError(f"Unknown model {model!r}, expected one of {MODELS}")
+    discount = np.exp(-rate * t)
+    forward = spot * np.exp((rate - dividend) * t)
+
+    if model == "black76":
+        unique = np.unique(strikes)
+        idx = np.searchsorted(unique, strikes)
+        call_prices = np.full(len(unique), np.nan)
+        put_prices = np.full(len(unique), np.nan)
+        call_prices[idx[is_call]] = prices[is_call]
+        put_prices[idx[~is_call]] = prices[~is_call]
+        forward = implied_forward(unique, call_prices, put_prices, discount) or forward
+
+    iv = implied_vol(prices, forward, strikes, t, discount, is_call)
+    return float(forward), {"iv": iv, **greeks(spot, forward, strikes, t, discount, iv, is_call, dividend, model)}
@@ -0,0 +1,233 @@
+import asyncio
+import datetime
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# одна запись на бар; время — начало бара, секунды UTC
+BAR_DTYPE = np.dtype([
+    ("time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"), ("volume", "<f8"),
+])
+
+# barSizeSetting -> (длина бара, с; максимальный кусок одного запроса, с).
+# Куски — по таблице допустимых durationStr/barSize у TWS.
+BAR_SIZES = {
+    "1 secs": (1, 1800),
+    "5 secs": (5, 3600),
+    "15 secs": (15, 14400),
+    "30 secs": (30, 28800),
+    "1 min": (60, 7 * 86400),
+    "5 mins": (300, 30 * 86400),
+    "15 mins": (900, 30 * 86400),
+    "30 mins": (1800, 30 * 86400),
+    "1 hour": (3600, 30 * 86400),
+    "1 day": (86400, 365 * 86400),
+}
+
+# текст ошибки 162, после которой диапазон честно пуст (а не "повторите позже")
+NO_DATA_MARKERS = ("returned no data", "no data")
+
+
+def duration_str(seconds):
+    if seconds < 86400:
+        return f"{int(seconds)} S"
+    return f"{-(-int(seconds) // 86400)} D"
+
+
+def bar_time(date):
+    if isinstance(date, datetime.datetime):
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=datetime.timezone.utc)
+        return int(date.timestamp())
+    return int(datetime.datetime(date.year, date.month, date.day, tzinfo=datetime.timezone.utc).timestamp())
+
+
+def bars_to_array(bars):
+    return np.array(
+        [(bar_time(b.date), b.open, b.high, b.low, b.close, b.volume) for b in bars],
+        dtype=BAR_DTYPE,
+    )
+
+
+def add_range(ranges, start, end):
+    """
+    Добавляет [start, end) к отсортированному списку непересекающихся
+    интервалов, склеивая соседние.
+    """
+    merged = []
+    for a, b in sorted([*ranges, (start, end)]):
+        if merged and a <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], b))
+        else:
+            merged.append((a, b))
+    return merged
+
+
+def missing_ranges(ranges, start, end):
+    """
+    Части [start, end), не покрытые ranges.
+    """
+    missing = []
+    cursor = start
+    for a, b in ranges:
+        if b <= cursor:
+            continue
+        if a >= end:
+            break
+        if a > cursor:
+            missing.append((cursor, a))
+        cursor = max(cursor, b)
+    if cursor < end:
+        missing.append((cursor, end))
+    return missing
+
+
+def split_range(start, end, chunk):
+    return [(a, min(a + chunk, end)) for a in range(start, end, chunk)]
+
+
+def _open_array(path):
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:  # пустой массив mmap не открыть
+        return np.load(path)
+
+
+def _slug(text):
+    return re.sub(r"[^A-Za-z0-9]+", "_", str(text)).strip("_")
+
+
+class BarStore:
+    """
+    Кэш баров на диске: на каждый (контракт, barSize, whatToShow, useRTH)
+    — .npy со структурным массивом BAR_DTYPE, отсортированным по времени,
+    и .json с покрытыми интервалами (пустой интервал — тоже покрытие:
+    выходные и ночь без торгов повторно не запрашиваются).
+    Читается через np.load(mmap_mode='r'): срез — view на файл без копии.
+    Запись — целиком во временный файл и os.replace, старые view остаются
+    валидными. Общий для пула подключений, запись под lock.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._open = {}  # key -> (array, ranges)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(contract, bar_size, what_to_show="TRADES", use_rth=True):
+        return (contract.symbol, contract.conId, bar_size, what_to_show, bool(use_rth))
+
+    def _paths(self, key):
+        symbol, con_id, bar_size, what_to_show, use_rth = key
+        directory = os.path.join(self.root, f"{_slug(symbol)}_{con_id}")
+        name = f"{_slug(bar_size)}_{_slug(what_to_show)}_{'rth' if use_rth else 'all'}"
+        return directory, os.path.join(directory, name + ".npy"), os.path.join(directory, name + ".json")
+
+    def load(self, key):
+        cached = self._open.get(key)
+        if cached is not None:
+            return cached
+        _, data_path, meta_path = self._paths(key)
+        if os.path.exists(data_path) and os.path.exists(meta_path):
+            array = _open_array(data_path)
+            with open(meta_path) as f:
+                ranges = [tuple(r) for r in json.load(f)["ranges"]]
+        else:
+            array, ranges = np.empty(0, dtype=BAR_DTYPE), []
+        self._open[key] = (array, ranges)
+        return array, ranges
+
+    def missing(self, key, start, end):
+        return missing_ranges(self.load(key)[1], start, end)
+
+    def read(self, key, start, end):
+        """
+        Бары в [start, end) — view на memmap, без копирования.
+        """
+        array = self.load(key)[0]
+        times = array["time"]
+        return array[np.searchsorted(times, start, "left"):np.searchsorted(times, end, "left")]
+
+    def write(self, key, bars, covered):
+        """
+        Вливает новые бары и покрытые интервалы. Блокирующий — вызывать
+        в executor.
+        """
+        with self._lock:
+            self._write(key, bars, covered)
+
+    def _write(self, key, bars, covered):
+        array, ranges = self.load(key)
+        merged = np.concatenate([np.asarray(array), bars]) if len(array) else bars
+        # при совпадении времени побеждает свежий бар
+        _, last = np.unique(merged["time"][::-1], return_index=True)
+        merged = merged[::-1][last]
+
+        for start, end in covered:
+            ranges = add_range(ranges, start, end)
+
+        directory, data_path, meta_path = self._paths(key)
+        os.makedirs(directory, exist_ok=True)
+        with open(data_path + ".tmp", "wb") as f:
+            np.save(f, merged)
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump({"ranges": ranges, "updated": time.time()}, f)
+        os.replace(data_path + ".tmp", data_path)
+        os.replace(meta_path + ".tmp", meta_path)
+
+        self._open[key] = (_open_array(data_path), ranges)
+
+    def stats(self):
+        return {
+            "root": self.root,
+            "series": [
+                {"symbol": k[0], "conId": k[1], "barSize": k[2], "whatToShow": k[3], "useRTH": k[4],
+                 "bars": len(a), "ranges": len(r)}
+                for k, (a, r) in self._open.items()
+            ],
+        }
+
+
+class HistoricalPacer:
+    """
+    Лимиты TWS на исторические данные (сверх общего токен-бакета):
+    не больше max_requests за window секунд и не больше per_contract
+    запросов по одному контракту за 2 секунды. Работает в loop IBWorker.
+    """
+
+    def __init__(self, max_requests=60, window=600.0, per_contract=5, contract_window=2.0):
+        self.max_requests = max_requests
+        self.window = window
+        self.per_contract = per_contract
+        self.contract_window = contract_window
+        self._sent = deque()
+        self._by_contract = {}  # conId -> deque
+
+    def _delay(self, con_id, now):
+        while self._sent and now - self._sent[0] >= self.window:
+            self._sent.popleft()
+        recent = self._by_contract.setdefault(con_id, deque())
+        while recent and now - recent[0] >= self.contract_window:
+            recent.popleft()
+
+        delay = 0.0
+        if len(self._sent) >= self.max_requests:
+            delay = self._sent[0] + self.window - now
+        if len(recent) >= self.per_contract:
+            delay = max(delay, recent[0] + self.contract_window - now)
+        return delay
+
+    async def acquire(self, con_id):
+        while True:
+            now = time.monotonic()
+            delay = self._delay(con_id, now)
+            if delay <= 0:
+                self._sent.append(now)
+                self._by_contract[con_id].append(now)
+                return
+            await asyncio.sleep(delay)
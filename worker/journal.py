@@ -0,0 +1,451 @@
+import asyncio
+import datetime
+import glob
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from ib_insync import CommissionReport, Contract, Execution, Fill, Order, OrderStatus, Trade
+
+from worker.events import EventHub, trade_event
+from worker.market_data import quote_snapshot
+from worker.order_store import OrderStore
+
+# виды записей
+QUOTE, NEW, OPEN, STATUS, FILL, COMMISSION = 1, 2, 3, 4, 5, 6
+TRADE_KINDS = {"new": NEW, "open": OPEN, "status": STATUS, "fill": FILL}
+KIND_NAMES = {QUOTE: "quote", COMMISSION: "commission", **{v: k for k, v in TRADE_KINDS.items()}}
+
+ACTIONS = {"BUY": 1, "SELL": 2}
+ACTION_NAMES = {v: k for k, v in ACTIONS.items()}
+
+# 96 байт на запись. Строки (статус, тип ордера, execId, счёт) — индексы
+# в таблице строк файла; контракты — по conId в том же sidecar.
+# f: quote  — bid, ask, last, bidSize, askSize, lastSize, volume
+#    order  — qty, lmtPrice, auxPrice, filled, remaining, avgFillPrice, -
+#    fill   — shares, price, cumQty, avgPrice, commission, -, -
+#    commission — commission, realizedPNL, -, -, -, -, -  (text — execId)
+# Комиссия приходит отдельным commissionReportEvent после execDetails,
+# поэтому в записи fill она обычно 0 — настоящая в записи commission.
+RECORD_DTYPE = np.dtype([
+    ("ts", "<f8"),
+    ("kind", "u1"),
+    ("action", "u1"),
+    ("status", "<u2"),
+    ("con_id", "<i4"),
+    ("order_id", "<i4"),
+    ("client_id", "<i4"),
+    ("perm_id", "<i8"),
+    ("parent_id", "<i4"),
+    ("text", "<u4"),     # orderType / execId
+    ("account", "<u4"),
+    ("f", "<f8", (7,)),
+])
+HEADER_DTYPE = np.dtype([
+    ("magic", "S4"), ("version", "<u4"), ("record_size", "<u4"), ("count", "<u8"),
+    ("pad", "V", RECORD_DTYPE.itemsize - 20),
+])
+MAGIC = b"IBJ1"
+NAN = float("nan")
+
+
+class _DayFile:
+    """
+    Файл одного дня: первая запись — заголовок (число записей),
+    дальше записи. Растёт удвоением с переоткрытием memmap.
+    """
+
+    def __init__(self, path, capacity):
+        self.path = path
+        self.meta_path = path[:-4] + ".meta.jsonl"
+        self.strings = {"": 0}
+        self.contracts = set()
+        if os.path.exists(path):
+            self._open()
+            self._load_meta()
+        else:
+            self.capacity = capacity
+            self._map(capacity, create=True)
+            header = self.header
+            header["magic"], header["version"], header["record_size"] = MAGIC, 1, RECORD_DTYPE.itemsize
+            header["count"] = 0
+        self.meta = open(self.meta_path, "a")
+
+    def _map(self, capacity, create=False):
+        self.mm = np.memmap(self.path, dtype=RECORD_DTYPE, mode="w+" if create else "r+", shape=(capacity + 1,))
+        self.header = self.mm[:1].view(HEADER_DTYPE)[0]
+        self.records = self.mm[1:]
+        self.capacity = capacity
+
+    def _open(self):
+        size = os.path.getsize(self.path) // RECORD_DTYPE.itemsize - 1
+        self._map(size)
+
+    def _load_meta(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path) as f:
+            for line in f:
+                entry = json.loads(line)
+                if "string" in entry:
+                    self.strings[entry["value"]] = entry["string"]
+                else:
+                    self.contracts.add(entry["conId"])
+
+    @property
+    def count(self):
+        return int(self.header["count"])
+
+    def intern(self, value):
+        if not value:
+            return 0
+        sid = self.strings.get(value)
+        if sid is None:
+            sid = self.strings[value] = len(self.strings)
+            self.meta.write(json.dumps({"string": sid, "value": value}) + "\n")
+        return sid
+
+    def add_contract(self, contract):
+        if contract.conId in self.contracts:
+            return
+        self.contracts.add(contract.conId)
+        self.meta.write(json.dumps({
+            "conId": contract.conId, "symbol": contract.symbol, "localSymbol": contract.localSymbol,
+            "secType": contract.secType, "expiry": contract.lastTradeDateOrContractMonth,
+            "strike": contract.strike, "right": contract.right, "exchange": contract.exchange,
+            "currency": contract.currency, "multiplier": contract.multiplier, "tradingClass": contract.tradingClass,
+        }) + "\n")
+
+    def append(self, batch):
+        count = self.count
+        if count + len(batch) > self.capacity:
+            self.mm.flush()
+            capacity = self.capacity
+            while count + len(batch) > capacity:
+                capacity *= 2
+            del self.header, self.records, self.mm
+            with open(self.path, "r+b") as f:
+                f.truncate((capacity + 1) * RECORD_DTYPE.itemsize)
+            self._map(capacity)
+        self.records[count:count + len(batch)] = batch
+        # заголовок — после данных: оборванная запись не попадёт в count
+        self.header["count"] = count + len(batch)
+
+    def flush(self):
+        self.meta.flush()
+        self.mm.flush()
+
+    def close(self):
+        self.flush()
+        self.meta.close()
+
+
+class Journal:
+    """
+    Журнал котировок, статусов ордеров и исполнений. record_* вызываются
+    в loop IBWorker и только кладут кортеж в очередь; упаковка в записи,
+    таблица строк и запись в memmap — в отдельном потоке пачками раз в
+    flush_interval. Файлы по дням (UTC): <dir>/YYYYMMDD.bin + .meta.jsonl.
+    """
+
+    def __init__(self, directory, flush_interval=0.1, capacity=1 << 16):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self._queue = deque()
+        self._day = None
+        self._file = None
+        self.written = 0
+        self.batches = 0
+        self.write_time = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._writer, name="journal-writer", daemon=True)
+        self._thread.start()
+
+    # --- loop IBWorker ---
+
+    def record_quote(self, ticker):
+        self._queue.append((QUOTE, time.time(), ticker.contract, (
+            ticker.bid, ticker.ask, ticker.last, ticker.bidSize, ticker.askSize, ticker.lastSize, ticker.volume
+        )))
+
+    def record_trade(self, kind, trade, fill=None):
+        order, status = trade.order, trade.orderStatus
+        if fill is not None:
+            e = fill.execution
+            values = (e.shares, e.price, e.cumQty, e.avgPrice, fill.commissionReport.commission, None, None)
+            self._queue.append((FILL, time.time(), trade.contract, values, order, status.status, e.execId))
+        else:
+            values = (order.totalQuantity, order.lmtPrice, order.auxPrice, status.filled, status.remaining,
+                      status.avgFillPrice, None)
+            self._queue.append((TRADE_KINDS[kind], time.time(), trade.contract, values, order, status.status,
+                                order.orderType))
+
+    def record_commission(self, trade, fill, report):
+        values = (report.commission, report.realizedPNL, None, None, None, None, None)
+        self._queue.append((COMMISSION, time.time(), trade.contract, values, trade.order, trade.orderStatus.status,
+                            fill.execution.execId))
+
+    # --- поток записи ---
+
+    def _writer(self):
+        while not self._stop.wait(self.flush_interval):
+            self._drain()
+        self._drain()
+        if self._file is not None:
+            self._file.close()
+
+    def _drain(self):
+        n = len(self._queue)
+        if not n:
+            return
+        t0 = time.perf_counter()
+        items = [self._queue.popleft() for _ in range(n)]
+
+        # пачка может пересечь полночь — режем по дням
+        start = 0
+        for i in range(1, n + 1):
+            if i == n or self._date(items[i][1]) != self._date(items[start][1]):
+                self._write(items[start:i])
+                start = i
+        self._file.flush()
+        self.batches += 1
+        self.written += n
+        self.write_time += time.perf_counter() - t0
+
+    @staticmethod
+    def _date(ts):
+        return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).strftime("%Y%m%d")
+
+    def _write(self, items):
+        day = self._date(items[0][1])
+        if day != self._day:
+            if self._file is not None:
+                self._file.close()
+            self._file = _DayFile(os.path.join(self.directory, day + ".bin"), self.capacity)
+            self._day = day
+        f = self._file
+
+        batch = np.zeros(len(items), dtype=RECORD_DTYPE)
+        batch["kind"] = [item[0] for item in items]
+        batch["ts"] = [item[1] for item in items]
+        batch["con_id"] = [item[2].conId for item in items]
+        # None -> NaN делает сам np.array; UNSET_DOUBLE ib_insync — тоже NaN
+        values = np.array([item[3] for item in items], dtype=float)
+        values[values > 1e300] = NAN
+        batch["f"] = values
+
+        for i, item in enumerate(items):
+            f.add_contract(item[2])
+            if item[0] == QUOTE:
+                continue
+            order, status, text = item[4:]
+            rec = batch[i]
+            rec["action"] = ACTIONS.get(order.action, 0)
+            rec["status"] = f.intern(status)
+            rec["text"] = f.intern(text)
+            rec["account"] = f.intern(order.account)
+            rec["order_id"], rec["client_id"] = order.orderId, order.clientId
+            rec["perm_id"], rec["parent_id"] = order.permId, order.parentId
+        f.append(batch)
+
+    def stats(self):
+        return {
+            "directory": self.directory,
+            "file": self._file.path if self._file is not None else None,
+            "queued": len(self._queue),
+            "written": self.written,
+            "batches": self.batches,
+            "avgBatchMs": self.write_time / self.batches * 1000 if self.batches else 0.0,
+        }
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class JournalReader:
+    """
+    Чтение файла дня: записи — view на memmap, строки и контракты — из sidecar.
+    """
+
+    def __init__(self, path):
+        mm = np.memmap(path, dtype=RECORD_DTYPE, mode="r")
+        header = mm[:1].view(HEADER_DTYPE)[0]
+        if header["magic"] != MAGIC:
+            raise ValueError(f"{path} is not a journal file")
+        self.path = path
+        self.records = mm[1:1 + int(header["count"])]
+        self.strings = {0: ""}
+        self.contracts = {}
+        meta_path = path[:-4] + ".meta.jsonl"
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if "string" in entry:
+                        self.strings[entry["string"]] = entry["value"]
+                    else:
+                        self.contracts[entry["conId"]] = entry
+
+    def __len__(self):
+        return len(self.records)
+
+    def contract(self, con_id):
+        c = self.contracts.get(con_id, {})
+        return Contract(
+            conId=con_id, symbol=c.get("symbol", ""), localSymbol=c.get("localSymbol", ""),
+            secType=c.get("secType", ""), lastTradeDateOrContractMonth=c.get("expiry", ""),
+            strike=c.get("strike", 0.0), right=c.get("right", ""), exchange=c.get("exchange", ""),
+            currency=c.get("currency", ""), multiplier=c.get("multiplier", ""),
+            tradingClass=c.get("tradingClass", ""),
+        )
+
+
+def journal_files(directory):
+    return sorted(glob.glob(os.path.join(directory, "*.bin")))
+
+
+class ReplayTicker:
+    """
+    Минимальный Ticker для MarketDataManager: поля, которые читает quote_snapshot.
+    """
+
+    def __init__(self, contract):
+        self.contract = contract
+        self.time = None
+
+    def update(self, ts, values):
+        self.bid, self.ask, self.last, self.bidSize, self.askSize, self.lastSize, self.volume = values
+        self.time = datetime.datetime.fromtimestamp(ts, datetime.timezone.utc)
+
+    def marketPrice(self):
+        if not (math.isnan(self.bid) or math.isnan(self.ask)):
+            return (self.bid + self.ask) / 2
+        return self.last
+
+
+class ReplaySession:
+    """
+    Песочница replay: свой OrderStore, свои снимки котировок и свой
+    EventHub. Живые линии market data, стор ордеров, подписчики событий
+    ордеров и риск-проверки replay не видят. Каждое событие помечено
+    "replay": True.
+    """
+
+    def __init__(self):
+        self.orders = OrderStore()
+        self.quotes = {}  # conId -> снимок
+        self.events = EventHub()
+
+    def on_quote(self, ticker):
+        snapshot = {"type": "quote", "replay": True, **quote_snapshot(ticker)}
+        self.quotes[ticker.contract.conId] = snapshot
+        self.events.publish(snapshot)
+
+    def on_trade(self, kind, trade, fill=None):
+        event = {**trade_event(kind, trade, fill), "replay": True}
+        self.orders.apply(event)
+        self.events.publish(event)
+
+    def snapshot(self):
+        return {"type": "snapshot", "replay": True, "orders": self.orders.query(),
+                "quotes": list(self.quotes.values())}
+
+
+async def replay(reader, on_quote, on_trade, speed=1.0, start=None, end=None, kinds=None, progress=None):
+    """
+    Прогоняет записи через обработчики с исходными интервалами,
+    ускоренными в speed раз (speed=None — без пауз).
+    on_quote(ticker) и on_trade(kind, trade, fill) — обычно ReplaySession.
+    Ордера восстанавливаются в Trade по (clientId, orderId), так что
+    статусы и исполнения одного ордера приходят в один и тот же объект.
+    Запись commission, как и в ib_insync, дописывает CommissionReport в
+    уже выданный Fill и отдельным событием не уходит.
+    """
+    records = reader.records
+    if start is not None or end is not None:
+        ts = records["ts"]
+        records = records[np.searchsorted(ts, start or 0):np.searchsorted(ts, end or math.inf)]
+    if kinds:
+        kinds = set(kinds) | ({"commission"} if "fill" in kinds else set())
+        records = records[np.isin(records["kind"], [k for k, name in KIND_NAMES.items() if name in kinds])]
+    if not len(records):
+        return 0
+
+    contracts = {}
+    tickers = {}
+    trades = {}
+    first = float(records[0]["ts"])
+    started = time.monotonic()
+    s = reader.strings
+
+    for n, rec in enumerate(records):
+        if speed:
+            delay = (float(rec["ts"]) - first) / speed - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif n % 1000 == 0:
+            await asyncio.sleep(0)  # не держим loop на длинном журнале
+
+        con_id = int(rec["con_id"])
+        contract = contracts.get(con_id)
+        if contract is None:
+            contract = contracts[con_id] = reader.contract(con_id)
+        kind = int(rec["kind"])
+        values = [float(v) for v in rec["f"]]
+
+        if kind == QUOTE:
+            ticker = tickers.get(con_id)
+            if ticker is None:
+                ticker = tickers[con_id] = ReplayTicker(contract)
+            ticker.update(float(rec["ts"]), values)
+            on_quote(ticker)
+        else:
+            key = (int(rec["client_id"]), int(rec["order_id"]), int(rec["perm_id"]))
+            trade = trades.get(key)
+            if trade is None:
+                order = Order(orderId=key[1], clientId=key[0], permId=key[2], parentId=int(rec["parent_id"]),
+                              action=ACTION_NAMES.get(int(rec["action"]), ""), account=s.get(int(rec["account"]), ""))
+                trade = trades[key] = Trade(contract=contract, order=order, orderStatus=OrderStatus(orderId=key[1]))
+            fill = None
+            if kind == COMMISSION:
+                exec_id = s.get(int(rec["text"]), "")
+                done = next((f for f in trade.fills if f.execution.execId == exec_id), None)
+                if done is not None:
+                    done.commissionReport.commission = values[0]
+                    done.commissionReport.realizedPNL = values[1]
+                if progress is not None:
+                    progress(n + 1, len(records))
+                continue
+            if kind == FILL:
+                shares, price, cum_qty, avg_price, commission = values[:5]
+                exec_id = s.get(int(rec["text"]), "")
+                when = datetime.datetime.fromtimestamp(float(rec["ts"]), datetime.timezone.utc)
+                execution = Execution(
+                    execId=exec_id, time=when, acctNumber=trade.order.account, side="BOT"
+                    if trade.order.action == "BUY" else "SLD", shares=shares, price=price,
+                    permId=key[2], clientId=key[0], orderId=key[1], cumQty=cum_qty, avgPrice=avg_price
+                )
+                fill = Fill(contract, execution, CommissionReport(execId=exec_id, commission=commission), when)
+                trade.fills.append(fill)
+            else:
+                qty, lmt, aux, filled, remaining, avg_fill, _ = values
+                trade.order.totalQuantity = qty
+                trade.order.orderType = s.get(int(rec["text"]), "")
+                trade.order.lmtPrice = lmt if not math.isnan(lmt) else trade.order.lmtPrice
+                trade.order.auxPrice = aux if not math.isnan(aux) else trade.order.auxPrice
+                trade.orderStatus.filled = filled
+                trade.orderStatus.remaining = remaining
+                trade.orderStatus.avgFillPrice = 0.0 if math.isnan(avg_fill) else avg_fill
+            trade.orderStatus.status = s.get(int(rec["status"]), "")
+            on_trade(KIND_NAMES[kind], trade, fill)
+
+        if progress is not None:
+            progress(n + 1, len(records))
+    return len(records)
@@ -0,0 +1,184 @@
+import asyncio
+import math
+
+
+def clean_price(value):
+    """
+    NaN / None / -1 (нет данных у TWS) -> None.
+    """
+    if value is None or math.isnan(value) or value == -1:
+        return None
+    return value
+
+
+# marketDataType тикера: 3 — delayed, 4 — delayed frozen
+DELAYED_TYPES = (3, 4)
+
+# ошибки TWS, после которых котировки по контракту не будет: нет подписки
+# на данные (354, 10089-10091), delayed не включены (10168), нет контракта (200)
+NO_QUOTE_CODES = frozenset((200, 354, 10089, 10090, 10091, 10168))
+
+
+def ticker_price(ticker):
+    """
+    marketPrice (mid или last), иначе close — вне сессии живых котировок нет.
+    """
+    price = clean_price(ticker.marketPrice())
+    return price if price is not None else clean_price(getattr(ticker, "close", None))
+
+
+def has_quote(ticker, need="price"):
+    """
+    need="price" — есть цена для расчётов (ticker_price),
+    need="bidask" — есть обе стороны котировки.
+    """
+    if need == "bidask":
+        return clean_price(ticker.bid) is not None and clean_price(ticker.ask) is not None
+    return clean_price(ticker.marketPrice()) is not None
+
+
+async def wait_for_quote(ticker, need="price", timeout=2.0, done=None):
+    """
+    Ждёт первого updateEvent тикера с пригодной котировкой (has_quote).
+    True — котировка есть, False — дедлайн или done разрешён снаружи
+    (например, ошибкой TWS об отсутствии подписки).
+    """
+    if has_quote(ticker, need):
+        return True
+    done = done or asyncio.get_running_loop().create_future()
+
+    def on_update(t):
+        if not done.done() and has_quote(t, need):
+            done.set_result(True)
+
+    ticker.updateEvent += on_update
+    try:
+        return await asyncio.wait_for(asyncio.shield(done), timeout)
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        ticker.updateEvent -= on_update
+
+
+def quote_snapshot(ticker):
+    bid = clean_price(ticker.bid)
+    ask = clean_price(ticker.ask)
+    last = clean_price(ticker.last)
+    return {
+        "symbol": ticker.contract.localSymbol or ticker.contract.symbol,
+        "conId": ticker.contract.conId,
+        "bid": bid,
+        "ask": ask,
+        "last": last,
+        "mid": (bid + ask) / 2 if bid is not None and ask is not None else None,
+        "time": ticker.time.timestamp() if ticker.time else None,
+        "delayed": getattr(ticker, "marketDataType", 1) in DELAYED_TYPES,
+    }
+
+
+class QuoteListener:
+    """
+    Подписчик из чужого event loop. Обновления коалесцируются: сколько бы
+    тиков ни пришло, подписчик просыпается один раз и читает последний снимок.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self._event = asyncio.Event()
+
+    def notify(self):
+        self.loop.call_soon_threadsafe(self._event.set)
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
+
+
+class QuoteHold:
+    """
+    Подписчик без уведомлений: держит линию открытой, пока ждём котировку.
+    """
+
+    def notify(self):
+        pass
+
+
+class QuoteSubscription:
+    def __init__(self, contract, ticker):
+        self.contract = contract
+        self.ticker = ticker
+        self.listeners = set()
+        self.snapshot = quote_snapshot(ticker)
+
+
+class MarketDataManager:
+    """
+    Одна линия reqMktData на контракт, общая для всех подписчиков.
+    Линия отменяется, когда уходит последний подписчик.
+    Все методы, кроме чтения snapshot, вызываются в loop IBWorker.
+    """
+
+    def __init__(self, ib):
+        self.ib = ib
+        self._subs = {}  # conId -> QuoteSubscription
+        self.journal = None  # worker.journal.Journal, если котировки пишутся
+
+    def subscribe(self, contract, listener):
+        sub = self._subs.get(contract.conId)
+        if sub is None:
+            ticker = self.ib.reqMktData(contract, '', False, False)
+            sub = QuoteSubscription(contract, ticker)
+            ticker.updateEvent += self._on_update
+            self._subs[contract.conId] = sub
+        sub.listeners.add(listener)
+        if sub.snapshot["bid"] is not None or sub.snapshot["last"] is not None:
+            listener.notify()
+        return sub
+
+    def unsubscribe(self, con_id, listener):
+        sub = self._subs.get(con_id)
+        if sub is None:
+            return
+        sub.listeners.discard(listener)
+        if not sub.listeners:
+            sub.ticker.updateEvent -= self._on_update
+            self.ib.cancelMktData(sub.contract)
+            del self._subs[con_id]
+
+    def get(self, con_id):
+        return self._subs.get(con_id)
+
+    def resubscribe(self):
+        """
+        После переподключения старые Ticker мертвы — открываем линии заново
+        для всех текущих подписок, подписчики ничего не замечают.
+        """
+        for sub in self._subs.values():
+            sub.ticker.updateEvent -= self._on_update
+            sub.ticker = self.ib.reqMktData(sub.contract, '', False, False)
+            sub.ticker.updateEvent += self._on_update
+
+    def __len__(self):
+        return len(self._subs)
+
+    def _on_update(self, ticker):
+        if self.journal is not None:
+            self.journal.record_quote(ticker)
+        self.publish(ticker)
+
+    def publish(self, ticker):
+        """
+        Обновляет снимок и будит подписчиков.
+        """
+        sub = self._subs.get(ticker.contract.conId)
+        if sub is None:
+            return
+        sub.snapshot = quote_snapshot(ticker)
+        for listener in sub.listeners:
+            listener.notify()
+
+    def stats(self):
+        return {
+            "lines": len(self._subs),
+            "subscribers": sum(len(s.listeners) for s in self._subs.values()),
+        }
@@ -0,0 +1,118 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+# границы корзин гистограмм, секунды
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# trace id текущего запроса. Переживает переход в loop IBWorker:
+# run_coroutine_threadsafe создаёт задачу в контексте вызывающего
+trace_id = contextvars.ContextVar("trace_id", default=None)
+
+trace_log = logging.getLogger("ibworker.trace")
+
+
+def log_trace(event, **fields):
+    """
+    Структурированная (JSON) строка лога, только если у запроса есть trace id.
+    """
+    tid = trace_id.get()
+    if tid is None or not trace_log.isEnabledFor(logging.INFO):
+        return
+    trace_log.info(json.dumps({"ts": time.time(), "traceId": tid, "event": event, **fields}))
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(names, values):
+    return ",".join(f'{n}="{v}"' for n, v in zip(names, values))
+
+
+class Metrics:
+    """
+    Гистограммы и счётчики в памяти, отдаются в текстовом формате
+    Prometheus. Пишут и loop IBWorker, и loop API — поэтому под lock.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}  # name -> (help, label names, {label values: Histogram})
+        self._counters = {}    # name -> (help, label names, {label values: int})
+
+    def histogram(self, name, help, labels=()):
+        self._histograms.setdefault(name, (help, labels, {}))
+
+    def counter(self, name, help, labels=()):
+        self._counters.setdefault(name, (help, labels, {}))
+
+    def observe(self, name, labels, value):
+        series = self._histograms[name][2]
+        with self._lock:
+            hist = series.get(labels)
+            if hist is None:
+                hist = series[labels] = Histogram(self.buckets)
+            hist.observe(value)
+
+    def inc(self, name, labels=(), value=1):
+        series = self._counters[name][2]
+        with self._lock:
+            series[labels] = series.get(labels, 0) + value
+
+    def render(self, gauges=()):
+        """
+        gauges — [(name, help, value)] текущих значений, которые не
+        хранятся в реестре (inflight, линии market data, ...).
+        """
+        out = []
+        with self._lock:
+            for name, (help, names, series) in sorted(self._histograms.items()):
+                out.append(f"# HELP {name} {help}")
+                out.append(f"# TYPE {name} histogram")
+                for values, hist in sorted(series.items()):
+                    labels = _labels(names, values)
+                    sep = "," if labels else ""
+                    cumulative = 0
+                    for bound, n in zip((*self.buckets, "+Inf"), hist.counts):
+                        cumulative += n
+                        out.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+                    out.append(f"{name}_sum{{{labels}}} {hist.sum}")
+                    out.append(f"{name}_count{{{labels}}} {hist.count}")
+            for name, (help, names, series) in sorted(self._counters.items()):
+                out.append(f"# HELP {name} {help}")
+                out.append(f"# TYPE {name} counter")
+                for values, n in sorted(series.items()):
+                    out.append(f"{name}{{{_labels(names, values)}}} {n}")
+        for name, help, value in gauges:
+            out.append(f"# HELP {name} {help}")
+            out.append(f"# TYPE {name} gauge")
+            out.append(f"{name} {value}")
+        return "\n".join(out) + "\n"
+
+
+def worker_metrics():
+    """
+    Реестр с метриками IBWorker и API.
+    """
+    m = Metrics()
+    m.histogram("ibworker_call_seconds", "IBWorker call latency by stage: handoff to the worker loop, "
+                "run on the loop, total as seen by the caller", ("method", "stage"))
+    m.histogram("ibworker_tws_request_seconds", "TWS round-trip by request type", ("request",))
+    m.histogram("ibworker_queue_wait_seconds", "Wait for a scheduler token by priority class", ("priority",))
+    m.counter("ibworker_call_errors_total", "IBWorker calls that raised", ("method",))
+    m.histogram("api_request_seconds", "HTTP request latency by route", ("route", "method"))
+    return m
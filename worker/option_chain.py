@@ -0,0 +1,165 @@
+import time
+from bisect import bisect_left, bisect_right
+
+
+def _expiry_str(d):
+    return d.strip() if isinstance(d, str) else d.strftime('%Y%m%d')
+
+
+class ChainClass:
+    """
+    Цепочка одного tradingClass: отсортированные даты и страйки.
+    Данные со всех бирж (SMART, CBOE, ...) объединяются.
+    """
+
+    def __init__(self, trading_class, multiplier, exchanges, expirations, strikes):
+        self.trading_class = trading_class
+        self.multiplier = multiplier
+        self.exchanges = exchanges
+        self.expirations = expirations
+        self.expiration_set = frozenset(expirations)
+        self.strikes = strikes
+
+
+class OptionChain:
+    """
+    Все цепочки одного underlying. Поиск страйков — bisect по
+    отсортированным массивам, O(log n).
+    """
+
+    def __init__(self, symbol, chains):
+        self.symbol = symbol
+        self.fetched_at = time.monotonic()
+
+        merged = {}
+        for c in chains:
+            entry = merged.setdefault(c.tradingClass, (c.multiplier, [], set(), set()))
+            entry[1].append(c.exchange)
+            entry[2].update(_expiry_str(d) for d in c.expirations)
+            entry[3].update(float(s) for s in c.strikes)
+
+        self.classes = {
+            tc: ChainClass(tc, mult, exchanges, sorted(exps), sorted(strikes))
+            for tc, (mult, exchanges, exps, strikes) in merged.items()
+        }
+        self.expirations = sorted(set().union(*(c.expiration_set for c in self.classes.values())))
+        self.strikes = sorted(set().union(*(c.strikes for c in self.classes.values())))
+
+    def __bool__(self):
+        return bool(self.classes)
+
+    def _strikes(self, trading_class=None):
+        if trading_class is None:
+            return self.strikes
+        return self.classes[trading_class].strikes
+
+    def resolve_expiry(self, expiry=None):
+        """
+        Возвращает (expiry, ChainClass). Если expiry не задана или её нет
+        ни в одной цепочке — берётся ближайшая доступная дата.
+        """
+        if expiry:
+            for c in self.classes.values():
+                if expiry in c.expiration_set:
+                    return expiry, c
+        if not self.expirations:
+            return None, None
+        expiry = self.expirations[0]
+        for c in self.classes.values():
+            if expiry in c.expiration_set:
+                return expiry, c
+        return None, None
+
+    def atm_strike(self, price, right=None, trading_class=None):
+        """
+        Call — ближайший страйк >= price, Put — ближайший <= price,
+        без right — просто ближайший к price.
+        """
+        strikes = self._strikes(trading_class)
+        if not strikes:
+            return None
+
+        right = (right or '').upper()
+        if right == 'C':
+            i = bisect_left(strikes, price)
+            return strikes[i] if i < len(strikes) else strikes[-1]
+        if right == 'P':
+            i = bisect_right(strikes, price)
+            return strikes[i - 1] if i > 0 else strikes[0]
+
+        i = bisect_left(strikes, price)
+        if i == 0:
+            return strikes[0]
+        if i == len(strikes):
+            return strikes[-1]
+        lo, hi = strikes[i - 1], strikes[i]
+        return lo if price - lo <= hi - price else hi
+
+    def nearest_strikes(self, price, n, trading_class=None):
+        """
+        n страйков, ближайших к price, по возрастанию.
+        """
+        strikes = self._strikes(trading_class)
+        n = min(n, len(strikes))
+        lo = hi = bisect_left(strikes, price)
+        while hi - lo < n:
+            if lo == 0:
+                hi += 1
+            elif hi == len(strikes):
+                lo -= 1
+            elif price - strikes[lo - 1] <= strikes[hi] - price:
+                lo -= 1
+            else:
+                hi += 1
+        return strikes[lo:hi]
+
+    def strikes_between(self, lo, hi, trading_class=None):
+        """
+        Страйки в диапазоне [lo, hi] по возрастанию.
+        """
+        strikes = self._strikes(trading_class)
+        return strikes[bisect_left(strikes, lo):bisect_right(strikes, hi)]
+
+    def strike_offset(self, strike, steps, trading_class=None):
+        """
+        Страйк на steps позиций выше (steps > 0) или ниже strike.
+        """
+        strikes = self._strikes(trading_class)
+        i = bisect_left(strikes, strike) + steps
+        if i < 0 or i >= len(strikes):
+            return None
+        return strikes[i]
+
+
+class OptionChainIndex:
+    """
+    Кэш OptionChain по underlying. ttl=None — цепочка живёт до
+    invalidate() (один раз за сессию).
+    """
+
+    def __init__(self, ttl=12 * 60 * 60):
+        self.ttl = ttl
+        self._chains = {}
+
+    def get(self, symbol):
+        chain = self._chains.get(symbol)
+        if chain is None:
+            return None
+        if self.ttl is not None and time.monotonic() - chain.fetched_at > self.ttl:
+            self._chains.pop(symbol, None)
+            return None
+        return chain
+
+    def put(self, symbol, chains):
+        chain = OptionChain(symbol, chains)
+        self._chains[symbol] = chain
+        return chain
+
+    def invalidate(self, symbol=None):
+        if symbol is None:
+            self._chains.clear()
+        else:
+            self._chains.pop(symbol, None)
+
+    def symbols(self):
+        return list(self._chains)
@@ -0,0 +1,111 @@
+import asyncio
+
+from ib_insync import Order
+
+# статусы, в которых TWS ещё не подтвердил ордер
+PENDING_STATUSES = {'', 'PendingSubmit', 'ApiPending'}
+
+
+class OrderGroup:
+    """
+    Результат размещения связанной группы ордеров (parent + дочерние).
+    Итерируется по trades: parent, trail = group.
+    """
+
+    def __init__(self, trades, ack_ms, acked):
+        self.trades = trades
+        self.ack_ms = ack_ms
+        self.acked = acked
+
+    @property
+    def parent(self):
+        return self.trades[0]
+
+    def __iter__(self):
+        return iter(self.trades)
+
+    def __len__(self):
+        return len(self.trades)
+
+
+OFFSET_TYPES = ("abs", "pct", "atr")
+
+
+def round_to_tick(price, tick):
+    """
+    Ближайшая к price цена, кратная шагу tick (minTick контракта).
+    """
+    if not tick:
+        return round(price, 2)
+    # второй round убирает хвост двоичной арифметики: 0.1 * 3 -> 0.30000000000000004
+    return round(round(price / tick) * tick, 10)
+
+
+def bracket_prices(action, entry_price, stop_offset, take_profit_offset, offset_type="abs", atr=None,
+                   min_tick=0.01):
+    """
+    Цены стопа и тейк-профита от цены входа, округлённые до min_tick.
+    abs — в долларах, pct — в процентах от entry_price, atr — в ATR.
+    Для SELL стоп выше входа, тейк-профит ниже.
+    """
+    if offset_type == "abs":
+        stop_dist, tp_dist = stop_offset, take_profit_offset
+    elif offset_type == "pct":
+        stop_dist = entry_price * stop_offset / 100
+        tp_dist = entry_price * take_profit_offset / 100
+    elif offset_type == "atr":
+        if not atr:
+            raise ValueError("ATR is not available")
+        stop_dist, tp_dist = stop_offset * atr, take_profit_offset * atr
+    else:
+        raise ValueError(f"Unknown offset type {offset_type!r}, expected one of {OFFSET_TYPES}")
+
+    sign = 1 if action == "BUY" else -1
+    return (round_to_tick(entry_price - sign * stop_dist, min_tick),
+            round_to_tick(entry_price + sign * tp_dist, min_tick))
+
+
+def build_bracket(action, qty, limit_price, stop_price, take_profit_price, tif="DAY"):
+    """
+    LMT вход + STP стоп + LMT тейк-профит. Дочерние ноги — OCO через parentId.
+    """
+    exit_action = "SELL" if action == "BUY" else "BUY"
+    parent = Order(action=action, orderType="LMT", totalQuantity=qty, lmtPrice=limit_price, tif=tif)
+    stop = Order(action=exit_action, orderType="STP", totalQuantity=qty, auxPrice=stop_price, tif=tif)
+    take_profit = Order(action=exit_action, orderType="LMT", totalQuantity=qty, lmtPrice=take_profit_price, tif=tif)
+    return parent, [stop, take_profit]
+
+
+def link_group(parent, children, next_id):
+    """
+    Выделяет orderId всем ногам заранее и расставляет parentId/transmit:
+    всё, кроме последней ноги, уходит с transmit=False, последняя
+    с transmit=True отправляет группу целиком.
+    """
+    parent.orderId = parent.orderId or next_id()
+    for child in children:
+        child.orderId = child.orderId or next_id()
+        child.parentId = parent.orderId
+
+    legs = [parent, *children]
+    for order in legs:
+        order.transmit = False
+    legs[-1].transmit = True
+    return legs
+
+
+async def _wait_ack(trade):
+    while trade.orderStatus.status in PENDING_STATUSES:
+        await trade.statusEvent
+
+
+async def wait_acknowledged(trades, timeout):
+    """
+    Ждёт, пока TWS подтвердит все ордера (статус вышел из PendingSubmit).
+    Возвращает False, если за timeout подтвердились не все.
+    """
+    try:
+        await asyncio.wait_for(asyncio.gather(*(_wait_ack(t) for t in trades)), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
@@ -0,0 +1,116 @@
+from collections import defaultdict
+
+# статусы, при которых ордер ещё живой (как OrderStatus.ActiveStates в ib_insync)
+ACTIVE_STATUSES = {'PendingSubmit', 'ApiPending', 'PreSubmitted', 'Submitted'}
+
+# статусы, после которых ордер больше не исполнится
+DONE_STATUSES = {'Filled', 'Cancelled', 'ApiCancelled', 'Inactive'}
+
+# поля, которые не считаются изменением ордера
+_META_FIELDS = {'type', 'time', 'execution'}
+
+
+class OrderStore:
+    """
+    Последнее состояние каждого ордера по событиям trade_event, с индексами
+    по orderId, permId, symbol и status. Живёт в loop IBWorker.
+    """
+
+    def __init__(self):
+        self._orders = {}
+        self._by_order_id = {}
+        self._by_perm_id = {}
+        self._by_symbol = defaultdict(set)
+        self._by_status = defaultdict(set)
+
+    @staticmethod
+    def _key(event):
+        # ордера, заведённые не через API (из TWS), приходят с orderId <= 0
+        if event["orderId"] > 0:
+            return event["clientId"], event["orderId"]
+        return "perm", event["permId"]
+
+    def apply(self, event):
+        """
+        Применяет событие, возвращает дельту (изменившиеся поля) или None.
+        """
+        key = self._key(event)
+        if key == ("perm", 0):
+            return None
+
+        prev = self._orders.get(key)
+        old_key = self._by_perm_id.get(event["permId"]) if event["permId"] else None
+        if old_key is not None and old_key != key:
+            # ордер сменил ключ (появился orderId) — переносим запись
+            moved = self._remove(old_key)
+            if prev is None:
+                prev = moved
+        record = {k: v for k, v in event.items() if k not in _META_FIELDS}
+        record["updated"] = event["time"]
+
+        if prev is None:
+            delta = dict(record)
+        else:
+            delta = {k: v for k, v in record.items() if prev.get(k) != v and k != "updated"}
+            if not delta and "execution" not in event:
+                return None
+            delta["orderId"] = record["orderId"]
+            delta["permId"] = record["permId"]
+            delta["symbol"] = record["symbol"]
+            self._by_symbol[prev["symbol"]].discard(key)
+            self._by_status[prev["status"]].discard(key)
+
+        self._orders[key] = record
+        if record["orderId"] > 0:
+            self._by_order_id[record["orderId"]] = key
+        if record["permId"]:
+            self._by_perm_id[record["permId"]] = key
+        self._by_symbol[record["symbol"]].add(key)
+        self._by_status[record["status"]].add(key)
+
+        delta["type"] = event["type"]
+        if "execution" in event:
+            delta["execution"] = event["execution"]
+        return delta
+
+    def _remove(self, key):
+        record = self._orders.pop(key, None)
+        if record is None:
+            return None
+        if self._by_order_id.get(record["orderId"]) == key:
+            del self._by_order_id[record["orderId"]]
+        if self._by_perm_id.get(record["permId"]) == key:
+            del self._by_perm_id[record["permId"]]
+        self._by_symbol[record["symbol"]].discard(key)
+        self._by_status[record["status"]].discard(key)
+        return record
+
+    def get(self, order_id, client_id=None):
+        if client_id is not None:
+            return self._orders.get((client_id, order_id))
+        key = self._by_order_id.get(order_id)
+        return self._orders.get(key) if key else None
+
+    def by_perm_id(self, perm_id):
+        key = self._by_perm_id.get(perm_id)
+        return self._orders.get(key) if key else None
+
+    def query(self, symbol=None, status=None, active=None):
+        keys = None
+        if symbol:
+            keys = set(self._by_symbol.get(symbol.upper(), ()))
+        if status:
+            found = self._by_status.get(status, set())
+            keys = found if keys is None else keys & found
+        if active is not None:
+            live = set().union(*(self._by_status.get(s, set()) for s in ACTIVE_STATUSES))
+            if keys is None:
+                keys = live if active else set(self._orders) - live
+            else:
+                keys = keys & live if active else keys - live
+
+        records = self._orders.values() if keys is None else (self._orders[k] for k in keys)
+        return sorted(records, key=lambda r: (r["orderId"] <= 0, r["orderId"], r["permId"]))
+
+    def __len__(self):
+        return len(self._orders)
@@ -0,0 +1,275 @@
+import time
+from collections import deque
+
+from worker.order_store import DONE_STATUSES
+
+
+class RiskRejected(Exception):
+    """
+    Ордер не прошёл pre-trade проверку: rule — имя правила, reason — почему.
+    """
+
+    def __init__(self, rule, reason):
+        super().__init__(f"{rule}: {reason}")
+        self.rule = rule
+        self.reason = reason
+
+
+class RiskLimits:
+    """
+    Лимиты одного символа. None — правило для символа выключено.
+    max_notional — qty * price * multiplier одного ордера,
+    max_position — |позиция после исполнения| по символу,
+    max_qty — fat-finger лимит количества в одном ордере,
+    price_band — допустимое отклонение цены ордера от последней котировки (доля).
+    """
+
+    FIELDS = ("max_notional", "max_position", "max_qty", "price_band")
+
+    def __init__(self, max_notional=None, max_position=None, max_qty=None, price_band=None):
+        self.max_notional = max_notional
+        self.max_position = max_position
+        self.max_qty = max_qty
+        self.price_band = price_band
+
+    def merged(self, **overrides):
+        values = {f: getattr(self, f) for f in self.FIELDS}
+        values.update((k, v) for k, v in overrides.items() if v is not None)
+        return RiskLimits(**values)
+
+    def as_dict(self):
+        return {f: getattr(self, f) for f in self.FIELDS}
+
+
+class OrderCheck:
+    """
+    Всё, что нужно правилам об одном ордере. Собирается один раз на проверку.
+    """
+
+    def __init__(self, contract, action, qty, price, limits, position, quote, reserved=0.0):
+        self.contract = contract
+        self.symbol = contract.symbol
+        self.action = action
+        self.qty = qty
+        self.signed_qty = qty if action == "BUY" else -qty
+        self.price = price
+        self.multiplier = float(contract.multiplier or 1)
+        self.limits = limits
+        self.position = position
+        self.reserved = reserved  # остаток живых и ещё не отправленных ордеров, со знаком
+        self.quote = quote
+
+
+# --- правила: check -> строка с причиной отказа или None ---
+
+def check_max_qty(check):
+    limit = check.limits.max_qty
+    if limit is not None and check.qty > limit:
+        return f"qty {check.qty} exceeds fat-finger limit {limit}"
+
+
+def check_max_notional(check):
+    limit = check.limits.max_notional
+    price = check.price or (check.quote and (check.quote["mid"] or check.quote["last"]))
+    if limit is None or not price:
+        return None
+    notional = check.qty * price * check.multiplier
+    if notional > limit:
+        return f"notional {notional:.2f} exceeds limit {limit}"
+
+
+def check_max_position(check):
+    limit = check.limits.max_position
+    if limit is None:
+        return None
+    # рабочие ордера считаются исполненными: иначе пачка мелких ордеров
+    # по одному проходит лимит, который не прошёл бы их сумма
+    current = check.position + check.reserved
+    projected = current + check.signed_qty
+    # сокращение позиции разрешено всегда
+    if abs(projected) > limit and abs(projected) > abs(current):
+        return f"position {check.symbol} would be {projected:g}, limit {limit}"
+
+
+def check_price_band(check):
+    band = check.limits.price_band
+    if band is None or not check.price or not check.quote:
+        return None
+    ref = check.quote["last"] or check.quote["mid"]
+    if not ref:
+        return None
+    deviation = abs(check.price - ref) / ref
+    if deviation > band:
+        return f"price {check.price} is {deviation:.1%} away from last {ref}, band {band:.1%}"
+
+
+DEFAULT_RULES = (
+    ("max_qty", check_max_qty),
+    ("max_notional", check_max_notional),
+    ("max_position", check_max_position),
+    ("price_band", check_price_band),
+)
+
+
+class _RuleStats:
+    def __init__(self):
+        self.rejected = 0
+        self.last_reason = None
+
+
+class Reservation:
+    """
+    Количество, занятое пропущенным ордером, пока он не исполнен или не снят.
+    """
+
+    def __init__(self, key, qty):
+        self.key = key  # (symbol, secType), как позиция в AccountModel
+        self.qty = qty  # со знаком
+        self.side = 1 if qty >= 0 else -1
+        self.order_id = None
+        self.exec_ids = set()
+
+
+class RiskEngine:
+    """
+    Pre-trade проверки в процессе, без запросов в TWS: позиции — из
+    AccountModel, котировки — из открытых линий MarketDataManager, лимиты
+    по символу посчитаны заранее (словарь, O(1)). Правила подключаемые:
+    add_rule(name, fn), fn(OrderCheck) -> причина отказа или None.
+    Лимит ордеров в секунду проверяется последним и считает только
+    пропущенные ордера. Вызывается в loop IBWorker.
+
+    Пропущенный ордер резервирует своё количество: check() возвращает
+    Reservation, bind() привязывает её к orderId, apply() по событиям
+    ордера уменьшает резерв до остатка и снимает его на исполнении,
+    отмене или отказе. release() — ордер так и не ушёл в TWS.
+    """
+
+    def __init__(self, account, market_data, default_limits=None, max_orders_per_sec=None, rules=DEFAULT_RULES):
+        self.account = account
+        self.market_data = market_data
+        self.default_limits = default_limits or RiskLimits()
+        self.max_orders_per_sec = max_orders_per_sec
+        self._limits = {}  # symbol -> RiskLimits (уже слитые с default)
+        self._rules = list(rules)
+        self._sent = deque()  # время пропущенных ордеров за последнюю секунду
+        self._reserved = {}  # (symbol, secType) -> сумма резервов со знаком
+        self._reservations = {}  # orderId -> Reservation
+        self.checked = 0
+        self._stats = {name: _RuleStats() for name, _ in self._rules}
+        self._stats["max_orders_per_sec"] = _RuleStats()
+
+    def add_rule(self, name, fn):
+        self._rules.append((name, fn))
+        self._stats.setdefault(name, _RuleStats())
+
+    def set_limits(self, symbol, **limits):
+        """
+        Лимиты символа поверх default_limits.
+        """
+        symbol = symbol.upper()
+        self._limits[symbol] = self.default_limits.merged(**limits)
+
+    def limits_for(self, symbol):
+        return self._limits.get(symbol, self.default_limits)
+
+    def check(self, contract, action, qty, price=None):
+        """
+        Бросает RiskRejected при первом сработавшем правиле. Пропущенный
+        ордер сразу резервирует qty — следующая проверка, в том числе в
+        той же пачке, его уже видит.
+        """
+        self.checked += 1
+        key = (contract.symbol, contract.secType)
+        sub = self.market_data.get(contract.conId)
+        check = OrderCheck(
+            contract, action, qty, price,
+            limits=self.limits_for(contract.symbol),
+            position=self.account.position_qty(*key),
+            quote=sub.snapshot if sub is not None else None,
+            reserved=self._reserved.get(key, 0.0),
+        )
+        for name, rule in self._rules:
+            reason = rule(check)
+            if reason:
+                self._reject(name, reason)
+
+        if self.max_orders_per_sec is not None:
+            now = time.monotonic()
+            while self._sent and now - self._sent[0] >= 1.0:
+                self._sent.popleft()
+            if len(self._sent) >= self.max_orders_per_sec:
+                self._reject("max_orders_per_sec", f"more than {self.max_orders_per_sec} orders per second")
+            self._sent.append(now)
+
+        reservation = Reservation(key, float(check.signed_qty))
+        self._reserved[key] = self._reserved.get(key, 0.0) + reservation.qty
+        return reservation
+
+    def bind(self, reservation, order_id):
+        """
+        Привязывает резерв к отправленному ордеру; дальше его ведёт apply().
+        """
+        reservation.order_id = order_id
+        self._reservations[order_id] = reservation
+
+    def release(self, reservation):
+        if reservation.order_id is not None:
+            if self._reservations.get(reservation.order_id) is not reservation:
+                return
+            del self._reservations[reservation.order_id]
+        self._adjust(reservation, 0.0)
+
+    def apply(self, event):
+        """
+        Событие ордера (worker.events.trade_event): исполнение уменьшает
+        резерв, Filled/Cancelled/Inactive снимают его целиком.
+        """
+        reservation = self._reservations.get(event["orderId"])
+        if reservation is None:
+            return
+        if event["status"] in DONE_STATUSES:
+            self.release(reservation)
+            return
+        execution = event.get("execution")
+        if execution is not None and execution["execId"] not in reservation.exec_ids:
+            reservation.exec_ids.add(execution["execId"])
+            self.hold(reservation, max(abs(reservation.qty) - execution["shares"], 0.0))
+
+    def hold(self, reservation, qty):
+        """
+        Оставляет в резерве qty (без знака) — для ордеров, которые
+        исполняет не один orderId, например алгоритмический родитель.
+        """
+        self._adjust(reservation, qty * reservation.side)
+
+    def _adjust(self, reservation, qty):
+        total = self._reserved.get(reservation.key, 0.0) + qty - reservation.qty
+        reservation.qty = qty
+        if abs(total) < 1e-9:
+            self._reserved.pop(reservation.key, None)
+        else:
+            self._reserved[reservation.key] = total
+
+    def reserved(self, symbol, sec_type="STK"):
+        return self._reserved.get((symbol, sec_type), 0.0)
+
+    def _reject(self, rule, reason):
+        stats = self._stats[rule]
+        stats.rejected += 1
+        stats.last_reason = reason
+        raise RiskRejected(rule, reason)
+
+    def stats(self):
+        return {
+            "checked": self.checked,
+            "maxOrdersPerSec": self.max_orders_per_sec,
+            "defaultLimits": self.default_limits.as_dict(),
+            "symbolLimits": {s: l.as_dict() for s, l in self._limits.items()},
+            "reserved": {f"{symbol}:{sec_type}": qty for (symbol, sec_type), qty in self._reserved.items()},
+            "workingOrders": len(self._reservations),
+            "rules": {
+                name: {"rejected": s.rejected, "lastReason": s.last_reason}
+                for name, s in self._stats.items()
+            },
+        }
@@ -0,0 +1,130 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+# классы приоритета: меньше — раньше
+PRIORITY_ORDER = 0      # ордера и отмены
+PRIORITY_QUOTE = 1      # котировки, market data
+PRIORITY_REFERENCE = 2  # цепочки, контракты, история, аккаунт
+
+PRIORITY_NAMES = {
+    PRIORITY_ORDER: "order",
+    PRIORITY_QUOTE: "quote",
+    PRIORITY_REFERENCE: "reference",
+}
+
+
+class _ClassStats:
+    def __init__(self):
+        self.granted = 0
+        self.waited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, wait):
+        self.granted += 1
+        if wait > 0:
+            self.waited += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+
+class RequestScheduler:
+    """
+    Токен-бакет на исходящие сообщения в TWS (TWS рвёт соединение при
+    ~50 msg/s). Когда токенов нет, запросы ждут в очереди по приоритету:
+    ордера обгоняют котировки, котировки — справочные данные.
+    Работает в loop IBWorker.
+    """
+
+    def __init__(self, rate=40.0, burst=None, metrics=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._queue = []  # (priority, seq, cost, future, enqueued_at)
+        self._seq = itertools.count()
+        self._timer = None
+        self._stats = {p: _ClassStats() for p in PRIORITY_NAMES}
+        self.metrics = metrics
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, priority=PRIORITY_REFERENCE, cost=1):
+        """
+        Ждёт cost токенов. Больше capacity за раз не выдаётся —
+        крупные пачки берутся частями.
+        """
+        while cost > 0:
+            take = min(cost, self.capacity)
+            await self._acquire(priority, take)
+            cost -= take
+
+    async def _acquire(self, priority, cost):
+        self._refill()
+        if not self._queue and self._tokens >= cost:
+            self._tokens -= cost
+            self._record(priority, 0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), cost, future, time.monotonic()))
+        self._drain()
+        await future
+
+    def _on_timer(self):
+        self._timer = None
+        self._drain()
+
+    def _drain(self):
+        self._refill()
+        while self._queue:
+            priority, _, cost, future, enqueued_at = self._queue[0]
+            if future.done():  # ожидающий отменён
+                heapq.heappop(self._queue)
+                continue
+            if self._tokens < cost:
+                break
+            heapq.heappop(self._queue)
+            self._tokens -= cost
+            self._record(priority, time.monotonic() - enqueued_at)
+            future.set_result(None)
+
+        if self._queue and self._timer is None:
+            cost = self._queue[0][2]
+            delay = max(cost - self._tokens, 0) / self.rate
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _record(self, priority, wait):
+        self._stats[priority].record(wait)
+        if self.metrics is not None:
+            self.metrics.observe("ibworker_queue_wait_seconds", (PRIORITY_NAMES[priority],), wait)
+
+    def depth(self):
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _, future, _ in self._queue:
+            if not future.done():
+                depth[PRIORITY_NAMES[priority]] += 1
+        return depth
+
+    def stats(self):
+        self._refill()
+        return {
+            "rate": self.rate,
+            "capacity": self.capacity,
+            "tokens": self._tokens,
+            "queueDepth": self.depth(),
+            "classes": {
+                PRIORITY_NAMES[p]: {
+                    "granted": s.granted,
+                    "waited": s.waited,
+                    "avgWaitMs": s.wait_total / s.waited * 1000 if s.waited else 0.0,
+                    "maxWaitMs": s.wait_max * 1000,
+                }
+                for p, s in self._stats.items()
+            },
+        }
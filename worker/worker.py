@@ -1,221 +1,1908 @@
-from ib_insync import IB, Stock, Option, Order, Index
+from ib_insync import IB, Contract, Stock, Option, Order, Index, util
 import asyncio, threading
+import concurrent.futures
+import datetime
 import math
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from worker.contract_cache import ContractCache
+from worker.contract_db import ContractDB
+from worker.option_chain import OptionChainIndex
+from worker.market_data import (NO_QUOTE_CODES, MarketDataManager, QuoteHold, QuoteListener, clean_price,
+                                has_quote, quote_snapshot, ticker_price, wait_for_quote)
+from worker.events import EventHub, loop_queue_deliver, trade_event
+from worker.order_store import OrderStore
+from worker.account import AccountModel
+from worker.risk import RiskEngine, RiskRejected
+from worker.metrics import worker_metrics, log_trace
+from worker.greeks import DEFAULT_RATE, MODELS, chain_greeks, year_fraction
+from worker.journal import Journal, JournalReader, ReplaySession, journal_files, replay
+from worker.history import (BAR_DTYPE, BAR_SIZES, NO_DATA_MARKERS, BarStore, HistoricalPacer, bars_to_array,
+                            duration_str, split_range)
+from worker.scheduler import RequestScheduler, PRIORITY_ORDER, PRIORITY_QUOTE, PRIORITY_REFERENCE
+from worker.combos import build_bag, net_price, resolve_strikes, strategy_legs
+from worker.order_groups import OrderGroup, bracket_prices, build_bracket, link_group, wait_acknowledged
+from worker.algos import ALGO_TYPES, CHILD_PRICE_MODES, AlgoJob, AlgoRunner, slice_targets, vwap_weights
+
+INDEX_SYMBOLS = ['SPX', 'NDX', 'RUT']
+
+# Профиль объёма для VWAP — минутные бары за столько последних дней (кэш BarStore)
+VWAP_LOOKBACK_DAYS = 5
+# Сколько завершённых алгоритмических задач помнить для /algo_orders
+MAX_FINISHED_ALGOS = 256
+
+# Символы, которые квалифицируются сразу после подключения (кнопки в gui_tk)
+DEFAULT_WATCHLIST = ("NVDA", "NVDL", "TSLA", "TSLL", "SPX")
+
 
 class IBWorker:
-    def __init__(self):
-        self.ib = IB()
+    def __init__(self, ib=None, watchlist=DEFAULT_WATCHLIST, contract_cache=None, chain_ttl=12 * 60 * 60,
+                 max_concurrency=10, ticker_batch_size=20, quote_max_rate=10.0, ack_timeout=5.0,
+                 msg_rate=40.0, pool_size=1, chain_index=None, market_data=None, ib_factory=IB,
+                 ready_timeout=10.0, reconnect_delay=1.0, reconnect_max_delay=30.0, account_pnl=True,
+                 risk_limits=None, max_orders_per_sec=None, metrics=None, history_dir="data/history",
+                 history_store=None, journal_dir=None, quote_timeout=2.0, max_quote_lines=50,
+                 market_data_type=None, contract_db_path=None, contract_db=None):
+        self.ib = ib or ib_factory()
         self.connected = False
         self.loop = None
+        self.client_id = None
+        self.inflight = 0
+        # гистограммы задержек; общий реестр для всего пула
+        self.metrics = metrics if metrics is not None else worker_metrics()
+
+        # жизненный цикл подключения: supervisor в loop IBWorker
+        # переподключается с экспоненциальной задержкой
+        self.ready_timeout = ready_timeout
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.reconnects = 0
+        self.last_connected_at = None
+        self.last_disconnected_at = None
+        self._loop_started = concurrent.futures.Future()
+        self._ready = asyncio.Event()
+        self._disconnected = asyncio.Event()
+        self.ib.disconnectedEvent += self._on_disconnected
+        self.watchlist = tuple(watchlist or ())
+        self.contracts = contract_cache if contract_cache is not None else ContractCache()
+        self.chains = chain_index if chain_index is not None else OptionChainIndex(ttl=chain_ttl)
+        # контракты и цепочки на диске: общие для пула и для других процессов
+        if contract_db is None and contract_db_path:
+            contract_db = ContractDB(contract_db_path)
+        self.contract_db = contract_db
+        self._chain_requests = {}
+        # ограничение параллельных snapshot/secdef запросов в пачечных операциях
+        self.ticker_batch_size = ticker_batch_size
+        self._pacing = asyncio.Semaphore(max_concurrency)
+        self.market_data = market_data if market_data is not None else MarketDataManager(self.ib)
+        self.quote_max_rate = quote_max_rate
+        # ожидание первой котировки: дедлайн, бюджет временных линий
+        # (остальное — snapshot), тип данных (3 — delayed, если нет live)
+        self.quote_timeout = quote_timeout
+        self.max_quote_lines = max_quote_lines
+        self.market_data_type = market_data_type
+        # временные линии читателя — в его собственном подключении
+        self._quote_lines = self.market_data if self.market_data.ib is self.ib else MarketDataManager(self.ib)
+        self._quote_waiters = {}  # conId -> set(Future), разрешаются ошибкой TWS
+        self._quote_errors = {}  # conId -> текст ошибки
+        self.order_events = EventHub()
+        self.orders = OrderStore()
+        self.order_deltas = EventHub()
+        # алгоритмические родители (TWAP/VWAP/iceberg) и их дочерние ордера
+        self.algo_jobs = OrderedDict()  # id -> AlgoJob
+        self.algo_events = EventHub()
+        self._algo_children = {}  # orderId -> AlgoJob
+        self._algo_seq = 0
+        self._bind_order_events()
+        # журнал котировок и событий ордеров (только основное подключение)
+        self.journal_dir = journal_dir
+        self.journal = Journal(journal_dir) if journal_dir else None
+        if self.journal is not None:
+            self.market_data.journal = self.journal
+        self._replay = None
+        # счета, позиции и PnL по push-событиям; reqPnL/reqPnLSingle
+        # открываются только в основном подключении
+        self.account = AccountModel()
+        self.account_pnl = account_pnl
+        self._pnl_single_requests = set()  # (account, conId)
+        self._bind_account_events()
+        # ошибки TWS по reqId (последние), чтобы отличать пустой ответ от отказа
+        self._request_errors = OrderedDict()
+        self.ib.errorEvent += self._on_error
+        # исторические бары: кэш на диске общий для пула, лимиты TWS — на подключение
+        self.history = history_store if history_store is not None else BarStore(history_dir)
+        self._history_pacer = HistoricalPacer()
+        self._history_locks = {}
+        # pre-trade проверки по локальным позициям и котировкам
+        self.risk = RiskEngine(self.account, self.market_data, risk_limits, max_orders_per_sec)
+        self.ack_timeout = ack_timeout
+        self._atr_cache = {}  # (conId, period) -> (date, atr)
+        self._min_ticks = {}  # conId -> minTick из ContractDetails
+        # все исходящие запросы в TWS проходят через токен-бакет
+        self.scheduler = RequestScheduler(rate=msg_rate, metrics=self.metrics)
+
+        # Пул дополнительных подключений (свой clientId, loop и токен-бакет)
+        # для read-only запросов. Кэши контрактов и цепочек общие, линии
+        # market data живут только в основном подключении.
+        # Ордера всегда идут через это, основное подключение.
+        self.readers = [
+            IBWorker(ib_factory(), watchlist=(), contract_cache=self.contracts, chain_index=self.chains,
+                     max_concurrency=max_concurrency, ticker_batch_size=ticker_batch_size, msg_rate=msg_rate,
+                     market_data=self.market_data, account_pnl=False, metrics=self.metrics,
+                     history_store=self.history, quote_timeout=quote_timeout, max_quote_lines=max_quote_lines,
+                     market_data_type=market_data_type, contract_db=self.contract_db)
+            for _ in range(pool_size - 1)
+        ]
 
     def _connect_thread(self, host, port, clientId):
         loop = asyncio.new_event_loop()
         self.loop = loop
         asyncio.set_event_loop(loop)
-        try:
-            self.ib.connect(host, port, clientId)
+        loop.create_task(self._supervise_async(host, port, clientId))
+        self._loop_started.set_result(loop)
+        loop.run_forever()
+
+    async def _supervise_async(self, host, port, clientId):
+        """
+        Подключается и держит подключение: после обрыва переподключается
+        с экспоненциальной задержкой и восстанавливает состояние.
+        """
+        delay = self.reconnect_delay
+        first = True
+        while True:
+            self._disconnected.clear()  # всё, что пришло до этой попытки, уже неактуально
+            # connectAsync заново присылает значения счетов и позиции;
+            # закрытые за время обрыва позиции иначе так и остались бы в модели
+            self.account.reset()
+            try:
+                await self._tws("connect", self.ib.connectAsync(host, port, clientId))
+            except Exception as e:
+                print(f"API connection failed: {e!r}, retry in {delay:.1f}s")
+                self.ib.disconnect()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.reconnect_max_delay)
+                continue
+
+            delay = self.reconnect_delay
             self.connected = True
-            print("Connected to IBKR")
-            loop.run_forever()
-        except Exception as e:
-            print("API connection failed:", e)
+            self.last_connected_at = time.time()
+            print(f"Connected to IBKR (clientId={clientId})")
+            try:
+                await self._on_connected_async(first)
+            except Exception as e:
+                print("State resync after connect failed:", repr(e))
+            first = False
+            self._ready.set()
+
+            await self._disconnected.wait()
+            self._disconnected.clear()
+            self.reconnects += 1
+            print(f"Disconnected from IBKR (clientId={clientId}), reconnecting")
+
+    def _on_disconnected(self):
+        self.connected = False
+        self.last_disconnected_at = time.time()
+        self._ready.clear()
+        self._disconnected.set()
+
+    async def _on_connected_async(self, first):
+        """
+        Первый старт — прогрев кэша. После переподключения: заново
+        открыть линии market data, пересобрать стор ордеров из
+        открытых ордеров и исполнений (их подтягивает connectAsync)
+        и сбросить цепочки, которые могли измениться за время обрыва.
+        """
+        if self.market_data_type:
+            # тип данных живёт в сессии — после переподключения заново
+            await self.scheduler.acquire(PRIORITY_QUOTE)
+            self.ib.reqMarketDataType(self.market_data_type)
+        if self.contract_db is not None and self.market_data.ib is self.ib:
+            await asyncio.get_running_loop().run_in_executor(None, self.contract_db.purge_expired)
+        if not first:
+            self.chains.invalidate()
+            if self.market_data.ib is self.ib:
+                await self.scheduler.acquire(PRIORITY_QUOTE, len(self.market_data))
+                self.market_data.resubscribe()
+            for trade in self.ib.trades():
+                # известные ордера без изменений повторно не публикуем и не журналируем
+                known = (self.orders.by_perm_id(trade.order.permId)
+                         or self.orders.get(trade.order.orderId, trade.order.clientId))
+                state = (trade.orderStatus.status, float(trade.orderStatus.filled))
+                if known is None or (known["status"], known["filled"]) != state:
+                    self._on_trade_event("open", trade)
+        await self._subscribe_pnl_async()
+        await self._warm_contract_cache_async()
+
+    # ------------------ ГОТОВНОСТЬ ------------------
+
+    async def _wait_ready_loop_async(self, timeout):
+        # таймаут — обычный ответ False, а не ошибка вызова в метриках
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _is_ready(self):
+        # connected ставится до пересинхронизации состояния, _ready — после
+        return self.loop is not None and self._ready.is_set()
+
+    async def wait_ready_async(self, timeout=None):
+        """
+        Ждёт, пока подключение готово (после старта или переподключения).
+        Возвращает False по таймауту.
+        """
+        if self._is_ready():
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self._loop_started)), timeout)
+        except asyncio.TimeoutError:
+            return False
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        return await self._run(self._wait_ready_loop_async(remaining))
+
+    async def _ready_reader(self):
+        reader = self._reader()
+        if reader is None and await self.wait_ready_async(self.ready_timeout):
+            reader = self._reader()
+        return reader
+
+    def health(self):
+        workers = (self, *self.readers)
+        up = sum(1 for w in workers if w.connected)
+        return {
+            "status": "ok" if up == len(workers) else ("degraded" if self.connected else "down"),
+            "connected": self.connected,
+            "reconnects": self.reconnects,
+            "lastConnectedAt": self.last_connected_at,
+            "lastDisconnectedAt": self.last_disconnected_at,
+            "pool": self.pool_stats(),
+        }
 
     def start(self, host='127.0.0.1', port=7496, clientId=1):
+        self.client_id = clientId
         threading.Thread(
             target=self._connect_thread, args=(host, port, clientId), daemon=True
         ).start()
+        for i, reader in enumerate(self.readers, start=1):
+            reader.start(host, port, clientId + i)
+
+    # ------------------ ПУЛ ПОДКЛЮЧЕНИЙ ------------------
+
+    def _reader(self):
+        """
+        Наименее загруженное подключение для read-only запросов
+        (тикеры, secdef, аккаунт). None — если ни одно не готово.
+        """
+        ready = [w for w in (self, *self.readers) if w._is_ready()]
+        if not ready:
+            return None
+        return min(ready, key=lambda w: w.inflight)
+
+    def pool_stats(self):
+        return [
+            {
+                "clientId": w.client_id,
+                "role": "orders" if w is self else "read",
+                "connected": w.connected,
+                "inflight": w.inflight,
+                "tokens": w.scheduler.stats()["tokens"],
+            }
+            for w in (self, *self.readers)
+        ]
+
+    # ------------------ МОСТ МЕЖДУ LOOP'АМИ ------------------
+
+    @staticmethod
+    def _method_name(coro):
+        # _get_atm_options_async -> get_atm_options
+        name = coro.__name__.lstrip("_")
+        return name[:-len("_async")] if name.endswith("_async") else name
+
+    def _submit(self, coro):
+        """
+        Планирует корутину в loop IBWorker, возвращает concurrent.futures.Future.
+        """
+        traced = self._traced(coro, self._method_name(coro), time.perf_counter())
+        return asyncio.run_coroutine_threadsafe(traced, self.loop)
+
+    def submit(self, coro):
+        """
+        Для потоков без event loop (Tk): планирует корутину IBWorker и сразу
+        возвращает concurrent.futures.Future, результат — через add_done_callback.
+        """
+        if self.loop is None:
+            self._loop_started.result(self.ready_timeout)
+        return self._submit(coro)
+
+    async def _traced(self, coro, method, submitted):
+        """
+        Время от _submit до старта в loop IBWorker (handoff) и время
+        выполнения в loop (run).
+        """
+        started = time.perf_counter()
+        handoff = started - submitted
+        self.metrics.observe("ibworker_call_seconds", (method, "handoff"), handoff)
+        error = None
+        try:
+            return await coro
+        except Exception as e:
+            error = repr(e)
+            self.metrics.inc("ibworker_call_errors_total", (method,))
+            raise
+        finally:
+            run = time.perf_counter() - started
+            self.metrics.observe("ibworker_call_seconds", (method, "run"), run)
+            log_trace("call", method=method, clientId=self.client_id, handoffMs=handoff * 1000,
+                      runMs=run * 1000, error=error)
+
+    async def _tws(self, request, awaitable):
+        """
+        Запрос в TWS с замером round-trip по типу запроса.
+        """
+        t0 = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            elapsed = time.perf_counter() - t0
+            self.metrics.observe("ibworker_tws_request_seconds", (request,), elapsed)
+            log_trace("tws", request=request, clientId=self.client_id, ms=elapsed * 1000)
+
+    async def _run(self, coro):
+        """
+        await корутины IBWorker из чужого event loop (например, FastAPI).
+        Вызывающий поток не блокируется — ждёт только корутина.
+        """
+        method = self._method_name(coro)
+        t0 = time.perf_counter()
+        self.inflight += 1
+        try:
+            return await asyncio.wrap_future(self._submit(coro))
+        finally:
+            self.inflight -= 1
+            self.metrics.observe("ibworker_call_seconds", (method, "total"), time.perf_counter() - t0)
+
+    def metrics_text(self):
+        """
+        Метрики в текстовом формате Prometheus (для /metrics).
+        """
+        workers = (self, *self.readers)
+        cache = self.contracts.stats()
+        md = self.market_data.stats()
+        return self.metrics.render([
+            ("ibworker_connected", "Connections in the pool that are up", sum(w.connected for w in workers)),
+            ("ibworker_inflight", "Calls in flight across the pool", sum(w.inflight for w in workers)),
+            ("ibworker_reconnects", "Reconnects of the order connection", self.reconnects),
+            ("ibworker_market_data_lines", "Open reqMktData lines", md["lines"]),
+            ("ibworker_market_data_subscribers", "Streaming quote subscribers", md["subscribers"]),
+            ("ibworker_contract_cache_size", "Qualified contracts in cache", cache["size"]),
+            ("ibworker_contract_cache_hit_ratio", "Contract cache hit ratio", cache["hit_ratio"] or 0.0),
+        ])
 
     def build_contract(self, symbol, is_option=False, expiry=None, strike=None, right="C"):
         if is_option:
-            contract = Option(symbol, expiry, strike, right, 'SMART')
+            contract = Option(symbol, expiry, strike, right, 'SMART', multiplier='100', currency='USD')
         else:
-            contract = Stock(symbol, 'SMART', 'USD')
+            contract = self._underlying_contract(symbol)
         return contract
 
+    @staticmethod
+    def _underlying_contract(symbol):
+        if symbol in INDEX_SYMBOLS:
+            return Index(symbol, 'CBOE', 'USD')
+        return Stock(symbol, 'SMART', 'USD')
+
+    # ------------------ КЭШ КОНТРАКТОВ ------------------
+
+    async def _qualify_async(self, contract, priority=PRIORITY_REFERENCE):
+        """
+        Квалифицирует контракт через кэш. None — если TWS его не нашёл.
+        """
+        return (await self._qualify_many_async([contract], priority))[0]
+
+    async def _qualify_many_async(self, contracts, priority=PRIORITY_REFERENCE):
+        """
+        Квалифицирует список контрактов: попадания берутся из кэша, затем
+        из ContractDB (устаревшие записи обновляются в фоне), остальное
+        уходит в TWS одним вызовом qualifyContractsAsync.
+        Результат в том же порядке, None на месте ненайденных.
+        """
+        keys = [ContractCache.key(c) for c in contracts]
+        result = [self.contracts.get(k) for k in keys]
+
+        missing = {}
+        for i, (key, cached) in enumerate(zip(keys, result)):
+            if cached is None:
+                missing.setdefault(key, []).append(i)
+        if not missing:
+            return result
+
+        if self.contract_db is not None:
+            stale = []
+            stored = await asyncio.get_running_loop().run_in_executor(
+                None, self.contract_db.get_contracts, list(missing))
+            for key, (contract, is_stale) in stored.items():
+                self.contracts.put(key, contract)
+                for i in missing.pop(key):
+                    result[i] = contract
+                if is_stale:
+                    stale.append((key, contract))
+            if stale:
+                self._background(self._refresh_contracts_async(stale))
+            if not missing:
+                return result
+
+        pending = [contracts[idxs[0]] for idxs in missing.values()]
+        await self.scheduler.acquire(priority, len(pending))
+        await self._tws("qualifyContracts", self.ib.qualifyContractsAsync(*pending))
+
+        qualified = []
+        for contract, (key, idxs) in zip(pending, missing.items()):
+            if not contract.conId:
+                continue
+            self.contracts.put(key, contract)
+            qualified.append((key, contract))
+            for i in idxs:
+                result[i] = contract
+        if self.contract_db is not None and qualified:
+            self._background(asyncio.get_running_loop().run_in_executor(None, self.contract_db.put_contracts, qualified))
+        return result
+
+    def _background(self, awaitable):
+        """
+        Фоновая задача в loop IBWorker: ошибку печатаем, а не теряем.
+        """
+        task = asyncio.ensure_future(awaitable)
+        task.add_done_callback(
+            lambda t: t.cancelled() or t.exception() is None or print("Background task failed:", repr(t.exception()))
+        )
+        return task
+
+    async def _refresh_contracts_async(self, items):
+        """
+        Переквалифицирует устаревшие записи ContractDB без conId — контракт,
+        который TWS больше не находит, удаляется из кэша и с диска.
+        """
+        fresh = []
+        for _, contract in items:
+            copy = Contract.create(**util.dataclassNonDefaults(contract))
+            copy.conId = 0
+            fresh.append(copy)
+        await self.scheduler.acquire(PRIORITY_REFERENCE, len(fresh))
+        await self._tws("qualifyContracts", self.ib.qualifyContractsAsync(*fresh))
+
+        found = []
+        for (key, _), contract in zip(items, fresh):
+            if contract.conId:
+                self.contracts.put(key, contract)
+                found.append((key, contract))
+            else:
+                self.contracts.invalidate(key)
+                await asyncio.get_running_loop().run_in_executor(None, self.contract_db.delete_contract, key)
+        await asyncio.get_running_loop().run_in_executor(None, self.contract_db.put_contracts, found)
+
+    async def _warm_contract_cache_async(self):
+        if not self.watchlist:
+            return
+        contracts = [self._underlying_contract(s.upper()) for s in self.watchlist]
+        qualified = await self._qualify_many_async(contracts)
+        print("Contract cache warmed:", [c.symbol for c in qualified if c])
+
+    def contract_cache_stats(self):
+        stats = self.contracts.stats()
+        if self.contract_db is not None:
+            stats["db"] = self.contract_db.stats()
+        return stats
+
+    # ------------------ OPTION CHAINS ------------------
+
+    async def _get_chain_async(self, underlying):
+        """
+        OptionChain для квалифицированного underlying. reqSecDefOptParams
+        уходит в TWS только при промахе и кэша, и ContractDB (устаревшая
+        цепочка с диска отдаётся сразу и обновляется в фоне); параллельные
+        запросы одного символа ждут один и тот же вызов.
+        """
+        chain = self.chains.get(underlying.symbol)
+        if chain is not None:
+            return chain
+
+        if self.contract_db is not None:
+            params, stale = await asyncio.get_running_loop().run_in_executor(
+                None, self.contract_db.get_chain, underlying.symbol)
+            if params:
+                if stale:
+                    self._chain_fetch(underlying)
+                return self.chains.put(underlying.symbol, params)
+
+        return await asyncio.shield(self._chain_fetch(underlying))
+
+    def _chain_fetch(self, underlying):
+        pending = self._chain_requests.get(underlying.symbol)
+        if pending is None:
+            pending = self._background(self._fetch_chain_async(underlying))
+            self._chain_requests[underlying.symbol] = pending
+            pending.add_done_callback(lambda _: self._chain_requests.pop(underlying.symbol, None))
+        return pending
+
+    async def _fetch_chain_async(self, underlying):
+        await self.scheduler.acquire(PRIORITY_REFERENCE)
+        chains = await self._tws("reqSecDefOptParams", self.ib.reqSecDefOptParamsAsync(
+            underlying.symbol, '', underlying.secType, underlying.conId
+        ))
+        if not chains:
+            return None
+        if self.contract_db is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.contract_db.put_chain, underlying.symbol, chains)
+        return self.chains.put(underlying.symbol, chains)
+
+    # ------------------ STREAMING QUOTES ------------------
+
+    async def _subscribe_quotes_async(self, contract, listener):
+        contract = await self._qualify_async(contract, PRIORITY_QUOTE)
+        if contract is None:
+            return None
+        if self.market_data.get(contract.conId) is None:
+            await self.scheduler.acquire(PRIORITY_QUOTE)
+        return self.market_data.subscribe(contract, listener)
+
+    async def _unsubscribe_quotes_async(self, con_id, listener):
+        sub = self.market_data.get(con_id)
+        if sub is not None and sub.listeners == {listener}:
+            await self.scheduler.acquire(PRIORITY_QUOTE)  # cancelMktData
+        self.market_data.unsubscribe(con_id, listener)
+
+    async def stream_quotes(self, contract, max_rate=None):
+        """
+        async-генератор котировок (bid/ask/last/mid) для чужого event loop.
+        Все подписчики одного контракта делят одну линию reqMktData,
+        частота выдачи ограничена max_rate обновлений в секунду.
+        """
+        if not await self.wait_ready_async(self.ready_timeout):
+            return
+
+        max_rate = min(max_rate or self.quote_max_rate, self.quote_max_rate)
+        listener = QuoteListener(asyncio.get_running_loop())
+        sub = await self._run(self._subscribe_quotes_async(contract, listener))
+        if sub is None:
+            return
+
+        try:
+            while True:
+                await listener.wait()
+                yield sub.snapshot
+                await asyncio.sleep(1 / max_rate)
+        finally:
+            self._submit(self._unsubscribe_quotes_async(sub.contract.conId, listener))
+
+    def market_data_stats(self):
+        return self.market_data.stats()
+
+    # ------------------ ORDER EVENTS ------------------
+
+    def _bind_order_events(self):
+        self.ib.newOrderEvent += lambda trade: self._on_trade_event("new", trade)
+        self.ib.openOrderEvent += lambda trade: self._on_trade_event("open", trade)
+        self.ib.orderStatusEvent += lambda trade: self._on_trade_event("status", trade)
+        self.ib.execDetailsEvent += lambda trade, fill: self._on_trade_event("fill", trade, fill)
+        self.ib.commissionReportEvent += self._on_commission_report
+
+    def _on_trade_event(self, kind, trade, fill=None):
+        if self.journal is not None:
+            self.journal.record_trade(kind, trade, fill)
+        event = trade_event(kind, trade, fill)
+        self.order_events.publish(event)
+        delta = self.orders.apply(event)
+        if delta is not None:
+            self.order_deltas.publish(delta)
+        self.risk.apply(event)
+        job = self._algo_children.get(event["orderId"])
+        if job is not None:
+            job.apply(event)
+            self._publish_algo(job)
+
+    def _on_commission_report(self, trade, fill, report):
+        # комиссия приходит после execDetails — в записи fill её ещё нет
+        if self.journal is not None:
+            self.journal.record_commission(trade, fill, report)
+
+    def subscribe_order_events(self, deliver):
+        """
+        deliver(event) вызывается в loop IBWorker на каждое событие ордера.
+        Должен быть потокобезопасным, например queue.Queue.put_nowait.
+        """
+        return self.order_events.subscribe(deliver)
+
+    def unsubscribe_order_events(self, deliver):
+        self.order_events.unsubscribe(deliver)
+
+    async def stream_order_events(self):
+        """
+        async-генератор событий ордеров для чужого event loop.
+        """
+        queue = asyncio.Queue()
+        deliver = self.subscribe_order_events(loop_queue_deliver(asyncio.get_running_loop(), queue))
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.unsubscribe_order_events(deliver)
+
+    # ------------------ ORDER BOOK ------------------
+
+    async def _query_orders_async(self, symbol=None, status=None, active=None):
+        return self.orders.query(symbol, status, active)
+
+    async def get_orders_async(self, symbol=None, status=None, active=None):
+        """
+        Ордера из локального стора, без запросов в TWS. Стор есть только
+        у основного подключения: статусы ордеров TWS шлёт клиенту,
+        который их выставил.
+        """
+        if not self.loop:
+            return []
+        return await self._run(self._query_orders_async(symbol, status, active))
+
+    async def _subscribe_order_deltas_async(self, deliver, symbol=None):
+        # снимок и подписка в одном шаге loop — ни одна дельта не теряется
+        snapshot = self.orders.query(symbol)
+        self.order_deltas.subscribe(deliver)
+        return snapshot
+
+    async def stream_orders(self, symbol=None):
+        """
+        async-генератор: сначала {"type": "snapshot", "orders": [...]},
+        затем дельты по ордерам (только изменившиеся поля).
+        """
+        if not self.loop:
+            return
+
+        symbol = symbol.upper() if symbol else None
+        queue = asyncio.Queue()
+        deliver = loop_queue_deliver(asyncio.get_running_loop(), queue)
+        snapshot = await self._run(self._subscribe_order_deltas_async(deliver, symbol))
+        try:
+            yield {"type": "snapshot", "orders": snapshot}
+            while True:
+                delta = await queue.get()
+                if symbol and delta["symbol"] != symbol:
+                    continue
+                yield delta
+        finally:
+            self.order_deltas.unsubscribe(deliver)
+
     # ------------------ НОВЫЕ ФУНКЦИИ ------------------
 
+    async def _get_underlying_price_async(self, symbol: str):
+        contract = await self._qualify_async(self._underlying_contract(symbol))
+        if contract is None:
+            return None
+
+        (ticker, _), = await self._quotes_async([contract])
+        return ticker_price(ticker)
+
     def get_underlying_price(self, symbol):
         """
         Возвращает текущую цену underlying (акция или индекс)
         """
         symbol = symbol.upper()
-        if not self.connected or not self.loop:
+        reader = self._reader()
+        if reader is None:
             return None
 
-        if symbol in ['SPX', 'NDX', 'RUT']:
-            contract = Index(symbol, 'CBOE', 'USD')
-        else:
-            contract = Stock(symbol, 'SMART', 'USD')
+        return reader._submit(reader._get_underlying_price_async(symbol)).result()
 
-        fut = asyncio.run_coroutine_threadsafe(
-            self.ib.qualifyContractsAsync(contract), self.loop
-        )
-        fut.result()
+    async def get_underlying_price_async(self, symbol):
+        symbol = symbol.upper()
+        reader = await self._ready_reader()
+        if reader is None:
+            return None
 
-        ticker = self.ib.reqTickers(contract)[0]
-        return ticker.marketPrice()
+        return await reader._run(reader._get_underlying_price_async(symbol))
+
+    async def _get_quote_async(self, symbol, is_option=False, expiry=None, strike=None, right="C"):
+        """
+        Котировка акции, индекса или опциона (см. _quotes_async).
+        """
+        contract = await self._qualify_async(self.build_contract(symbol.upper(), is_option, expiry, strike, right))
+        if contract is None:
+            return {"error": f"Contract {symbol} not found"}
+
+        (ticker, error), = await self._quotes_async([contract])
+        if error:
+            return {"error": error}
+        return {**quote_snapshot(ticker), "price": ticker_price(ticker)}
+
+    async def get_quote_async(self, symbol, is_option=False, expiry=None, strike=None, right="C"):
+        reader = await self._ready_reader()
+        if reader is None:
+            return {"error": "IBKR not connected yet"}
+
+        return await reader._run(reader._get_quote_async(symbol, is_option, expiry, strike, right))
+
+    async def _quotes_async(self, contracts, need="price", timeout=None):
+        """
+        Первая пригодная котировка (has_quote) по каждому контракту — как
+        только она пришла, без опроса. Открытая линия market data отвечает
+        сразу; иначе временная потоковая линия (общая с подписчиками) до
+        первого updateEvent с нужными полями. Если линий не хватает
+        (max_quote_lines) — snapshot пачками, а без котировки в snapshot —
+        поток на оставшиеся линии. Дедлайн — timeout (quote_timeout).
+        Возвращает [(ticker, error)] в порядке contracts; у ticker может не
+        быть котировки, если к дедлайну ничего не пришло (error — ошибка
+        TWS, например, нет подписки на данные).
+        """
+        deadline = time.monotonic() + (self.quote_timeout if timeout is None else timeout)
+        results = [None] * len(contracts)
+        pending = []
+        for i, contract in enumerate(contracts):
+            sub = self.market_data.get(contract.conId)
+            if sub is not None and has_quote(sub.ticker, need):
+                results[i] = (sub.ticker, None)
+            else:
+                pending.append(i)
+
+        free = self.max_quote_lines - len(self._quote_lines)
+        if len(pending) > free:
+            tickers = await self._tickers_many_async([contracts[i] for i in pending])
+            empty = []
+            for i, ticker in zip(pending, tickers):
+                results[i] = (ticker, None)
+                if not has_quote(ticker, need):
+                    empty.append(i)
+            pending = empty[:max(self.max_quote_lines - len(self._quote_lines), 0)]
+
+        if pending:
+            streamed = await asyncio.gather(*(self._stream_quote_async(contracts[i], need, deadline) for i in pending))
+            for i, result in zip(pending, streamed):
+                results[i] = result
+        return results
+
+    async def _stream_quote_async(self, contract, need, deadline):
+        con_id = contract.conId
+        done = asyncio.get_running_loop().create_future()
+        self._quote_waiters.setdefault(con_id, set()).add(done)
+        hold = QuoteHold()
+        await self.scheduler.acquire(PRIORITY_QUOTE)
+        ticker = self._quote_lines.subscribe(contract, hold).ticker
+        try:
+            ready = await wait_for_quote(ticker, need, max(deadline - time.monotonic(), 0.0), done)
+            return ticker, None if ready else self._quote_errors.get(con_id)
+        finally:
+            waiters = self._quote_waiters[con_id]
+            waiters.discard(done)
+            if not waiters:
+                del self._quote_waiters[con_id]
+                self._quote_errors.pop(con_id, None)
+            sub = self._quote_lines.get(con_id)
+            try:
+                if sub is not None and sub.listeners == {hold}:
+                    await self.scheduler.acquire(PRIORITY_QUOTE)  # cancelMktData
+            finally:
+                self._quote_lines.unsubscribe(con_id, hold)
+
+    async def _bounded(self, coro):
+        async with self._pacing:
+            return await coro
+
+    async def _req_tickers_async(self, contracts):
+        await self.scheduler.acquire(PRIORITY_QUOTE, len(contracts))
+        return await self._tws("reqTickers", self.ib.reqTickersAsync(*contracts))
+
+    async def _tickers_many_async(self, contracts):
+        """
+        Snapshot-тикеры для списка контрактов пачками по ticker_batch_size,
+        не больше max_concurrency пачек одновременно.
+        """
+        size = self.ticker_batch_size
+        chunks = [contracts[i:i + size] for i in range(0, len(contracts), size)]
+        parts = await asyncio.gather(*(self._bounded(self._req_tickers_async(c)) for c in chunks))
+        return [t for part in parts for t in part]
 
-    # Внутри IBWorker
     async def _get_atm_option_async(self, symbol: str, right: str = "C", expiry: str = None):
+        return (await self._get_atm_options_async([(symbol, right, expiry)]))[0]
+
+    async def _get_atm_options_async(self, items):
+        """
+        ATM опционы для списка (symbol, right, expiry). Каждый этап — одна
+        пачка на все символы: квалификация underlying, тикеры, цепочки
+        (параллельно), квалификация опционов, тикеры опционов.
+        """
+        items = [(symbol.upper(), (right or "C").upper(), expiry) for symbol, right, expiry in items]
+        results = [None] * len(items)
+
         # --- UNDERLYING ---
-        if symbol in ['SPX', 'NDX', 'RUT']:
-            stk = Index(symbol, 'CBOE', 'USD')
-        else:
-            stk = Stock(symbol, 'SMART', 'USD')
+        symbols = list(dict.fromkeys(symbol for symbol, _, _ in items))
+        qualified = await self._qualify_many_async([self._underlying_contract(s) for s in symbols])
+        underlyings = {s: c for s, c in zip(symbols, qualified) if c is not None}
+
+        found = list(underlyings.values())
+
+        # --- OPTION CHAINS (параллельно с котировками underlying) ---
+        ul_quotes, *fetched = await asyncio.gather(
+            self._quotes_async(found),
+            *(self._bounded(self._get_chain_async(c)) for c in found), return_exceptions=True
+        )
+        if isinstance(ul_quotes, Exception):
+            raise ul_quotes
+        prices = {c.symbol: ticker_price(t) for c, (t, _) in zip(found, ul_quotes)}
+        chains = {c.symbol: chain for c, chain in zip(found, fetched) if not isinstance(chain, Exception)}
+
+        # --- ATM STRIKES ---
+        legs = []
+        for i, (symbol, right, expiry) in enumerate(items):
+            if symbol not in underlyings:
+                results[i] = {"error": f"Contract {symbol} not found"}
+                continue
+
+            ul_price = prices.get(symbol)
+            if ul_price is None:
+                results[i] = {"error": "Не удалось получить цену underlying"}
+                continue
+
+            chain = chains.get(symbol)
+            if not chain:
+                results[i] = {"error": "Option chain not found"}
+                continue
+
+            # --- FIND CHAIN BY EXPIRY ---
+            expiry_input, chain_class = chain.resolve_expiry(expiry)
+            if chain_class is None:
+                results[i] = {"error": "Option chain not found"}
+                continue
 
-        await self.ib.qualifyContractsAsync(stk)
+            # --- CHOOSE ATM STRIKE BASED ON CALL/PUT ---
+            # Call — страйк ≥ цена underlying, Put — страйк ≤ цена underlying
+            atm_strike = chain.atm_strike(ul_price, right, chain_class.trading_class)
 
-        ul_ticker = (await self.ib.reqTickersAsync(stk))[0]
-        ul_price = ul_ticker.marketPrice()
-        if ul_price is None or math.isnan(ul_price):
+            # --- OPTION CONTRACT ---
+            opt = Option(
+                symbol=symbol,
+                lastTradeDateOrContractMonth=expiry_input,
+                strike=atm_strike,
+                right=right,
+                exchange='SMART',
+                currency='USD',
+                multiplier='100',
+                tradingClass=chain_class.trading_class
+            )
+            legs.append((i, opt, {
+                "symbol": symbol,
+                "expiry": expiry_input,
+                "right": right,
+                "atm_strike": atm_strike,
+                "underlying": ul_price,
+                "tradingClass": chain_class.trading_class
+            }))
+
+        options = await self._qualify_many_async([opt for _, opt, _ in legs])
+        quoted = []
+        for (i, _, result), opt in zip(legs, options):
+            if opt is None:
+                results[i] = {"error": f"Option {result['symbol']} {result['expiry']} "
+                                       f"{result['atm_strike']}{result['right']} not found"}
+            else:
+                quoted.append((i, opt, result))
+
+        opt_quotes = await self._quotes_async([opt for _, opt, _ in quoted], "bidask")
+
+        # --- BID / ASK / MID ---
+        for (i, _, result), (opt_ticker, error) in zip(quoted, opt_quotes):
+            quote = quote_snapshot(opt_ticker)
+            result.update(bid=quote["bid"], ask=quote["ask"], mid=quote["mid"], delayed=quote["delayed"])
+            if error:
+                result["quoteError"] = error
+            results[i] = result
+
+        return results
+
+    async def _option_chain_greeks_async(self, symbol, expiry=None, right=None, strike_count=None,
+                                         rate=DEFAULT_RATE, dividend=0.0, model="bs"):
+        """
+        Снимок цепочки одной экспирации (все страйки или strike_count
+        ближайших к цене) и IV/греки по нему одним векторным проходом.
+        Квалификация и тикеры — теми же пачками, что и ATM.
+        """
+        # до любых запросов в TWS: ошибка в параметрах не тратит пейсинг
+        if model not in MODELS:
+            raise ValueError(f"Unknown model {model!r}, expected one of {MODELS}")
+        if right and right.upper() not in ("C", "P"):
+            raise ValueError(f"Unknown right {right!r}, expected C or P")
+
+        underlying = await self._qualify_async(self._underlying_contract(symbol))
+        if underlying is None:
+            return {"error": f"Contract {symbol} not found"}
+
+        (ticker, _), = await self._quotes_async([underlying])
+        price = ticker_price(ticker)
+        if price is None:
             return {"error": "Не удалось получить цену underlying"}
 
-        # --- OPTION CHAINS ---
-        chains = await self.ib.reqSecDefOptParamsAsync(stk.symbol, '', stk.secType, stk.conId)
-        if not chains:
+        chain = await self._get_chain_async(underlying)
+        if not chain:
+            return {"error": "Option chain not found"}
+        expiry, chain_class = chain.resolve_expiry(expiry)
+        if chain_class is None:
             return {"error": "Option chain not found"}
 
-        # --- FIND CHAIN BY EXPIRY ---
-        chain = None
-        expiry_input = expiry
-        for c in chains:
-            valid_expirations = [d if isinstance(d, str) else d.strftime('%Y%m%d') for d in c.expirations]
-            if expiry_input and expiry_input in valid_expirations:
-                chain = c
-                break
+        tc = chain_class.trading_class
+        strikes = chain.nearest_strikes(price, strike_count, tc) if strike_count else chain_class.strikes
+        rights = [right.upper()] if right else ["C", "P"]
+        contracts = [
+            Option(symbol, expiry, strike, r, 'SMART', multiplier=chain_class.multiplier, currency='USD',
+                   tradingClass=tc)
+            for r in rights for strike in strikes
+        ]
+        options = [c for c in await self._qualify_many_async(contracts) if c is not None]
+        tickers = await self._tickers_many_async(options)
 
-        if not chain:
-            chain = chains[0]
-            if not expiry_input or expiry_input not in chain.expirations:
-                expiry_input = sorted(chain.expirations)[0]
-
-        # --- AVAILABLE STRIKES ---
-        available_strikes = sorted(chain.strikes)
-
-        # --- CHOOSE ATM STRIKE BASED ON CALL/PUT ---
-        if right.upper() == "C":  # Call — страйк ≥ цена underlying
-            atm_strike = min((s for s in available_strikes if s >= ul_price), default=max(available_strikes))
-        else:  # Put — страйк ≤ цена underlying
-            atm_strike = max((s for s in available_strikes if s <= ul_price), default=min(available_strikes))
-
-        # --- OPTION CONTRACT ---
-        opt = Option(
-            symbol=symbol,
-            lastTradeDateOrContractMonth=expiry_input,
-            strike=atm_strike,
-            right=right,
-            exchange='SMART',
-            currency='USD',
-            multiplier='100',
-            tradingClass=chain.tradingClass
-        )
-        await self.ib.qualifyContractsAsync(opt)
+        t0 = time.perf_counter()
+        n = len(options)
+        strike_arr = np.fromiter((c.strike for c in options), float, n)
+        is_call = np.fromiter((c.right == "C" for c in options), bool, n)
 
-        opt_ticker = (await self.ib.reqTickersAsync(opt))[0]
+        def prices(field):
+            # 0.0 — валидная цена (bid дальнего OTM), NaN только для «нет данных»
+            values = (clean_price(getattr(t, field)) for t in tickers)
+            return np.fromiter((np.nan if v is None else v for v in values), float, n)
 
-        # --- BID / ASK / MID ---
-        bid = opt_ticker.bid
-        ask = opt_ticker.ask
+        bid, ask, last = prices("bid"), prices("ask"), prices("last")
+        mid = np.where(np.isfinite(bid) & np.isfinite(ask), (bid + ask) / 2, last)
 
-        bid = bid if bid is not None and not math.isnan(bid) else None
-        ask = ask if ask is not None and not math.isnan(ask) else None
-        mid = (bid + ask) / 2 if bid is not None and ask is not None else None
+        t = year_fraction(expiry)
+        forward, values = chain_greeks(price, strike_arr, is_call, mid, t, rate, dividend, model)
+        compute_ms = (time.perf_counter() - t0) * 1000
 
+        columns = {"strike": strike_arr, "bid": bid, "ask": ask, "mid": mid, **values}
+        rows = [
+            {"right": "C" if is_call[i] else "P",
+             **{name: (None if math.isnan(col[i]) else float(col[i])) for name, col in columns.items()}}
+            for i in range(n)
+        ]
         return {
             "symbol": symbol,
-            "expiry": expiry_input,
-            "right": right,
-            "atm_strike": atm_strike,
-            "underlying": ul_price,
-            "bid": bid,
-            "ask": ask,
-            "mid": mid,
-            "tradingClass": chain.tradingClass
+            "expiry": expiry,
+            "tradingClass": tc,
+            "underlying": price,
+            "forward": forward,
+            "yearsToExpiry": t,
+            "rate": rate,
+            "dividend": dividend,
+            "model": model,
+            "computeMs": compute_ms,
+            "options": rows,
         }
 
+    async def option_chain_greeks_async(self, symbol, expiry=None, right=None, strike_count=None,
+                                        rate=DEFAULT_RATE, dividend=0.0, model="bs"):
+        symbol = symbol.upper()
+        reader = await self._ready_reader()
+        if reader is None:
+            return {"error": "IBKR not connected yet"}
+
+        return await reader._run(reader._option_chain_greeks_async(
+            symbol, expiry, right, strike_count, rate, dividend, model
+        ))
+
     def get_atm_option(self, symbol: str, right: str = "C", expiry: str = None):
         """
         Синхронный вызов асинхронной функции через loop IBWorker.
         """
-        if not self.connected or not self.loop:
+        reader = self._reader()
+        if reader is None:
             return {"error": "IBKR not connected yet"}
 
-        future = asyncio.run_coroutine_threadsafe(
-            self._get_atm_option_async(symbol, right, expiry), self.loop
-        )
-        return future.result()
+        return reader._submit(reader._get_atm_option_async(symbol, right, expiry)).result()
 
-    def place_order(self, symbol, qty, limit_price=None, trail_amount=None, order_type="Limit",
-                    is_option=False, expiry=None, strike=None, right="C", action="BUY"):
-        if not self.connected or not self.loop:
-            print("Not connected to IBKR yet")
-            return None
+    async def get_atm_option_async(self, symbol: str, right: str = "C", expiry: str = None):
+        """
+        То же, что get_atm_option, но без блокировки вызывающего потока.
+        """
+        reader = await self._ready_reader()
+        if reader is None:
+            return {"error": "IBKR not connected yet"}
 
-        contract = self.build_contract(symbol, is_option, expiry, strike, right)
-        asyncio.run_coroutine_threadsafe(self.ib.qualifyContractsAsync(contract), self.loop).result()
+        return await reader._run(reader._get_atm_option_async(symbol, right, expiry))
+
+    async def get_atm_options_async(self, items):
+        """
+        Пачка ATM запросов: items — список (symbol, right, expiry).
+        Возвращает список результатов в том же порядке.
+        """
+        reader = await self._ready_reader()
+        if reader is None:
+            return [{"error": "IBKR not connected yet"} for _ in items]
 
-        req_id = self.ib.client.getReqId()
+        return await reader._run(reader._get_atm_options_async(list(items)))
 
+    @staticmethod
+    def _build_orders(qty, limit_price=None, trail_amount=None, order_type="Limit", action="BUY"):
+        """
+        Ордера для place_order: (parent, children). children пустой,
+        кроме трейла.
+        """
         # TRAILING ORDER
         if order_type.lower() == "trail":
             parent_order = Order(
-                orderId=req_id,
                 action=action,
                 orderType="LMT",
                 totalQuantity=qty,
                 lmtPrice=limit_price,
-                tif="DAY",
-                transmit=False
+                tif="DAY"
             )
 
             trail_order = Order(
                 action="SELL" if action=="BUY" else "BUY",  # всегда противоположное для трейла
                 orderType="TRAIL",
                 auxPrice=trail_amount,
-                totalQuantity=qty,
-                parentId=req_id,
-                transmit=True
+                totalQuantity=qty
             )
+            return parent_order, [trail_order]
 
-            async def place_orders():
-                trade_parent = self.ib.placeOrder(contract, parent_order)
-                await asyncio.sleep(0.2)
-                trade_trail = self.ib.placeOrder(contract, trail_order)
-                return trade_parent, trade_trail
+        # OTHER ORDERS: Limit / Market / Stop
+        ot = order_type.upper()
+        if ot == "LIMIT":
+            ot = "LMT"
+        elif ot == "MARKET":
+            ot = "MKT"
+        elif ot == "STOP":
+            ot = "STP"
 
-            future = asyncio.run_coroutine_threadsafe(place_orders(), self.loop)
-            return future.result()
+        order = Order(
+            action=action,
+            orderType=ot,
+            totalQuantity=qty,
+            lmtPrice=limit_price if ot=="LMT" else None,
+            transmit=True
+        )
+        return order, []
 
-        # OTHER ORDERS: Limit / Market / Stop
-        else:
-            ot = order_type.upper()
-            if ot == "LIMIT":
-                ot = "LMT"
-            elif ot == "MARKET":
-                ot = "MKT"
-            elif ot == "STOP":
-                ot = "STP"
-
-            order = Order(
-                orderId=req_id,
-                action=action,
-                orderType=ot,
-                totalQuantity=qty,
-                lmtPrice=limit_price if ot=="LMT" else None,
-                transmit=True
+    async def _place_order_async(self, symbol, qty, limit_price=None, trail_amount=None, order_type="Limit",
+                                 is_option=False, expiry=None, strike=None, right="C", action="BUY"):
+        contract = self.build_contract(symbol, is_option, expiry, strike, right)
+        contract = await self._qualify_async(contract, PRIORITY_ORDER)
+        if contract is None:
+            return {"error": f"Contract {symbol} not found"}
+        reservation = self.risk.check(contract, action, qty, limit_price)
+
+        parent, children = self._build_orders(qty, limit_price, trail_amount, order_type, action)
+        try:
+            if children:
+                return await self._place_group_async(contract, parent, children, reservation)
+
+            await self.scheduler.acquire(PRIORITY_ORDER)
+            parent.orderId = self.ib.client.getReqId()
+            trade = self.ib.placeOrder(contract, parent)
+            self.risk.bind(reservation, parent.orderId)
+            return trade
+        finally:
+            # ордер так и не ушёл в TWS — резерв не держим
+            if reservation.order_id is None:
+                self.risk.release(reservation)
+
+    async def _place_orders_bulk_async(self, items):
+        """
+        Пачка ордеров: одна квалификация на все контракты, orderId
+        выделяются заранее, placeOrder идут подряд без ожидания ответов
+        (темп задаёт scheduler), затем параллельно ждём подтверждения
+        TWS по каждому ордеру.
+        items — список dict с аргументами place_order.
+        """
+        t0 = time.perf_counter()
+        contracts = [
+            self.build_contract(item["symbol"].upper(), item.get("is_option", False), item.get("expiry"),
+                                item.get("strike"), item.get("right") or "C")
+            for item in items
+        ]
+        qualified = await self._qualify_many_async(contracts, PRIORITY_ORDER)
+        qualify_ms = (time.perf_counter() - t0) * 1000
+
+        results = [None] * len(items)
+        placed = []
+        for i, (item, contract) in enumerate(zip(items, qualified)):
+            if contract is None:
+                results[i] = {"index": i, "symbol": item["symbol"], "error": "Contract not found"}
+                continue
+            try:
+                # резерв сразу учитывается в проверке следующих ордеров пачки
+                reservation = self.risk.check(contract, item.get("action", "BUY"), item["qty"],
+                                              item.get("limit_price"))
+            except RiskRejected as e:
+                results[i] = {"index": i, "symbol": item["symbol"], "error": e.reason, "rule": e.rule}
+                continue
+
+            parent, children = self._build_orders(
+                item["qty"], item.get("limit_price"), item.get("trail_amount"),
+                item.get("order_type", "Limit"), item.get("action", "BUY")
             )
+            try:
+                legs = link_group(parent, children, self.ib.client.getReqId)
+                await self.scheduler.acquire(PRIORITY_ORDER, len(legs))
+                t_place = time.perf_counter()
+                trades = [self.ib.placeOrder(contract, order) for order in legs]
+                self.risk.bind(reservation, parent.orderId)
+            finally:
+                if reservation.order_id is None:
+                    self.risk.release(reservation)
+            placed.append((i, t_place, trades))
+        place_ms = (time.perf_counter() - t0) * 1000 - qualify_ms
+
+        async def ack(i, t_place, trades):
+            acked = await wait_acknowledged(trades, self.ack_timeout)
+            if acked:
+                self.metrics.observe("ibworker_tws_request_seconds", ("placeOrder",), time.perf_counter() - t_place)
+            results[i] = {
+                "index": i,
+                "symbol": trades[0].contract.symbol,
+                "orderIds": [t.order.orderId for t in trades],
+                "status": trades[0].orderStatus.status,
+                "acked": acked,
+                "ackMs": (time.perf_counter() - t_place) * 1000
+            }
+
+        await asyncio.gather(*(ack(*p) for p in placed))
+        return {
+            "results": results,
+            "qualifyMs": qualify_ms,
+            "placeMs": place_ms,
+            "totalMs": (time.perf_counter() - t0) * 1000
+        }
+
+    async def place_orders_bulk_async(self, items):
+        if not await self.wait_ready_async(self.ready_timeout):
+            return None
+
+        return await self._run(self._place_orders_bulk_async(list(items)))
+
+    async def _place_group_async(self, contract, parent, children, reservation=None):
+        """
+        parent + дочерние ордера одной пачкой, без пауз между ногами.
+        Возвращается, когда TWS подтвердил все ноги (или по ack_timeout).
+        reservation риск-движка привязывается к parent до ожидания ответов.
+        """
+        legs = link_group(parent, children, self.ib.client.getReqId)
+        await self.scheduler.acquire(PRIORITY_ORDER, len(legs))
+
+        t0 = time.perf_counter()
+        trades = [self.ib.placeOrder(contract, order) for order in legs]
+        if reservation is not None:
+            self.risk.bind(reservation, parent.orderId)
+        acked = await wait_acknowledged(trades, self.ack_timeout)
+        ack_ms = (time.perf_counter() - t0) * 1000
+        if acked:
+            self.metrics.observe("ibworker_tws_request_seconds", ("placeOrder",), ack_ms / 1000)
+
+        if not acked:
+            print(f"Order group {[o.orderId for o in legs]} not acknowledged in {self.ack_timeout}s")
+        return OrderGroup(trades, ack_ms, acked)
+
+    async def _get_atr_async(self, contract, period=14):
+        """
+        ATR по дневным барам (простое среднее True Range), кэш на день.
+        """
+        key = (contract.conId, period)
+        today = time.strftime('%Y%m%d')
+        cached = self._atr_cache.get(key)
+        if cached and cached[0] == today:
+            return cached[1]
+
+        await self.scheduler.acquire(PRIORITY_REFERENCE)
+        bars = await self._tws("reqHistoricalData", self.ib.reqHistoricalDataAsync(
+            contract, endDateTime='', durationStr=f'{period * 2 + 5} D',
+            barSizeSetting='1 day', whatToShow='TRADES', useRTH=True
+        ))
+        if len(bars) < period + 1:
+            return None
+
+        true_ranges = [
+            max(bar.high - bar.low, abs(bar.high - prev.close), abs(bar.low - prev.close))
+            for prev, bar in zip(bars[-period - 1:-1], bars[-period:])
+        ]
+        atr = sum(true_ranges) / period
+        self._atr_cache[key] = (today, atr)
+        return atr
+
+    async def _min_tick_async(self, contract):
+        """
+        minTick контракта из ContractDetails, кэш на время жизни воркера.
+        """
+        tick = self._min_ticks.get(contract.conId)
+        if tick is None:
+            await self.scheduler.acquire(PRIORITY_REFERENCE)
+            details = await self._tws("reqContractDetails", self.ib.reqContractDetailsAsync(contract))
+            tick = details[0].minTick if details and details[0].minTick else 0.01
+            self._min_ticks[contract.conId] = tick
+        return tick
+
+    async def _place_bracket_async(self, symbol, qty, limit_price, stop_offset=3.0, take_profit_offset=5.0,
+                                   offset_type="abs", atr_period=14, is_option=False, expiry=None,
+                                   strike=None, right="C", action="BUY"):
+        contract = self.build_contract(symbol, is_option, expiry, strike, right)
+        contract = await self._qualify_async(contract, PRIORITY_ORDER)
+        if contract is None:
+            return {"error": f"Contract {symbol} not found"}
+
+        atr = None
+        if offset_type == "atr":
+            atr = await self._get_atr_async(contract, atr_period)
+        min_tick = await self._min_tick_async(contract)
+        try:
+            stop_price, take_profit_price = bracket_prices(
+                action, limit_price, stop_offset, take_profit_offset, offset_type, atr, min_tick
+            )
+        except ValueError as e:
+            return {"error": str(e)}
+
+        try:
+            reservation = self.risk.check(contract, action, qty, limit_price)
+        except RiskRejected as e:
+            return {"error": e.reason, "rule": e.rule}
+
+        parent, children = build_bracket(action, qty, limit_price, stop_price, take_profit_price)
+        try:
+            # стоп и тейк-профит закрывают позицию входа — резервируется только вход
+            group = await self._place_group_async(contract, parent, children, reservation)
+        finally:
+            if reservation.order_id is None:
+                self.risk.release(reservation)
+        parent_trade, stop_trade, take_profit_trade = group
+        return {
+            "parentOrderId": parent_trade.order.orderId,
+            "stopOrderId": stop_trade.order.orderId,
+            "takeProfitOrderId": take_profit_trade.order.orderId,
+            "stopPrice": stop_price,
+            "takeProfitPrice": take_profit_price,
+            "atr": atr,
+            "minTick": min_tick,
+            "acked": group.acked,
+            "ackMs": group.ack_ms
+        }
+
+    async def place_bracket_async(self, symbol, qty, limit_price, stop_offset=3.0, take_profit_offset=5.0,
+                                  offset_type="abs", atr_period=14, is_option=False, expiry=None,
+                                  strike=None, right="C", action="BUY"):
+        """
+        Bracket (вход + стоп + тейк-профит) одной группой ордеров.
+        """
+        if not await self.wait_ready_async(self.ready_timeout):
+            return {"error": "IBKR not connected yet"}
+
+        return await self._run(self._place_bracket_async(
+            symbol, qty, limit_price, stop_offset, take_profit_offset, offset_type, atr_period,
+            is_option, expiry, strike, right, action
+        ))
+
+    async def _place_combo_async(self, symbol, strategy=None, legs=None, qty=1, expiry=None, width=1,
+                                 limit_price=None, price_mode="mid", action="BUY"):
+        """
+        Комбо (BAG) одной заявкой: ноги от ATM страйка по стратегии
+        (call_vertical, straddle, ...) или явным смещениям, одна пачечная
+        квалификация всех ног, net limit — из котировок ног (открытые линии
+        отвечают сразу), если limit_price не задан.
+        """
+        symbol = symbol.upper()
+        leg_specs = strategy_legs(strategy, legs, width)
+
+        underlying = await self._qualify_async(self._underlying_contract(symbol), PRIORITY_ORDER)
+        if underlying is None:
+            return {"error": f"Contract {symbol} not found"}
+        [(ticker, _)], chain = await asyncio.gather(
+            self._quotes_async([underlying]), self._get_chain_async(underlying)
+        )
+        price = ticker_price(ticker)
+        if price is None:
+            return {"error": "Не удалось получить цену underlying"}
+        if not chain:
+            return {"error": "Option chain not found"}
+        expiry, chain_class = chain.resolve_expiry(expiry)
+        if chain_class is None:
+            return {"error": "Option chain not found"}
+
+        tc = chain_class.trading_class
+        atm, resolved = resolve_strikes(chain, tc, price, leg_specs)
+        options = await self._qualify_many_async([
+            Option(symbol, expiry, strike, right, 'SMART', multiplier=chain_class.multiplier, currency='USD',
+                   tradingClass=tc)
+            for right, strike, _, _ in resolved
+        ], PRIORITY_ORDER)
+        missing = [f"{strike}{right}" for (right, strike, _, _), c in zip(resolved, options) if c is None]
+        if missing:
+            return {"error": f"Options {symbol} {expiry} {', '.join(missing)} not found"}
+
+        quotes = [quote_snapshot(t) for t, _ in await self._quotes_async(options, "bidask")]
+        quoted_net = net_price(resolved, quotes, price_mode)
+        if limit_price is None:
+            if quoted_net is None:
+                return {"error": "Нет котировок ног для net limit, задайте limit_price"}
+            limit_price = quoted_net
+
+        bag = build_bag(symbol, options, resolved, underlying.currency or "USD")
+        # риск — по премии комбо, как по одной ноге опциона
+        reservation = self.risk.check(Contract(symbol=symbol, secType="BAG", multiplier=chain_class.multiplier),
+                                      action, qty, abs(limit_price))
+
+        order = Order(action=action, orderType="LMT", totalQuantity=qty, lmtPrice=limit_price, tif="DAY")
+        try:
+            await self.scheduler.acquire(PRIORITY_ORDER)
+            order.orderId = self.ib.client.getReqId()
+            t0 = time.perf_counter()
+            trade = self.ib.placeOrder(bag, order)
+            self.risk.bind(reservation, order.orderId)
+        finally:
+            if reservation.order_id is None:
+                self.risk.release(reservation)
+        acked = await wait_acknowledged([trade], self.ack_timeout)
+        ack_ms = (time.perf_counter() - t0) * 1000
+        if acked:
+            self.metrics.observe("ibworker_tws_request_seconds", ("placeOrder",), ack_ms / 1000)
+
+        return {
+            "orderId": order.orderId,
+            "orderStatus": trade.orderStatus.status,
+            "acked": acked,
+            "ackMs": ack_ms,
+            "symbol": symbol,
+            "expiry": expiry,
+            "tradingClass": tc,
+            "underlying": price,
+            "atmStrike": atm,
+            "action": action,
+            "qty": qty,
+            "limitPrice": limit_price,
+            "quotedNet": quoted_net,
+            "priceMode": price_mode,
+            "legs": [
+                {"conId": c.conId, "localSymbol": c.localSymbol, "right": right, "strike": strike, "ratio": ratio,
+                 "action": leg_action, "bid": q["bid"], "ask": q["ask"], "mid": q["mid"]}
+                for c, (right, strike, ratio, leg_action), q in zip(options, resolved, quotes)
+            ],
+        }
+
+    async def place_combo_async(self, symbol, strategy=None, legs=None, qty=1, expiry=None, width=1,
+                                limit_price=None, price_mode="mid", action="BUY"):
+        if not await self.wait_ready_async(self.ready_timeout):
+            return {"error": "IBKR not connected yet"}
 
-            async def place():
-                return self.ib.placeOrder(contract, order)
+        return await self._run(self._place_combo_async(
+            symbol, strategy, legs, qty, expiry, width, limit_price, price_mode, action
+        ))
+
+    async def _cancel_order_async(self, order_id):
+        trade = next((t for t in self.ib.openTrades() if t.order.orderId == order_id), None)
+        if trade is None:
+            return None
+        await self.scheduler.acquire(PRIORITY_ORDER)
+        return self.ib.cancelOrder(trade.order)
+
+    async def cancel_order_async(self, order_id):
+        """
+        Отмена открытого ордера этого клиента. None — если ордер не найден.
+        """
+        if not await self.wait_ready_async(self.ready_timeout):
+            return None
 
-            future = asyncio.run_coroutine_threadsafe(place(), self.loop)
-            return future.result()
+        return await self._run(self._cancel_order_async(order_id))
 
-    async def _get_net_liquidation_async(self):
+    async def _risk_stats_async(self):
+        return self.risk.stats()
+
+    async def risk_stats_async(self):
+        if not self.loop:
+            return self.risk.stats()
+        return await self._run(self._risk_stats_async())
+
+    async def _set_risk_limits_async(self, symbol, limits):
+        self.risk.set_limits(symbol, **limits)
+        return self.risk.limits_for(symbol.upper()).as_dict()
+
+    async def set_risk_limits_async(self, symbol, **limits):
+        """
+        Лимиты символа (max_notional, max_position, max_qty, price_band)
+        поверх лимитов по умолчанию.
+        """
+        if not self.loop:
+            self.risk.set_limits(symbol, **limits)
+            return self.risk.limits_for(symbol.upper()).as_dict()
+        return await self._run(self._set_risk_limits_async(symbol, limits))
+
+    async def _scheduler_stats_async(self):
+        return self.scheduler.stats()
+
+    async def scheduler_stats_async(self):
+        if not self.loop:
+            return self.scheduler.stats()
+        return await self._run(self._scheduler_stats_async())
+
+    def place_order(self, symbol, qty, limit_price=None, trail_amount=None, order_type="Limit",
+                    is_option=False, expiry=None, strike=None, right="C", action="BUY"):
+        if not self._is_ready():
+            print("Not connected to IBKR yet")
+            return None
+
+        return self._submit(self._place_order_async(
+            symbol, qty, limit_price, trail_amount, order_type, is_option, expiry, strike, right, action
+        )).result()
+
+    async def place_order_async(self, symbol, qty, limit_price=None, trail_amount=None, order_type="Limit",
+                                is_option=False, expiry=None, strike=None, right="C", action="BUY"):
+        if not await self.wait_ready_async(self.ready_timeout):
+            print("Not connected to IBKR yet")
+            return None
+
+        return await self._run(self._place_order_async(
+            symbol, qty, limit_price, trail_amount, order_type, is_option, expiry, strike, right, action
+        ))
+
+    # ------------------ АЛГОРИТМИЧЕСКОЕ ИСПОЛНЕНИЕ ------------------
+
+    async def _start_algo_async(self, symbol, algo, qty, action="BUY", duration=300.0, slices=10,
+                                display_qty=None, price_mode="passive", limit_price=None,
+                                is_option=False, expiry=None, strike=None, right="C"):
+        """
+        Запускает родителя, который режется на дочерние LMT ордера:
+        twap — равные срезы по времени, vwap — срезы по профилю объёма
+        из кэша баров, iceberg — видимая часть display_qty, следующая
+        выставляется по исполнению предыдущей. Возвращает сводку задачи;
+        сама задача работает в loop IBWorker до исполнения или отмены.
+        """
+        if algo not in ALGO_TYPES:
+            raise ValueError(f"Unknown algo {algo!r}, expected one of {ALGO_TYPES}")
+        if price_mode not in CHILD_PRICE_MODES:
+            raise ValueError(f"Unknown price mode {price_mode!r}, expected one of {CHILD_PRICE_MODES}")
+        if qty <= 0:
+            raise ValueError("qty must be positive")
+        if algo == "iceberg":
+            if not display_qty or display_qty <= 0:
+                raise ValueError("display_qty is required for iceberg")
+        elif slices < 1 or not duration or duration <= 0:
+            raise ValueError("duration and slices must be positive")
+
+        contract = self.build_contract(symbol, is_option, expiry, strike, right)
+        contract = await self._qualify_async(contract, PRIORITY_ORDER)
+        if contract is None:
+            return {"error": f"Contract {symbol} not found"}
+
+        self._algo_seq += 1
+        job = AlgoJob(self._algo_seq, algo, contract, action, qty, duration, slices, display_qty, price_mode,
+                      limit_price)
+        # линия котировок открыта всё время работы: цена прибытия,
+        # цены дочерних ордеров и их перестановка
+        sub = await self._subscribe_quotes_async(contract, job)
+        started = False
+        try:
+            quoted = await wait_for_quote(sub.ticker, "bidask", self.quote_timeout)
+            job.quote = quote_snapshot(sub.ticker)
+            if not quoted and limit_price is None:
+                return {"error": f"No quote for {contract.symbol}, set limit_price"}
+            job.arrival = job.quote["mid"] or job.quote["last"] or limit_price
+            # резерв родителя держится до конца задачи и тает с исполнениями детей
+            job.reservation = self.risk.check(contract, action, qty, limit_price or job.arrival)
+
+            if algo != "iceberg":
+                weights = await self._vwap_weights_async(contract, duration, slices) if algo == "vwap" else None
+                job.profile = "vwap" if weights is not None else "uniform"
+                job.targets = slice_targets(qty, weights if weights is not None else [1.0] * slices)
+
+            self.algo_jobs[job.id] = job
+            finished = [j.id for j in self.algo_jobs.values() if not j.active]
+            for job_id in finished[:max(len(finished) - MAX_FINISHED_ALGOS, 0)]:
+                del self.algo_jobs[job_id]
+            job.task = self._background(self._run_algo_async(job, sub))
+            started = True
+            return job.summary()
+        finally:
+            if not started:
+                if job.reservation is not None:
+                    self.risk.release(job.reservation)
+                await self._unsubscribe_quotes_async(contract.conId, job)
+
+    async def start_algo_async(self, symbol, algo="twap", qty=0, action="BUY", duration=300.0, slices=10,
+                               display_qty=None, price_mode="passive", limit_price=None,
+                               is_option=False, expiry=None, strike=None, right="C"):
+        if not await self.wait_ready_async(self.ready_timeout):
+            return {"error": "IBKR not connected yet"}
+
+        return await self._run(self._start_algo_async(
+            symbol.upper(), algo.lower(), qty, action.upper(), duration, slices, display_qty, price_mode.lower(),
+            limit_price, is_option, expiry, strike, right
+        ))
+
+    async def _vwap_weights_async(self, contract, duration, slices):
+        """
+        Веса срезов VWAP по минутным барам тех же минут прошлых дней.
+        None — истории нет, режем равномерно.
+        """
+        now = time.time()
+        try:
+            bars, _ = await self._get_history_async(contract.symbol, "1 min", start=now - VWAP_LOOKBACK_DAYS * 86400,
+                                                    end=now)
+        except Exception as e:
+            print(f"VWAP profile for {contract.symbol} unavailable: {e!r}")
+            return None
+        return vwap_weights(bars, now, duration, slices)
+
+    async def _run_algo_async(self, job, sub):
+        runner = AlgoRunner(job, self._algo_place_async, self._algo_cancel_async, lambda: sub.snapshot,
+                            self._publish_algo, self.ack_timeout)
+        try:
+            await runner.run()
+        finally:
+            for order_id in job.children:
+                self._algo_children.pop(order_id, None)
+            await self._unsubscribe_quotes_async(sub.contract.conId, job)
+            self._publish_algo(job)
+
+    async def _algo_place_async(self, job, order):
+        """
+        placeOrder дочернего ордера; с уже выданным orderId — перестановка.
+        """
+        await self._ready.wait()  # после обрыва — ждём переподключения
+        await self.scheduler.acquire(PRIORITY_ORDER)
+        if not order.orderId:
+            order.orderId = self.ib.client.getReqId()
+            self._algo_children[order.orderId] = job
+        return self.ib.placeOrder(job.contract, order)
+
+    async def _algo_cancel_async(self, order):
+        await self.scheduler.acquire(PRIORITY_ORDER)
+        self.ib.cancelOrder(order)
+
+    def _publish_algo(self, job):
+        if job.reservation is not None:
+            self.risk.hold(job.reservation, job.remaining if job.active else 0)
+        self.algo_events.publish({"type": "algo", **job.summary()})
+
+    async def _cancel_algo_async(self, job_id):
+        job = self.algo_jobs.get(job_id)
+        if job is None:
+            return None
+        if job.active and job.task is not None:
+            job.task.cancel()
+            await asyncio.wait({job.task}, timeout=self.ack_timeout + 1)
+        return job.summary()
+
+    async def cancel_algo_async(self, job_id):
+        """
+        Останавливает задачу и снимает её дочерний ордер. None — задачи нет.
+        """
+        if not self.loop:
+            return None
+        return await self._run(self._cancel_algo_async(job_id))
+
+    async def _algo_orders_async(self, active=None):
+        return [j.summary() for j in self.algo_jobs.values() if active is None or j.active == active]
+
+    async def get_algo_orders_async(self, active=None):
+        if not self.loop:
+            return []
+        return await self._run(self._algo_orders_async(active))
+
+    async def _subscribe_algo_events_async(self, deliver):
+        # снимок и подписка в одном шаге loop — ни одно обновление не теряется
+        snapshot = [j.summary() for j in self.algo_jobs.values()]
+        self.algo_events.subscribe(deliver)
+        return snapshot
+
+    async def stream_algo_orders(self, job_id=None):
+        """
+        async-генератор: {"type": "snapshot", "jobs": [...]}, затем
+        {"type": "algo", ...} на каждое изменение задачи (дочерний ордер,
+        исполнение, статус) — прогресс и проскальзывание.
+        """
+        if not self.loop:
+            return
+
+        queue = asyncio.Queue()
+        deliver = loop_queue_deliver(asyncio.get_running_loop(), queue)
+        snapshot = await self._run(self._subscribe_algo_events_async(deliver))
+        try:
+            yield {"type": "snapshot", "jobs": [j for j in snapshot if job_id is None or j["id"] == job_id]}
+            while True:
+                event = await queue.get()
+                if job_id is None or event["id"] == job_id:
+                    yield event
+        finally:
+            self.algo_events.unsubscribe(deliver)
+
+    # ------------------ ИСТОРИЧЕСКИЕ БАРЫ ------------------
+
+    def _on_error(self, req_id, code, message, contract):
+        self._request_errors[req_id] = (code, message)
+        if len(self._request_errors) > 256:
+            self._request_errors.popitem(last=False)
+        # котировки не будет — ожидание первой котировки не ждёт дедлайна
+        if code in NO_QUOTE_CODES and contract is not None and contract.conId in self._quote_waiters:
+            self._quote_errors[contract.conId] = f"{code}: {message}"
+            for done in self._quote_waiters[contract.conId]:
+                if not done.done():
+                    done.set_result(False)
+
+    async def _fetch_bars_async(self, contract, bar_size, start, end, what_to_show, use_rth):
+        """
+        Один запрос reqHistoricalData на [start, end). None — TWS отказал
+        (пейсинг, таймаут соединения), диапазон не считается покрытым.
+        """
+        await self._history_pacer.acquire(contract.conId)
+        async with self._pacing:
+            await self.scheduler.acquire(PRIORITY_REFERENCE)
+            bars = await self._tws("reqHistoricalData", self.ib.reqHistoricalDataAsync(
+                contract, endDateTime=datetime.datetime.fromtimestamp(end, datetime.timezone.utc),
+                durationStr=duration_str(end - start), barSizeSetting=bar_size,
+                whatToShow=what_to_show, useRTH=use_rth, formatDate=2
+            ))
+
+        error = self._request_errors.pop(getattr(bars, "reqId", None), None)
+        if error is not None and not any(m in error[1].lower() for m in NO_DATA_MARKERS):
+            print(f"History {contract.symbol} {bar_size} [{start}, {end}) failed: {error[0]} {error[1]}")
+            return None
+
+        array = bars_to_array(bars) if bars else np.empty(0, dtype=BAR_DTYPE)
+        return array[(array["time"] >= start) & (array["time"] < end)]
+
+    async def _get_history_async(self, symbol, bar_size="1 min", start=None, end=None,
+                                 what_to_show="TRADES", use_rth=True):
+        """
+        Бары из кэша на диске; в TWS уходят только непокрытые куски,
+        параллельно, в пределах лимитов на исторические данные.
+        Возвращает (массив BAR_DTYPE — view на memmap, сводку запроса).
+        """
+        if bar_size not in BAR_SIZES:
+            raise ValueError(f"Unknown bar size {bar_size!r}, expected one of {list(BAR_SIZES)}")
+        bar_seconds, chunk = BAR_SIZES[bar_size]
+
+        contract = await self._qualify_async(self._underlying_contract(symbol))
+        if contract is None:
+            raise ValueError(f"Contract {symbol} not found")
+
+        # незакрытый текущий бар не кэшируем
+        now = int(time.time()) // bar_seconds * bar_seconds
+        end = min(int(end) if end is not None else now, now)
+        start = int(start) if start is not None else end - bar_seconds * 1000
+        key = BarStore.key(contract, bar_size, what_to_show, use_rth)
+
+        lock = self._history_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            chunks = [c for a, b in self.history.missing(key, start, end) for c in split_range(a, b, chunk)]
+            fetched = 0
+            if chunks:
+                results = await asyncio.gather(*(
+                    self._fetch_bars_async(contract, bar_size, a, b, what_to_show, use_rth) for a, b in chunks
+                ))
+                covered = [c for c, r in zip(chunks, results) if r is not None]
+                if covered:
+                    bars = np.concatenate([r for r in results if r is not None])
+                    fetched = len(bars)
+                    await asyncio.get_running_loop().run_in_executor(None, self.history.write, key, bars, covered)
+
+        return self.history.read(key, start, end), {
+            "symbol": contract.symbol,
+            "conId": contract.conId,
+            "barSize": bar_size,
+            "start": start,
+            "end": end,
+            "requests": len(chunks),
+            "fetchedBars": fetched,
+        }
+
+    async def get_history_async(self, symbol, bar_size="1 min", start=None, end=None,
+                                what_to_show="TRADES", use_rth=True):
+        """
+        OHLCV бары [start, end) (секунды UTC). Массив — read-only view на
+        файл кэша, без копирования.
+        """
+        symbol = symbol.upper()
+        reader = await self._ready_reader()
+        if reader is None:
+            return None, {"error": "IBKR not connected yet"}
+
+        return await reader._run(reader._get_history_async(symbol, bar_size, start, end, what_to_show, use_rth))
+
+    def history_stats(self):
+        return self.history.stats()
+
+    # ------------------ ЖУРНАЛ И REPLAY ------------------
+
+    def journal_stats(self):
+        return {
+            "recording": self.journal.stats() if self.journal is not None else None,
+            "files": [os.path.basename(p) for p in journal_files(self.journal_dir)] if self.journal_dir else [],
+            "replay": self._replay_status(),
+        }
+
+    def _replay_status(self):
+        if self._replay is None:
+            return None
+        task = self._replay["task"]
+        status = {k: v for k, v in self._replay.items() if k not in ("task", "session")}
+        status["running"] = not task.done()
+        status["orders"] = len(self._replay["session"].orders)
+        if task.done() and not task.cancelled() and task.exception() is not None:
+            status["error"] = repr(task.exception())
+        return status
+
+    async def _start_replay_async(self, day, speed, start, end, kinds):
+        if self.connected:
+            return {"error": "Replay is not allowed while connected to TWS: run it on a disconnected worker"}
+        if self._replay is not None and not self._replay["task"].done():
+            return {"error": "Replay already running"}
+        files = journal_files(self.journal_dir) if self.journal_dir else []
+        if day is not None:
+            files = [p for p in files if os.path.basename(p) == f"{day}.bin"]
+        if not files:
+            return {"error": f"No journal for {day or 'any day'}"}
+        reader = JournalReader(files[-1])
+
+        state = {"file": os.path.basename(reader.path), "speed": speed, "done": 0, "total": len(reader),
+                 "startedAt": time.time()}
+
+        def progress(done, total):
+            state["done"], state["total"] = done, total
+
+        # своя песочница: живые котировки, ордера и риск replay не трогает
+        session = ReplaySession()
+        state["session"] = session
+        state["task"] = asyncio.create_task(replay(
+            reader, session.on_quote, session.on_trade, speed, start, end, kinds, progress,
+        ))
+        self._replay = state
+        return self._replay_status()
+
+    async def start_replay_async(self, day=None, speed=1.0, start=None, end=None, kinds=None):
+        """
+        Прогоняет журнал дня (YYYYMMDD, по умолчанию последний) в отдельную
+        ReplaySession — события читаются через stream_replay, помечены
+        replay. Только без подключения к TWS: воркер, который торгует,
+        replay не запускает. speed — ускорение, 0/None — без пауз.
+        """
+        if not self.loop:
+            return {"error": "IBKR not connected yet"}
+        return await self._run(self._start_replay_async(day, speed, start, end, kinds))
+
+    async def _stop_replay_async(self):
+        if self._replay is not None:
+            self._replay["task"].cancel()
+            await asyncio.sleep(0)
+        return self._replay_status()
+
+    async def stop_replay_async(self):
+        if not self.loop:
+            return None
+        return await self._run(self._stop_replay_async())
+
+    async def _subscribe_replay_async(self, deliver):
+        # снимок и подписка в одном шаге loop — ни одно событие не теряется
+        if self._replay is None:
+            return None
+        session = self._replay["session"]
+        session.events.subscribe(deliver)
+        return session, session.snapshot()
+
+    async def stream_replay(self):
+        """
+        async-генератор текущего replay: снимок песочницы (ордера и
+        котировки), затем события котировок и ордеров с "replay": True.
+        """
+        if not self.loop:
+            return
+
+        queue = asyncio.Queue()
+        deliver = loop_queue_deliver(asyncio.get_running_loop(), queue)
+        subscribed = await self._run(self._subscribe_replay_async(deliver))
+        if subscribed is None:
+            return
+        session, snapshot = subscribed
+        try:
+            yield snapshot
+            while True:
+                yield await queue.get()
+        finally:
+            session.events.unsubscribe(deliver)
+
+    # ------------------ СЧЕТА И ПОРТФЕЛЬ ------------------
+
+    def _bind_account_events(self):
+        self.ib.accountValueEvent += self.account.on_account_value
+        self.ib.positionEvent += self._on_position_event
+        self.ib.updatePortfolioEvent += self._on_portfolio_event
+        self.ib.pnlEvent += self.account.on_pnl
+        self.ib.pnlSingleEvent += self.account.on_pnl_single
+
+    def _on_position_event(self, position):
+        self.account.on_position(position)
+        self._track_pnl_single(position.account, position.contract.conId, position.position)
+
+    def _on_portfolio_event(self, item):
+        self.account.on_portfolio(item)
+        self._track_pnl_single(item.account, item.contract.conId, item.position)
+
+    def _track_pnl_single(self, account, con_id, qty):
+        """
+        Подписка PnL на каждую открытую позицию, отписка при закрытии.
+        До готовности подключения ничего не делает — после connectAsync
+        подписки открывает _subscribe_pnl_async по всем позициям сразу.
+        """
+        if not self.account_pnl or not self.connected:
+            return
+        key = (account, con_id)
+        if qty and key not in self._pnl_single_requests:
+            self._pnl_single_requests.add(key)
+            asyncio.ensure_future(self._req_pnl_single_async(account, con_id))
+        elif not qty and key in self._pnl_single_requests:
+            self._pnl_single_requests.discard(key)
+            asyncio.ensure_future(self._cancel_pnl_single_async(account, con_id))
+
+    async def _req_pnl_single_async(self, account, con_id):
+        await self.scheduler.acquire(PRIORITY_REFERENCE)
+        if (account, con_id) in self._pnl_single_requests:
+            self.ib.reqPnLSingle(account, '', con_id)
+
+    async def _cancel_pnl_single_async(self, account, con_id):
+        await self.scheduler.acquire(PRIORITY_REFERENCE)
+        if (account, con_id) not in self._pnl_single_requests:
+            self.ib.cancelPnLSingle(account, '', con_id)
+
+    async def _subscribe_pnl_async(self):
+        """
+        После каждого подключения: ib_insync сбрасывает подписки PnL
+        при обрыве, поэтому открываем их заново.
+        """
+        self._pnl_single_requests.clear()
+        if not self.account_pnl:
+            return
+        accounts = self.ib.managedAccounts()
+        await self.scheduler.acquire(PRIORITY_REFERENCE, len(accounts))
+        for account in accounts:
+            self.ib.reqPnL(account)
+        for account, con_id in self.account.position_keys():
+            self._track_pnl_single(account, con_id, 1)
+
+    def default_account(self):
         # managedAccounts() — синхронный метод, не await
-        account = self.ib.managedAccounts()[0]
+        accounts = self.ib.managedAccounts()
+        return accounts[0] if accounts else None
+
+    async def _query_account_async(self, kind, account=None):
+        if kind == "accounts":
+            return self.account.accounts() or self.ib.managedAccounts()
+        if kind == "summary":
+            account = account or self.default_account()
+            return {"account": account, "values": self.account.summary(account), "pnl": self.account.pnl(account)}
+        if kind == "positions":
+            return self.account.positions(account)
+        if kind == "pnl":
+            return self.account.pnl(account)
+        raise ValueError(f"Unknown account query {kind!r}")
+
+    async def get_account_async(self, kind, account=None):
+        """
+        Счета, сводка, позиции и PnL из локальной модели, без запросов в TWS.
+        kind: accounts | summary | positions | pnl.
+        Счета и позиции приходят в каждое подключение — их отдаёт читатель;
+        сводка и PnL — из основного, подписки PnL открыты только в нём.
+        """
+        if kind in ("accounts", "positions"):
+            reader = await self._ready_reader()
+            if reader is None:
+                return None
+            return await reader._run(reader._query_account_async(kind, account))
+        if not self.loop:
+            return None
+        return await self._run(self._query_account_async(kind, account))
+
+    async def _get_net_liquidation_async(self, account=None):
+        account = account or self.default_account()
+        value = self.account.value(account, "NetLiquidation")
+        if value is not None:
+            return value
 
-        summary = await self.ib.accountSummaryAsync(account)
+        # модель ещё не заполнена (или счёт не подписан) — разовый запрос
+        await self.scheduler.acquire(PRIORITY_REFERENCE)
+        summary = await self._tws("accountSummary", self.ib.accountSummaryAsync(account))
 
         for item in summary:
             if item.tag == "NetLiquidation":
@@ -225,14 +1912,19 @@ class IBWorker:
                     return None
         return None
 
-    def get_net_liquidation(self):
+    def get_net_liquidation(self, account=None):
         """
         Возвращает Net Liquidation Value (ликвидную стоимость портфеля)
         """
-        if not self.connected or not self.loop:
+        reader = self._reader()
+        if reader is None:
             return None
 
-        future = asyncio.run_coroutine_threadsafe(
-            self._get_net_liquidation_async(), self.loop
-        )
-        return future.result()
+        return reader._submit(reader._get_net_liquidation_async(account)).result()
+
+    async def get_net_liquidation_async(self, account=None):
+        reader = await self._ready_reader()
+        if reader is None:
+            return None
+
+        return await reader._run(reader._get_net_liquidation_async(account))